@@ -1,10 +1,19 @@
 """Xenos Plugin for ToWow - Main Application"""
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic_settings import BaseSettings
 from dotenv import load_dotenv
 
 from .routers import health, xenos, towwow
+from .xenos.client import init_http_clients, close_http_clients
+from .xenos.cache import close_cache
+from .xenos.resilience import configure_upstream_guard
+from .xenos.store import configure_trace_store, close_trace_store
+from .xenos.ingest import start_ingest_queue, stop_ingest_queue
+from .xenos.sync import start_sync_worker, stop_sync_worker
+from .xenos.trace import flush_trace_batch, push_local_traces
 
 load_dotenv()
 
@@ -15,6 +24,37 @@ class Settings(BaseSettings):
     webhook_secret: str = "dev-secret"
     log_level: str = "INFO"
 
+    # 上游 Xenos API 连接池
+    xenos_http_max_connections: int = 100
+    xenos_http_max_keepalive: int = 20
+    xenos_http_keepalive_expiry: float = 30.0
+    xenos_http_timeout: float = 5.0
+    xenos_http2: bool = True
+
+    # 上游熔断与舱壁
+    xenos_breaker_failure_threshold: int = 5
+    xenos_breaker_recovery_timeout: float = 30.0
+    xenos_breaker_half_open_calls: int = 1
+    xenos_max_inflight: int = 50
+
+    # Trace 写入队列
+    trace_queue_enabled: bool = True
+    trace_queue_batch_size: int = 100
+    trace_queue_flush_interval: float = 1.0
+    trace_queue_max_pending: int = 10000
+
+    # 本地 trace 存储
+    trace_store: str = "memory"
+    trace_store_path: str = "./data/traces.db"
+    trace_store_max_per_agent: int = 1000
+
+    # 本地 trace 补推上游
+    trace_sync_enabled: bool = True
+    trace_sync_batch_size: int = 100
+    trace_sync_interval: float = 5.0
+    trace_sync_max_backoff: float = 300.0
+    trace_sync_claim_lease: float = 60.0
+
     model_config = {
         "env_file": ".env",
         "env_file_encoding": "utf-8",
@@ -25,6 +65,52 @@ class Settings(BaseSettings):
 settings = Settings()
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：创建共享上游连接池、本地存储、trace 写入队列和补推任务，关闭时先停任务、刷新队列，再释放连接池、缓存连接和存储"""
+    configure_upstream_guard(
+        failure_threshold=settings.xenos_breaker_failure_threshold,
+        recovery_timeout=settings.xenos_breaker_recovery_timeout,
+        half_open_max_calls=settings.xenos_breaker_half_open_calls,
+        max_concurrent=settings.xenos_max_inflight
+    )
+    init_http_clients(
+        max_connections=settings.xenos_http_max_connections,
+        max_keepalive_connections=settings.xenos_http_max_keepalive,
+        keepalive_expiry=settings.xenos_http_keepalive_expiry,
+        timeout=settings.xenos_http_timeout,
+        http2=settings.xenos_http2
+    )
+    configure_trace_store(
+        backend=settings.trace_store,
+        path=settings.trace_store_path,
+        max_per_agent=settings.trace_store_max_per_agent
+    )
+    if settings.trace_queue_enabled:
+        await start_ingest_queue(
+            flush_trace_batch,
+            batch_size=settings.trace_queue_batch_size,
+            flush_interval=settings.trace_queue_flush_interval,
+            max_pending=settings.trace_queue_max_pending
+        )
+    if settings.trace_sync_enabled:
+        await start_sync_worker(
+            push_local_traces,
+            batch_size=settings.trace_sync_batch_size,
+            interval=settings.trace_sync_interval,
+            max_backoff=settings.trace_sync_max_backoff,
+            claim_lease=settings.trace_sync_claim_lease
+        )
+    try:
+        yield
+    finally:
+        await stop_sync_worker()
+        await stop_ingest_queue()
+        await close_http_clients()
+        await close_cache()
+        close_trace_store()
+
+
 def create_app():
     """创建 FastAPI 应用"""
     app = FastAPI(
@@ -32,7 +118,8 @@ def create_app():
         description="为 ToWow Agent 提供 Xenos 身份和信誉记录",
         version="0.1.0",
         docs_url="/docs",
-        redoc_url="/redoc"
+        redoc_url="/redoc",
+        lifespan=lifespan
     )
 
     # 添加 CORS 中间件
@@ -0,0 +1,46 @@
+"""
+条件请求（ETag / If-None-Match）
+
+ETag 由 Agent 的数据版本号（trace 写入完成并失效缓存后递增）和时间窗口组成：
+- 版本号不变时 ETag 稳定，客户端带 If-None-Match 轮询直接得到 304，服务端不计算也不序列化
+- 信誉衰减和上游写入的 traces 不经过本服务的版本号，ETag 每个时间窗口（与对应缓存的 TTL 一致）更换一次
+- 使用弱 ETag：同一版本内的响应语义等价，但不保证逐字节相同（如 timestamp 字段）
+"""
+
+import time
+from typing import Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+from ..xenos.cache import get_agent_version_async
+
+
+async def agent_etag(xenos_id: str, window: int) -> str:
+    """
+    生成 Agent 数据的弱 ETag
+
+    Args:
+        xenos_id: Xenos ID
+        window: 时间窗口（秒）
+    """
+    version = await get_agent_version_async(xenos_id)
+    return f'W/"{version:x}-{int(time.time() // window):x}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 是否与 ETag 匹配（弱比较）"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    """请求携带的 ETag 仍有效时返回 304 响应，否则返回 None"""
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return None
@@ -1,15 +1,52 @@
 """ToWow 路由 - Webhook 和 Agent 交互"""
 from fastapi import APIRouter, Request, HTTPException
-from pydantic import BaseModel
-from typing import Optional, Dict, Any, List
+from fastapi.responses import JSONResponse, Response
+from pydantic import BaseModel, Field
+from typing import Optional, Dict, Any, List, Awaitable, Callable, Sequence
+import asyncio
 import json
 
-from ..xenos.trace import record_trace, get_agent_traces, query_traces
-from ..xenos.identity import generate_xenos_id
-from ..xenos.reputation import calculate_agent_reputation
+from ..xenos.trace import (
+    record_trace_async,
+    get_agent_traces_async,
+    query_traces_async,
+    query_fetched_traces,
+    fetch_upstream_traces_async
+)
+from ..xenos.identity import generate_xenos_id_async
+from ..xenos.reputation import (
+    BATCH_CONCURRENCY,
+    REPUTATION_TRACE_LIMIT,
+    calculate_agent_reputation_async,
+    calculate_agents_reputation_async,
+    get_reputation_service,
+    reputation_cache_key
+)
+from ..xenos.cache import (
+    agent_version_token_async,
+    get_many_cached_async,
+    refresh_cached_async,
+    get_cached_response_async,
+    set_cached_response_async,
+    reputation_response_key,
+    agent_tag,
+    CACHE_TTL,
+    CACHE_STALE_TTL
+)
+from .conditional import agent_etag, not_modified
 
 towwow_router = APIRouter()
 
+# 批量信誉查询单次最多的 Agent 数
+REPUTATION_BATCH_MAX = 100
+
+# 批量意图注入单次最多的意图数
+INTENT_ENRICH_BATCH_MAX = 100
+
+# 意图注入附带的最近行为记录数（查询 10 条，返回前 5 条）
+RECENT_ACTIVITY_QUERY_LIMIT = 10
+RECENT_ACTIVITY_LIMIT = 5
+
 
 # ==================== 请求/响应模型 ====================
 
@@ -35,6 +72,15 @@ class IntentEnrichRequest(BaseModel):
     context: Optional[str] = "negotiation"
 
 
+class IntentEnrichBatchRequest(BaseModel):
+    items: List[IntentEnrichRequest] = Field(..., min_length=1, max_length=INTENT_ENRICH_BATCH_MAX)
+
+
+class ReputationBatchRequest(BaseModel):
+    xenosIds: List[str] = Field(..., min_length=1, max_length=REPUTATION_BATCH_MAX)
+    context: Optional[str] = None
+
+
 class TraceRecordRequest(BaseModel):
     agentXenosId: str
     eventType: str
@@ -104,7 +150,7 @@ async def handle_toww_webhook(request: Request):
                 **data.get("metadata", {})
             }
 
-            result = record_trace(
+            result = await record_trace_async(
                 xenos_id=xenos_id,
                 network="towow",
                 context=trace_context,
@@ -172,7 +218,7 @@ async def register_agent(request: AgentRegisterRequest):
     这个端点让 ToWow 网络中的 Agent 自动获得 Xenos 身份
     """
     try:
-        result = generate_xenos_id(request.agentName)
+        result = await generate_xenos_id_async(request.agentName)
 
         # 如果提供了额外能力信息，记录为初始 metadata
         if request.capabilities or request.metadata:
@@ -200,14 +246,12 @@ async def register_agent(request: AgentRegisterRequest):
 async def get_agent_info(xenos_id: str):
     """获取 ToWow Agent 的 Xenos 信息"""
     try:
-        # 获取 Agent 的 Xenos 信息
-        result = generate_xenos_id("", xenos_id)
-
-        # 获取 Agent 的信誉
-        reputation = calculate_agent_reputation(xenos_id)
-
-        # 获取最近的行为记录
-        traces = get_agent_traces(xenos_id, limit=10)
+        # 并发获取 Agent 的 Xenos 信息、信誉和最近的行为记录
+        result, reputation, traces = await asyncio.gather(
+            generate_xenos_id_async("", xenos_id),
+            calculate_agent_reputation_async(xenos_id),
+            get_agent_traces_async(xenos_id, limit=10)
+        )
 
         return {
             "code": 0,
@@ -233,16 +277,16 @@ async def enrich_intent(request: IntentEnrichRequest):
     """
     try:
         # 获取 Agent 的场景化信誉
-        reputation = calculate_agent_reputation(
+        reputation = await calculate_agent_reputation_async(
             request.agentXenosId,
             context=request.context
         )
 
         # 获取最近的相关行为记录
-        traces_result = query_traces(
+        traces_result = await query_traces_async(
             xenos_id=request.agentXenosId,
             context=request.context,
-            limit=10
+            limit=RECENT_ACTIVITY_QUERY_LIMIT
         )
 
         # 构建增强后的意图
@@ -251,7 +295,7 @@ async def enrich_intent(request: IntentEnrichRequest):
             "xenos": {
                 "xenosId": request.agentXenosId,
                 "reputation": reputation,
-                "recentActivity": traces_result.get("traces", [])[:5],
+                "recentActivity": traces_result.get("traces", [])[:RECENT_ACTIVITY_LIMIT],
                 "network": "towow"
             }
         }
@@ -268,6 +312,133 @@ async def enrich_intent(request: IntentEnrichRequest):
         return {"code": 1, "error": str(e)}
 
 
+def _enriched_intent(
+    xenos_id: str,
+    intent: Dict[str, Any],
+    reputation: Dict[str, Any],
+    recent_activity: List[Dict[str, Any]]
+) -> Dict[str, Any]:
+    """构造单条意图注入结果"""
+    return {
+        "originalIntent": intent,
+        "enrichedIntent": {
+            **intent,
+            "xenos": {
+                "xenosId": xenos_id,
+                "reputation": reputation,
+                "recentActivity": recent_activity,
+                "network": "towow"
+            }
+        },
+        "enrichmentApplied": True
+    }
+
+
+async def _enrich_agent_intents(
+    xenos_id: str,
+    items: List[tuple],
+    semaphore: asyncio.Semaphore
+) -> List[Dict[str, Any]]:
+    """
+    注入同一 Agent 的一组意图：信誉和最近行为记录共用一次上游 traces 拉取
+
+    Args:
+        xenos_id: Xenos ID
+        items: [(意图, 上下文, 缓存的信誉或 None)]
+        semaphore: 批量请求共享的并发上限
+
+    Returns:
+        与 items 一一对应的注入结果
+    """
+    try:
+        # 全部信誉命中缓存时只需拉取最近行为记录所需的数量（同 query_traces_async）
+        missing = list(dict.fromkeys(context for _, context, cached in items if cached is None))
+        limit = REPUTATION_TRACE_LIMIT if missing else RECENT_ACTIVITY_QUERY_LIMIT * 10
+
+        # 版本号在拉取之前读取：拉取期间有 trace 写入时，按旧数据算出的信誉不写回
+        version = await agent_version_token_async(xenos_id) if missing else None
+        async with semaphore:
+            upstream = await fetch_upstream_traces_async(xenos_id, limit)
+
+        service = get_reputation_service()
+
+        async def score(context: Optional[str]) -> Dict[str, Any]:
+            return service.score_upstream(xenos_id, upstream, context)
+
+        # 未命中的信誉经请求合并写回，与单个/批量信誉查询中同一键的计算共用一次
+        scored = dict(zip(missing, await asyncio.gather(*(
+            refresh_cached_async(
+                reputation_cache_key(xenos_id, context),
+                lambda context=context: score(context),
+                CACHE_TTL["reputation"],
+                CACHE_STALE_TTL["reputation"],
+                tags=[agent_tag(xenos_id)],
+                agent=xenos_id,
+                since=version
+            )
+            for context in missing
+        ))))
+
+        results = []
+        for intent, context, reputation in items:
+            traces_result = query_fetched_traces(
+                xenos_id, upstream, context=context, limit=RECENT_ACTIVITY_QUERY_LIMIT
+            )
+            recent_activity = traces_result.get("traces", [])[:RECENT_ACTIVITY_LIMIT]
+            results.append(_enriched_intent(
+                xenos_id, intent, reputation if reputation is not None else scored[context], recent_activity
+            ))
+        return results
+
+    except Exception as e:
+        return [
+            {"originalIntent": intent, "enrichedIntent": intent, "enrichmentApplied": False, "error": str(e)}
+            for intent, _, _ in items
+        ]
+
+
+@towwow_router.post("/intent/enrich/batch")
+async def enrich_intent_batch(request: IntentEnrichBatchRequest):
+    """批量意图注入 - 发现层一次注入整个候选集
+
+    缓存的信誉一次 multi-get 读出；每个 Agent 只拉取一次上游 traces，
+    同时用于信誉计算和最近行为记录；各 Agent 并发处理（并发数受限），结果按请求顺序返回
+    """
+    try:
+        keys = [reputation_cache_key(item.agentXenosId, item.context) for item in request.items]
+        cached = await get_many_cached_async(keys)
+
+        # 按 Agent 分组，记录每条意图在请求中的位置
+        groups: Dict[str, List[int]] = {}
+        for index, item in enumerate(request.items):
+            groups.setdefault(item.agentXenosId, []).append(index)
+
+        semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+        grouped = await asyncio.gather(*(
+            _enrich_agent_intents(
+                xenos_id,
+                [(request.items[i].intent, request.items[i].context, cached[i] or None) for i in indexes],
+                semaphore
+            )
+            for xenos_id, indexes in groups.items()
+        ))
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(request.items)
+        for indexes, enriched in zip(groups.values(), grouped):
+            for index, result in zip(indexes, enriched):
+                results[index] = result
+
+        return {
+            "code": 0,
+            "data": {
+                "count": len(results),
+                "results": results
+            }
+        }
+    except Exception as e:
+        return {"code": 1, "error": str(e)}
+
+
 # ==================== 痕迹记录端点 ====================
 
 @towwow_router.post("/trace/record")
@@ -277,7 +448,7 @@ async def record_towwow_trace(request: TraceRecordRequest):
     这个端点让 ToWow 可以直接记录协商过程中的行为
     """
     try:
-        result = record_trace(
+        result = await record_trace_async(
             xenos_id=request.agentXenosId,
             network="towow",
             context=request.context,
@@ -300,16 +471,28 @@ async def record_towwow_trace(request: TraceRecordRequest):
 
 
 @towwow_router.get("/trace/{xenos_id}")
-async def get_towwow_traces(xenos_id: str, limit: int = 50, context: Optional[str] = None):
+async def get_towwow_traces(
+    xenos_id: str,
+    request: Request,
+    response: Response,
+    limit: int = 50,
+    context: Optional[str] = None
+):
     """获取 Agent 在 ToWow 中的行为记录"""
     try:
-        result = query_traces(
+        etag = await agent_etag(xenos_id, CACHE_TTL["traces"])
+        unchanged = not_modified(request, etag)
+        if unchanged is not None:
+            return unchanged
+
+        result = await query_traces_async(
             xenos_id=xenos_id,
             network="towow",
             context=context,
             limit=limit
         )
 
+        response.headers["ETag"] = etag
         return {
             "code": 0,
             "data": result
@@ -320,72 +503,140 @@ async def get_towwow_traces(xenos_id: str, limit: int = 50, context: Optional[st
 
 # ==================== 信誉查询端点 ====================
 
-@towwow_router.get("/reputation/{xenos_id}")
-async def get_towwow_reputation(xenos_id: str, context: Optional[str] = None):
-    """查询 Agent 在 ToWow 场景的信誉
+async def _cached_json_response(
+    key: str,
+    etag: str,
+    tags: Sequence[str],
+    render: Callable[[], Awaitable[Dict[str, Any]]]
+) -> Response:
+    """
+    返回缓存的响应体（带 ETag）
 
-    这个端点专门用于查询 ToWow 相关的信誉
+    命中且 ETag 与当前版本一致时直接返回缓存的字节，不再解码信誉、组装字典和重新序列化；
+    未命中或版本已变化时调用 render 生成响应内容，编码后写入缓存
     """
-    try:
-        reputation = calculate_agent_reputation(xenos_id, context)
+    cached = await get_cached_response_async(key)
+    if cached is None or cached.etag != etag:
+        body = JSONResponse(await render()).body
+        cached = await set_cached_response_async(key, body, "application/json", CACHE_TTL["response"], etag, tags)
 
-        # 如果指定了上下文，返回该上下文的信誉
-        if context:
-            return {
-                "code": 0,
-                "data": {
-                    "xenosId": xenos_id,
-                    "network": "towow",
-                    "context": context,
-                    **reputation
-                }
-            }
+    return Response(cached.body, media_type=cached.media_type, headers={"ETag": cached.etag})
+
+
+async def _render_reputation(xenos_id: str, context: Optional[str]) -> Dict[str, Any]:
+    reputation = await calculate_agent_reputation_async(xenos_id, context)
 
-        # 返回综合信誉
+    # 如果指定了上下文，返回该上下文的信誉
+    if context:
         return {
             "code": 0,
             "data": {
                 "xenosId": xenos_id,
                 "network": "towow",
+                "context": context,
                 **reputation
             }
         }
+
+    # 返回综合信誉
+    return {
+        "code": 0,
+        "data": {
+            "xenosId": xenos_id,
+            "network": "towow",
+            **reputation
+        }
+    }
+
+
+@towwow_router.get("/reputation/{xenos_id}")
+async def get_towwow_reputation(xenos_id: str, request: Request, context: Optional[str] = None):
+    """查询 Agent 在 ToWow 场景的信誉
+
+    这个端点专门用于查询 ToWow 相关的信誉
+    """
+    try:
+        etag = await agent_etag(xenos_id, CACHE_TTL["reputation"])
+        return not_modified(request, etag) or await _cached_json_response(
+            reputation_response_key(xenos_id, context),
+            etag,
+            [agent_tag(xenos_id)],
+            lambda: _render_reputation(xenos_id, context)
+        )
     except Exception as e:
         return {"code": 1, "error": str(e)}
 
 
-@towwow_router.get("/reputation/{xenos_id}/summary")
-async def get_reputation_summary(xenos_id: str):
-    """获取 Agent 信誉摘要（简化版）"""
-    try:
-        reputation = calculate_agent_reputation(xenos_id)
+@towwow_router.post("/reputation/batch")
+async def get_towwow_reputation_batch(request: ReputationBatchRequest):
+    """批量查询多个 Agent 在 ToWow 场景的信誉
 
-        # 提取关键信息
-        summary = {
-            "xenosId": xenos_id,
-            "overallScore": reputation.get("overallScore", 500),
-            "hasFraud": reputation.get("hasFraud", False),
-            "fulfillmentRate": reputation.get("details", {}).get("fulfillmentRate", 0.5),
-            "confidence": "medium",
-            "network": "towow",
-            "contextSummary": {}
-        }
+    需求匹配阶段一次查询所有候选 Agent：缓存命中部分一次读出，
+    未命中的 Agent 并发拉取上游 traces，所有结果在一个响应中返回
+    """
+    try:
+        reputations = await calculate_agents_reputation_async(request.xenosIds, request.context)
 
-        # 提取各上下文的摘要
-        for ctx in reputation.get("contexts", []):
-            summary["contextSummary"][ctx["context"]] = {
-                "score": ctx["score"],
-                "fulfillmentRate": ctx["fulfillmentRate"]
-            }
+        results = []
+        for xenos_id, reputation in reputations.items():
+            item = {"xenosId": xenos_id, "network": "towow"}
+            if request.context:
+                item["context"] = request.context
+            results.append({**item, **reputation})
 
         return {
             "code": 0,
-            "data": summary
+            "data": {
+                "count": len(results),
+                "results": results
+            }
         }
     except Exception as e:
         return {"code": 1, "error": str(e)}
 
 
+async def _render_reputation_summary(xenos_id: str) -> Dict[str, Any]:
+    reputation = await calculate_agent_reputation_async(xenos_id)
+
+    # 提取关键信息
+    summary = {
+        "xenosId": xenos_id,
+        "overallScore": reputation.get("overallScore", 500),
+        "hasFraud": reputation.get("hasFraud", False),
+        "fulfillmentRate": reputation.get("details", {}).get("fulfillmentRate", 0.5),
+        "confidence": "medium",
+        "network": "towow",
+        "contextSummary": {}
+    }
+
+    # 提取各上下文的摘要
+    for ctx in reputation.get("contexts", []):
+        summary["contextSummary"][ctx["context"]] = {
+            "score": ctx["score"],
+            "fulfillmentRate": ctx["fulfillmentRate"]
+        }
+
+    return {
+        "code": 0,
+        "data": summary
+    }
+
+
+@towwow_router.get("/reputation/{xenos_id}/summary")
+async def get_reputation_summary(xenos_id: str, request: Request):
+    """获取 Agent 信誉摘要（简化版）"""
+    try:
+        etag = await agent_etag(xenos_id, CACHE_TTL["reputation"])
+        return not_modified(request, etag) or await _cached_json_response(
+            reputation_response_key(xenos_id, view="summary"),
+            etag,
+            [agent_tag(xenos_id)],
+            lambda: _render_reputation_summary(xenos_id)
+        )
+    except Exception as e:
+        return {"code": 1, "error": str(e)}
+
+
 # ==================== Demo 端点 ====================
 
 @towwow_router.get("/demo")
@@ -439,7 +690,7 @@ async def mock_sync_traces():
         timestamp = (now - timedelta(days=days_ago)).isoformat()
 
         for _ in range(5):  # 每个时间段生成5条
-            record_trace(
+            await record_trace_async(
                 xenos_id=xenos_id,
                 network="towow",
                 context="negotiation" if "demand" in action or "proposal" in action else "task_execution",
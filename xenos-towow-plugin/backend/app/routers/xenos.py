@@ -1,10 +1,13 @@
 """Xenos 路由 - 身份管理和信誉查询"""
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request, Response
 from pydantic import BaseModel
 from typing import Optional
 
-from ..xenos.identity import generate_xenos_id, get_agent_reputation
-from ..xenos.trace import record_trace, get_agent_traces
+from ..xenos.identity import generate_xenos_id_async, get_agent_reputation_async
+from ..xenos.trace import record_trace_async, get_agent_traces_async
+from ..xenos.sync import get_sync_status
+from ..xenos.cache import CACHE_TTL
+from .conditional import agent_etag, not_modified
 
 xenos_router = APIRouter()
 
@@ -26,7 +29,7 @@ class TraceRequest(BaseModel):
 async def register_agent(request: RegisterRequest):
     """Agent 注册到 Xenos，生成 Xenos ID"""
     try:
-        result = generate_xenos_id(request.agentName)
+        result = await generate_xenos_id_async(request.agentName)
         return {
             "code": 0,
             "data": {
@@ -44,7 +47,7 @@ async def register_agent(request: RegisterRequest):
 async def get_agent(xenos_id: str):
     """获取 Agent 信息"""
     try:
-        result = generate_xenos_id("", xenos_id)
+        result = await generate_xenos_id_async("", xenos_id)
         return {
             "code": 0,
             "data": {
@@ -60,7 +63,7 @@ async def get_agent(xenos_id: str):
 async def trace_action(request: TraceRequest):
     """记录行为到 Xenos"""
     try:
-        result = record_trace(
+        result = await record_trace_async(
             xenos_id=request.xenosId,
             network="towow",
             context=request.context,
@@ -77,10 +80,16 @@ async def trace_action(request: TraceRequest):
 
 
 @xenos_router.get("/reputation/{xenos_id}")
-async def get_reputation(xenos_id: str, context: Optional[str] = None):
+async def get_reputation(xenos_id: str, request: Request, response: Response, context: Optional[str] = None):
     """获取场景化信誉"""
     try:
-        result = get_agent_reputation(xenos_id, context)
+        etag = await agent_etag(xenos_id, CACHE_TTL["reputation"])
+        unchanged = not_modified(request, etag)
+        if unchanged is not None:
+            return unchanged
+
+        result = await get_agent_reputation_async(xenos_id, context)
+        response.headers["ETag"] = etag
         return {
             "code": 0,
             "data": result
@@ -90,13 +99,31 @@ async def get_reputation(xenos_id: str, context: Optional[str] = None):
 
 
 @xenos_router.get("/traces/{xenos_id}")
-async def get_traces(xenos_id: str, limit: int = 10):
+async def get_traces(xenos_id: str, request: Request, response: Response, limit: int = 10):
     """获取行为记录"""
     try:
-        result = get_agent_traces(xenos_id, limit)
+        etag = await agent_etag(xenos_id, CACHE_TTL["traces"])
+        unchanged = not_modified(request, etag)
+        if unchanged is not None:
+            return unchanged
+
+        result = await get_agent_traces_async(xenos_id, limit)
+        response.headers["ETag"] = etag
         return {
             "code": 0,
             "data": result
         }
     except Exception as e:
         return {"code": 1, "error": str(e)}
+
+
+@xenos_router.get("/sync/status")
+async def sync_status():
+    """本地兜底记录的同步状态（积压条数、最早积压时长）"""
+    try:
+        return {
+            "code": 0,
+            "data": get_sync_status()
+        }
+    except Exception as e:
+        return {"code": 1, "error": str(e)}
@@ -1,46 +1,146 @@
 """Xenos 核心模块初始化"""
+from .client import (
+    init_http_clients,
+    close_http_clients,
+    get_async_client
+)
+from .resilience import (
+    UpstreamUnavailable,
+    CircuitBreaker,
+    Bulkhead,
+    get_upstream_guard,
+    configure_upstream_guard
+)
 from .identity import (
     generate_xenos_id,
+    generate_xenos_id_async,
     verify_xenos_signature,
     sign_message,
     create_verifiable_credential,
-    get_agent_reputation
+    get_agent_reputation,
+    get_agent_reputation_async
 )
 from .trace import (
     record_trace,
+    record_trace_async,
     get_agent_traces,
+    get_agent_traces_async,
     query_traces,
+    query_traces_async,
+    query_fetched_traces,
     get_trace_statistics,
-    clear_local_traces
+    clear_local_traces,
+    flush_trace_batch,
+    push_local_traces,
+    fetch_upstream_traces,
+    fetch_upstream_traces_async
+)
+from .store import (
+    TraceStore,
+    MemoryTraceStore,
+    SQLiteTraceStore,
+    TraceRecord,
+    TraceRingBuffer,
+    get_trace_store,
+    configure_trace_store,
+    close_trace_store
+)
+from .ingest import (
+    TraceIngestQueue,
+    get_ingest_queue,
+    start_ingest_queue,
+    stop_ingest_queue
+)
+from .sync import (
+    TraceSyncWorker,
+    get_sync_worker,
+    get_sync_status,
+    start_sync_worker,
+    stop_sync_worker
 )
 from .context import (
     get_context_service,
     ContextService
 )
+from .aggregates import (
+    ReputationAggregates,
+    get_reputation_aggregates
+)
 from .reputation import (
     get_reputation_service,
     ReputationService,
-    calculate_agent_reputation
+    TraceStats,
+    reputation_cache_key,
+    calculate_agent_reputation,
+    calculate_agent_reputation_async,
+    calculate_agents_reputation_async
 )
 
 __all__ = [
+    # Upstream HTTP Client
+    "init_http_clients",
+    "close_http_clients",
+    "get_async_client",
+    # Upstream Resilience
+    "UpstreamUnavailable",
+    "CircuitBreaker",
+    "Bulkhead",
+    "get_upstream_guard",
+    "configure_upstream_guard",
     # Identity Service
     "generate_xenos_id",
+    "generate_xenos_id_async",
     "verify_xenos_signature",
     "sign_message",
     "create_verifiable_credential",
     "get_agent_reputation",
+    "get_agent_reputation_async",
     # Trace Service
     "record_trace",
+    "record_trace_async",
     "get_agent_traces",
+    "get_agent_traces_async",
     "query_traces",
+    "query_traces_async",
+    "query_fetched_traces",
     "get_trace_statistics",
     "clear_local_traces",
+    "flush_trace_batch",
+    "push_local_traces",
+    "fetch_upstream_traces",
+    "fetch_upstream_traces_async",
+    # Trace Store
+    "TraceStore",
+    "MemoryTraceStore",
+    "SQLiteTraceStore",
+    "TraceRecord",
+    "TraceRingBuffer",
+    "get_trace_store",
+    "configure_trace_store",
+    "close_trace_store",
+    # Trace Ingest Queue
+    "TraceIngestQueue",
+    "get_ingest_queue",
+    "start_ingest_queue",
+    "stop_ingest_queue",
+    # Trace Sync
+    "TraceSyncWorker",
+    "get_sync_worker",
+    "get_sync_status",
+    "start_sync_worker",
+    "stop_sync_worker",
     # Context Service
     "get_context_service",
     "ContextService",
+    # Reputation Aggregates
+    "ReputationAggregates",
+    "get_reputation_aggregates",
     # Reputation Service
     "get_reputation_service",
     "ReputationService",
-    "calculate_agent_reputation"
+    "TraceStats",
+    "reputation_cache_key",
+    "calculate_agent_reputation",
+    "calculate_agent_reputation_async",
+    "calculate_agents_reputation_async"
 ]
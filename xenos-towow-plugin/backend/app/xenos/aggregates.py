@@ -0,0 +1,287 @@
+"""
+Xenos 信誉增量聚合（本地存储中的 traces）
+Xenos 服务不可用时信誉按本地存储计算：本地存储写入、淘汰和清除记录时同步增减聚合，
+按 (Agent, 上下文) 维护各衰减时段的计数、欺诈标记和总数，兜底计算读取聚合值即可，
+不再逐条重扫本地记录。
+
+范围：
+- 只包含本地存储中的记录（上游不可用时的兜底写入），与存储内容一致；内存占用随存储有界
+  （每个 Agent 最多 max_per_agent 条），重启后由 rebuild 从持久化记录恢复
+- 上游可用时信誉以上游 traces 为准（包含其他节点的写入，本地聚合无法覆盖），不读取聚合；
+  此时缓存未命中仍按 reputation.REPUTATION_TRACE_LIMIT 拉取上游最近的 traces 逐条统计
+- 聚合在进程内维护：SQLite 存储被多个 worker 共享时，每个 worker 的聚合只包含启动时已有的记录
+  和本 worker 之后的写入
+
+时段老化：
+- 每个时段（30 / 90 / 180 天）维护按时间排序的槽位 FIFO，每个槽位合并 AGING_SLOT_SECONDS 内的记录
+- 读取时把整体越过时段边界的槽位计数移入下一时段，只处理越界的槽位，不重扫单条记录
+- 180 天以上的记录只保留计数
+"""
+
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, Iterable, List, Optional
+
+# 衰减时段（与 reputation.DECAY_WEIGHTS 的键一致，按从新到旧排列）
+DECAY_PERIODS = ("recent_30_days", "days_31_to_90", "days_91_to_180", "over_180_days")
+
+# 各时段的上界：距今天数（按 timedelta.days 计）超过该值即进入下一时段
+PERIOD_MAX_DAYS = (30, 90, 180)
+
+# 恶意行为标记列表
+FRAUD_ACTIONS = [
+    "fraud",
+    "cheat",
+    "malicious",
+    "double_spend",
+    "backtrack"
+]
+
+_FRAUD_ACTIONS_LOWER = frozenset(action.lower() for action in FRAUD_ACTIONS)
+
+# 老化槽位粒度（秒）：同一槽位内的记录一起移入下一时段
+AGING_SLOT_SECONDS = 60
+
+_DAY_SECONDS = 86400
+
+
+def is_fraud_trace(action: Any, result: Any, metadata: Optional[Dict[str, Any]]) -> bool:
+    """整体欺诈判定：恶意行为、result=fraud 或 metadata.isFraud 为 True"""
+    return (
+        (action or "").lower() in _FRAUD_ACTIONS_LOWER
+        or result == "fraud"
+        or (metadata or {}).get("isFraud") is True
+    )
+
+
+def is_context_fraud_trace(result: Any, metadata: Optional[Dict[str, Any]]) -> bool:
+    """上下文内欺诈判定：result=fraud 或 metadata.isFraud 为真值"""
+    return result == "fraud" or bool((metadata or {}).get("isFraud"))
+
+
+class ContextAggregate:
+    """单个 (Agent, 上下文) 的聚合计数"""
+
+    __slots__ = ("total", "success", "failed", "by_period", "fraud", "context_fraud", "_slots")
+
+    def __init__(self):
+        self.total = 0
+        self.success = 0
+        self.failed = 0
+        # 各时段 [记录数, 成功数, 失败数]
+        self.by_period: List[List[int]] = [[0, 0, 0] for _ in DECAY_PERIODS]
+        self.fraud = 0
+        self.context_fraud = 0
+        # 前三个时段的槽位 FIFO：[槽位结束时间, 记录数, 成功数, 失败数]
+        self._slots: List[Deque[List[float]]] = [deque() for _ in PERIOD_MAX_DAYS]
+
+    @staticmethod
+    def _period_of(ts: float, now: float) -> int:
+        days_ago = int((now - ts) // _DAY_SECONDS)
+        for period, max_days in enumerate(PERIOD_MAX_DAYS):
+            if days_ago <= max_days:
+                return period
+        return len(PERIOD_MAX_DAYS)
+
+    def add(self, ts: float, result: Any, fraud: bool, context_fraud: bool, now: float) -> None:
+        success = 1 if result == "success" else 0
+        failed = 1 if result == "failed" else 0
+
+        self.total += 1
+        self.success += success
+        self.failed += failed
+        self.fraud += fraud
+        self.context_fraud += context_fraud
+
+        period = self._period_of(ts, now)
+        counts = self.by_period[period]
+        counts[0] += 1
+        counts[1] += success
+        counts[2] += failed
+
+        if period < len(self._slots):
+            slot_end = (ts // AGING_SLOT_SECONDS + 1) * AGING_SLOT_SECONDS
+            slots = self._slots[period]
+            if slots and slots[-1][0] == slot_end:
+                slot = slots[-1]
+                slot[1] += 1
+                slot[2] += success
+                slot[3] += failed
+            else:
+                slots.append([slot_end, 1, success, failed])
+
+    def age(self, now: float) -> None:
+        """把越过时段边界的槽位移入下一时段"""
+        for period, max_days in enumerate(PERIOD_MAX_DAYS):
+            # 槽位内最新的记录也满足 days_ago > max_days 时整体移动
+            boundary = now - (max_days + 1) * _DAY_SECONDS
+            slots = self._slots[period]
+
+            while slots and slots[0][0] <= boundary:
+                slot = slots.popleft()
+                for i in range(3):
+                    self.by_period[period][i] -= slot[i + 1]
+                    self.by_period[period + 1][i] += slot[i + 1]
+                if period + 1 < len(self._slots):
+                    self._slots[period + 1].append(slot)
+
+    def _take_from_slot(self, slot_end: float, success: int, failed: int) -> int:
+        """从记录所在的槽位扣减，返回槽位所在时段；不在任何槽位中时返回 180 天以上时段"""
+        # 淘汰的通常是最旧的记录：从最旧的时段、队首开始查找
+        for period in reversed(range(len(self._slots))):
+            slots = self._slots[period]
+            for i, slot in enumerate(slots):
+                if slot[0] == slot_end:
+                    slot[1] -= 1
+                    slot[2] -= success
+                    slot[3] -= failed
+                    if slot[1] <= 0:
+                        del slots[i]
+                    return period
+        return len(self._slots)
+
+    def remove(self, ts: float, result: Any, fraud: bool, context_fraud: bool, now: float) -> None:
+        """扣减一条记录（记录从本地存储淘汰或删除时）"""
+        self.age(now)
+
+        success = 1 if result == "success" else 0
+        failed = 1 if result == "failed" else 0
+
+        self.total -= 1
+        self.success -= success
+        self.failed -= failed
+        self.fraud -= fraud
+        self.context_fraud -= context_fraud
+
+        period = len(self._slots)
+        slot_end = (ts // AGING_SLOT_SECONDS + 1) * AGING_SLOT_SECONDS
+        # 越过最后一个边界的槽位都已移入 180 天以上时段（只保留计数）
+        if slot_end > now - (PERIOD_MAX_DAYS[-1] + 1) * _DAY_SECONDS:
+            period = self._take_from_slot(slot_end, success, failed)
+
+        counts = self.by_period[period]
+        counts[0] -= 1
+        counts[1] -= success
+        counts[2] -= failed
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "total": self.total,
+            "success": self.success,
+            "failed": self.failed,
+            "byPeriod": {
+                name: tuple(counts) for name, counts in zip(DECAY_PERIODS, self.by_period)
+            },
+            "fraud": self.fraud,
+            "contextFraud": self.context_fraud,
+        }
+
+
+class ReputationAggregates:
+    """所有 Agent 的信誉聚合（线程安全）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._agents: Dict[str, Dict[str, ContextAggregate]] = {}
+
+    def record(self, payload: Dict[str, Any], ts: Optional[float] = None) -> None:
+        """
+        累加一条 trace
+
+        Args:
+            payload: 上游请求体（xenosId / context / action / result / metadata）
+            ts: epoch 时间戳（默认当前时间）
+        """
+        now = time.time()
+        ts = now if ts is None else ts
+        metadata = payload.get("metadata")
+        fraud = is_fraud_trace(payload.get("action"), payload.get("result"), metadata)
+        context_fraud = is_context_fraud_trace(payload.get("result"), metadata)
+
+        with self._lock:
+            contexts = self._agents.setdefault(payload["xenosId"], {})
+            aggregate = contexts.get(payload.get("context"))
+            if aggregate is None:
+                aggregate = contexts[payload.get("context")] = ContextAggregate()
+            aggregate.add(ts, payload.get("result"), fraud, context_fraud, now)
+
+    def discard(self, payload: Dict[str, Any], ts: float) -> None:
+        """
+        扣减一条记录（本地存储淘汰或删除记录时调用）
+
+        Args:
+            payload: 存储的记录（xenosId / context / action / result / metadata）
+            ts: 记录写入时的 epoch 时间戳（与 record 时一致）
+        """
+        now = time.time()
+        metadata = payload.get("metadata")
+        fraud = is_fraud_trace(payload.get("action"), payload.get("result"), metadata)
+        context_fraud = is_context_fraud_trace(payload.get("result"), metadata)
+
+        with self._lock:
+            contexts = self._agents.get(payload["xenosId"])
+            aggregate = contexts.get(payload.get("context")) if contexts else None
+            if aggregate is None:
+                return
+
+            aggregate.remove(ts, payload.get("result"), fraud, context_fraud, now)
+            if aggregate.total <= 0:
+                del contexts[payload.get("context")]
+                if not contexts:
+                    del self._agents[payload["xenosId"]]
+
+    def snapshot(self, xenos_id: str, now: Optional[float] = None) -> Optional[Dict[str, Dict[str, Any]]]:
+        """
+        读取 Agent 各上下文的聚合（先老化时段）
+
+        Returns:
+            上下文 -> 聚合计数（按首次出现顺序）；没有记录时返回 None
+        """
+        now = time.time() if now is None else now
+
+        with self._lock:
+            contexts = self._agents.get(xenos_id)
+            if not contexts:
+                return None
+
+            result = {}
+            for context, aggregate in contexts.items():
+                aggregate.age(now)
+                result[context] = aggregate.snapshot()
+            return result
+
+    def rebuild(self, records: Iterable[Dict[str, Any]]) -> int:
+        """
+        从本地存储的记录重建聚合（配置存储时使用）
+
+        Args:
+            records: 本地存储的记录（含 xenosId / context / action / result / metadata / timestamp）
+
+        Returns:
+            累加的记录数
+        """
+        self.clear()
+
+        count = 0
+        for record in records:
+            self.record(record, datetime.fromisoformat(record["timestamp"]).timestamp())
+            count += 1
+        return count
+
+    def clear(self, xenos_id: Optional[str] = None) -> None:
+        with self._lock:
+            if xenos_id is None:
+                self._agents.clear()
+            else:
+                self._agents.pop(xenos_id, None)
+
+
+# 全局信誉聚合实例
+_aggregates = ReputationAggregates()
+
+
+def get_reputation_aggregates() -> ReputationAggregates:
+    """获取信誉聚合实例"""
+    return _aggregates
@@ -5,13 +5,46 @@ Redis 缓存模块
 环境变量：
 - REDIS_URL: Redis 连接 URL
 - REDIS_ENABLED: 是否启用 Redis
+- REDIS_MAX_CONNECTIONS: Redis 连接池大小（默认 50）
+- REDIS_SOCKET_TIMEOUT: Redis 读写超时（秒，默认 1.0）
+- REDIS_CONNECT_TIMEOUT: Redis 连接超时（秒，默认 1.0）
+- CACHE_L1_MAX_ENTRIES: 启用 Redis 时进程内一级缓存的条目数（默认 1000，0 表示不启用）
+- CACHE_L1_TTL: 一级缓存条目的最长存活时间（秒，默认 30，pub/sub 失效消息丢失时的兜底）
+- MEMORY_CACHE_MAX_ENTRIES: 内存缓存最大条目数（默认 10000）
+- MEMORY_CACHE_MAX_BYTES: 内存缓存最大字节数（默认 64 MB）
+- CACHE_SERIALIZER / CACHE_COMPRESS_MIN_BYTES: 缓存值的序列化格式与压缩阈值（见 codec 模块）
+
+读取策略（fetch_cached / cached）：
+- 同一键的并发未命中合并为一次计算（SingleFlight）
+- 过期后 CACHE_STALE_TTL 内立即返回旧值并在后台刷新
+- 临近过期时按计算耗时随机提前刷新（XFetch），多节点的刷新时间自然错开
+
+失效：
+- 条目写入时可附带标签（如 agent_tag(xenos_id)），invalidate_tag 一次删除该标签下的所有条目，
+  不需要知道具体的键；内存后端维护标签索引，Redis 后端用集合记录标签下的键
+- trace 写入完成后按 agent_tag 删除该 Agent 所有上下文的信誉及响应体：一条 trace 会改变综合信誉和
+  欺诈状态，其他上下文的结果中也带有这两项
+- 与写入竞争的计算（写入前开始、写入后才写回）不能把旧值写回：计算前读取 Agent 数据版本号，
+  写回前后版本号变化时放弃写回（见 _store_computed 和 mark_agent_changed）
 """
 
+import asyncio
+import hashlib
+import heapq
 import json
 import logging
+import math
 import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
 from functools import wraps
-from typing import Any, Callable, Optional, TypeVar
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple, TypeVar
+
+from .codec import get_codec
 
 logger = logging.getLogger(__name__)
 
@@ -19,100 +52,412 @@ T = TypeVar("T")
 
 # 缓存 TTL 配置（秒）
 CACHE_TTL = {
-    "reputation": 300,      # 信誉分数：5 分钟
+    "reputation": 3600,     # 信誉分数：1 小时（trace 写入时按 agent_tag 主动失效）
     "agent_profile": 300,   # Agent 档案：5 分钟
     "traces": 120,          # 痕迹列表：2 分钟
+    "response": 60,         # 接口响应体：1 分钟（trace 写入时与信誉一起失效）
+}
+
+# 过期后仍可返回旧值的时长（秒）：期间读取立即返回旧值并在后台刷新
+CACHE_STALE_TTL = {
+    "reputation": 600,      # 信誉分数：10 分钟
+    "agent_profile": 300,   # Agent 档案：5 分钟
+    "traces": 60,           # 痕迹列表：1 分钟
 }
 
+# XFetch 提前刷新系数：越大越早刷新，0 表示不提前
+XFETCH_BETA = 1.0
+
 # 缓存键前缀
 CACHE_PREFIX = "xenos_plugin:"
 
+# 带过期信息的缓存条目标记
+_ENTRY_MARKER = "__xenos_entry__"
+
+# 响应体缓存值的首字节（与 codec 的格式头区分），其后为 ETag、媒体类型和响应体，以换行分隔
+_RESPONSE_MARKER = b"\x10"
+
+# 信誉接口的响应视图（完整信誉 / 摘要）
+RESPONSE_VIEWS = ("full", "summary")
+
+# 标签集合的最短保留时间（秒）：不短于任何带标签条目的 TTL，标签集合不会先于其中的条目过期
+TAG_TTL = 24 * 3600
+
+# Agent 数据版本号的保留时间（秒）；过期或被淘汰后按当前时间重新起始（见 _version_seed）
+VERSION_TTL = 7 * 24 * 3600
+
 
 class CacheBackend:
     """缓存后端抽象"""
 
-    def get(self, key: str) -> Optional[str]:
+    def get(self, key: str) -> Optional[bytes]:
         raise NotImplementedError
 
-    def set(self, key: str, value: str, ttl: Optional[int] = None) -> None:
+    def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        """批量读取，结果与 keys 一一对应（默认逐个读取）"""
+        return [self.get(key) for key in keys]
+
+    def set(self, key: str, value: bytes, ttl: Optional[int] = None, tags: Sequence[str] = ()) -> None:
+        """写入（tags 为条目所属的标签，见 invalidate_tags）"""
         raise NotImplementedError
 
     def delete(self, key: str) -> None:
         raise NotImplementedError
 
+    def delete_many(self, keys: List[str]) -> None:
+        """批量删除（默认逐个删除）"""
+        for key in keys:
+            self.delete(key)
+
+    def set_many(
+        self,
+        items: List[Tuple[str, bytes, Optional[int]]],
+        tags: Optional[Dict[str, Sequence[str]]] = None
+    ) -> None:
+        """批量写入 (键, 值, TTL)，tags 按键指定标签（默认逐个写入）"""
+        for key, value, ttl in items:
+            self.set(key, value, ttl, (tags or {}).get(key, ()))
+
+    def invalidate_tags(self, tags: List[str]) -> List[str]:
+        """
+        删除带有任一标签的所有条目（开销与这些标签下的条目数成正比）
+
+        Returns:
+            被删除的键
+        """
+        raise NotImplementedError
+
+    def incr(self, key: str, initial: int = 0, ttl: Optional[int] = None) -> int:
+        """
+        计数器加 1 并返回新值
+
+        键不存在时先置为 initial（并设置 TTL）再加 1；已存在时保留原有 TTL
+        """
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        """运行统计"""
+        return {}
+
+    # 条目接口：返回解码后的 (值, 逻辑过期时间, 计算耗时)，见 _decode_entry；
+    # 带进程内一级缓存的后端覆盖为直接返回已解码的对象
+
+    def get_entry(self, key: str) -> Optional[Tuple[Any, Optional[float], float]]:
+        return _decode_entry(self.get(key))
+
+    def get_entries(self, keys: List[str]) -> List[Optional[Tuple[Any, Optional[float], float]]]:
+        return [_decode_entry(value) for value in self.get_many(keys)]
+
+    async def aget_entry(self, key: str) -> Optional[Tuple[Any, Optional[float], float]]:
+        return _decode_entry(await self.aget(key))
+
+    async def aget_entries(self, keys: List[str]) -> List[Optional[Tuple[Any, Optional[float], float]]]:
+        return [_decode_entry(value) for value in await self.aget_many(keys)]
+
+    # 异步接口：默认直接调用同步实现（内存操作不阻塞事件循环），
+    # 网络后端覆盖为原生异步实现
+
+    async def aget(self, key: str) -> Optional[bytes]:
+        return self.get(key)
+
+    async def aget_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        return self.get_many(keys)
+
+    async def aset(self, key: str, value: bytes, ttl: Optional[int] = None, tags: Sequence[str] = ()) -> None:
+        self.set(key, value, ttl, tags)
+
+    async def aset_many(
+        self,
+        items: List[Tuple[str, bytes, Optional[int]]],
+        tags: Optional[Dict[str, Sequence[str]]] = None
+    ) -> None:
+        self.set_many(items, tags)
+
+    async def adelete_many(self, keys: List[str]) -> None:
+        self.delete_many(keys)
+
+    async def ainvalidate_tags(self, tags: List[str]) -> List[str]:
+        return self.invalidate_tags(tags)
+
+    async def aincr(self, key: str, initial: int = 0, ttl: Optional[int] = None) -> int:
+        return self.incr(key, initial, ttl)
+
+    async def aclose(self) -> None:
+        """释放连接"""
+
 
 class MemoryCache(CacheBackend):
-    """内存缓存实现（开发/测试用）"""
+    """
+    内存缓存实现（有界 LRU）
 
-    def __init__(self):
-        self._cache: dict[str, tuple[str, float]] = {}
+    - 条目数和字节数（键 + 值的对象大小）任一超限时淘汰最久未访问的条目
+    - 过期时间记录在最小堆中，每次写入时顺带清理已过期的条目（均摊），
+      不依赖同一个键被再次读取
+    - 标签 -> 键的索引随条目的删除、过期和淘汰同步清理
+    """
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max(1, max_bytes)
         self._ttl_default = 60
 
-    def get(self, key: str) -> Optional[str]:
-        import time
+        self._lock = threading.Lock()
+        # 键 -> (值, 过期时间, 字节数)，按访问顺序排列（末尾最新）
+        self._cache: "OrderedDict[str, Tuple[bytes, float, int]]" = OrderedDict()
+        # (过期时间, 键)；键被覆盖或删除后留下的旧记录在弹出时跳过
+        self._expiry: List[Tuple[float, str]] = []
+        self._bytes = 0
+        # 标签 -> 键，键 -> 标签
+        self._tags: Dict[str, Set[str]] = {}
+        self._key_tags: Dict[str, Tuple[str, ...]] = {}
 
-        entry = self._cache.get(key)
-        if not entry:
-            return None
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
 
-        value, expires_at = entry
-        if time.time() > expires_at:
-            del self._cache[key]
-            return None
+    @staticmethod
+    def _entry_size(key: str, value: bytes) -> int:
+        return sys.getsizeof(key) + sys.getsizeof(value)
 
-        return value
+    def _remove(self, key: str) -> None:
+        _, _, size = self._cache.pop(key)
+        self._bytes -= size
+
+        for tag in self._key_tags.pop(key, ()):
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def _sweep(self, now: float) -> None:
+        """清理堆顶已过期的条目"""
+        expiry = self._expiry
+        while expiry and expiry[0][0] <= now:
+            expires_at, key = heapq.heappop(expiry)
+            entry = self._cache.get(key)
+            if entry is not None and entry[1] == expires_at:
+                self._remove(key)
+                self._expirations += 1
+
+        # 旧记录过多时重建堆
+        if len(expiry) > 2 * len(self._cache) + 64:
+            self._expiry = [(entry[1], key) for key, entry in self._cache.items()]
+            heapq.heapify(self._expiry)
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
 
-    def set(self, key: str, value: str, ttl: Optional[int] = None) -> None:
-        import time
+            value, expires_at, _ = entry
+            if time.time() > expires_at:
+                self._remove(key)
+                self._expirations += 1
+                self._misses += 1
+                return None
 
-        expires_at = time.time() + (ttl or self._ttl_default)
-        self._cache[key] = (value, expires_at)
+            self._cache.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def _store(self, key: str, value: bytes, expires_at: float, now: float, tags: Sequence[str] = ()) -> None:
+        """写入条目（调用方持有锁）"""
+        size = self._entry_size(key, value)
+
+        if key in self._cache:
+            self._remove(key)
+
+        # 单个条目超过字节上限时不缓存
+        if size > self.max_bytes:
+            return
+
+        self._cache[key] = (value, expires_at, size)
+        self._bytes += size
+        heapq.heappush(self._expiry, (expires_at, key))
+
+        if tags:
+            self._key_tags[key] = tuple(tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+
+        self._sweep(now)
+        while len(self._cache) > self.max_entries or self._bytes > self.max_bytes:
+            self._remove(next(iter(self._cache)))
+            self._evictions += 1
+
+    def set(self, key: str, value: bytes, ttl: Optional[int] = None, tags: Sequence[str] = ()) -> None:
+        now = time.time()
+        with self._lock:
+            self._store(key, value, now + (ttl or self._ttl_default), now, tags)
+
+    def incr(self, key: str, initial: int = 0, ttl: Optional[int] = None) -> int:
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[1] >= now:
+                value, expires_at = int(entry[0]) + 1, entry[1]
+            else:
+                value, expires_at = initial + 1, now + (ttl or self._ttl_default)
+
+            self._store(key, str(value).encode(), expires_at, now)
+            return value
 
     def delete(self, key: str) -> None:
-        self._cache.pop(key, None)
+        with self._lock:
+            if key in self._cache:
+                self._remove(key)
+
+    def invalidate_tags(self, tags: List[str]) -> List[str]:
+        with self._lock:
+            removed = []
+            for tag in tags:
+                for key in self._tags.pop(tag, ()):
+                    if key in self._cache:
+                        self._remove(key)
+                        removed.append(key)
+            return removed
 
     def clear(self) -> None:
-        self._cache.clear()
+        with self._lock:
+            self._cache.clear()
+            self._expiry.clear()
+            self._tags.clear()
+            self._key_tags.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._cache),
+                "bytes": self._bytes,
+                "maxEntries": self.max_entries,
+                "maxBytes": self.max_bytes,
+                "tags": len(self._tags),
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+            }
 
 
 class RedisCache(CacheBackend):
-    """Redis 缓存实现"""
+    """
+    Redis 缓存实现
+
+    同步接口使用 redis 客户端，异步接口使用 redis.asyncio 客户端（不阻塞事件循环），
+    两者各自维护连接池；批量读取使用 MGET，批量写入使用 pipeline。
+    标签用 Redis 集合记录其下的键（与条目写入在同一个 pipeline 中），按标签失效时
+    在一个事务中取出并删除集合，再删除其中的键。
+    测试时可通过 client / async_client 传入进程内的假实现（如 fakeredis）。
+    """
 
-    def __init__(self, url: str):
+    def __init__(
+        self,
+        url: str,
+        max_connections: int = 50,
+        socket_timeout: float = 1.0,
+        connect_timeout: float = 1.0,
+        client: Any = None,
+        async_client: Any = None
+    ):
         self._url = url
-        self._client: Any = None
+        self._pool_kwargs = {
+            "max_connections": max_connections,
+            "socket_timeout": socket_timeout,
+            "socket_connect_timeout": connect_timeout,
+        }
+        self._client: Any = client
+        self._async_client: Any = async_client
+        self._async_loop: Any = None
+        # 外部传入的异步客户端不随事件循环重建
+        self._async_injected = async_client is not None
 
     def _get_client(self) -> Any:
         if self._client is None:
             try:
                 import redis
 
-                self._client = redis.from_url(self._url)
+                self._client = redis.from_url(self._url, **self._pool_kwargs)
                 logger.info(f"[Redis] Connected to {self._url}")
             except ImportError:
                 logger.warning("[Redis] redis package not installed, using memory cache")
                 raise
         return self._client
 
-    def get(self, key: str) -> Optional[str]:
+    def _get_async_client(self) -> Any:
+        # redis.asyncio 的连接绑定创建时的事件循环，事件循环变化时重建
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or (not self._async_injected and self._async_loop is not loop):
+            import redis.asyncio
+
+            self._async_client = redis.asyncio.from_url(self._url, **self._pool_kwargs)
+            self._async_loop = loop
+        return self._async_client
+
+    def ping(self) -> None:
+        """检查连接（失败时抛出异常）"""
+        self._get_client().ping()
+
+    def get(self, key: str) -> Optional[bytes]:
         try:
             client = self._get_client()
-            value = client.get(key)
-            return value.decode() if value else None
+            return client.get(key)
         except Exception as e:
             logger.error(f"[Redis] Get error: {e}")
             return None
 
-    def set(self, key: str, value: str, ttl: Optional[int] = None) -> None:
+    def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        if not keys:
+            return []
         try:
             client = self._get_client()
-            if ttl:
-                client.setex(key, ttl, value)
-            else:
-                client.set(key, value)
+            return client.mget(keys)
+        except Exception as e:
+            logger.error(f"[Redis] MGet error: {e}")
+            return [None] * len(keys)
+
+    @staticmethod
+    def _queue_set(pipe: Any, key: str, value: bytes, ttl: Optional[int], tags: Sequence[str]) -> None:
+        """在 pipeline 中写入条目并登记标签"""
+        pipe.set(key, value, ex=ttl or None)
+        for tag in tags:
+            pipe.sadd(tag, key)
+            pipe.expire(tag, max(ttl or 0, TAG_TTL))
+
+    def set(self, key: str, value: bytes, ttl: Optional[int] = None, tags: Sequence[str] = ()) -> None:
+        try:
+            client = self._get_client()
+            if not tags:
+                client.set(key, value, ex=ttl or None)
+                return
+            pipe = client.pipeline(transaction=False)
+            self._queue_set(pipe, key, value, ttl, tags)
+            pipe.execute()
         except Exception as e:
             logger.error(f"[Redis] Set error: {e}")
 
+    def set_many(
+        self,
+        items: List[Tuple[str, bytes, Optional[int]]],
+        tags: Optional[Dict[str, Sequence[str]]] = None
+    ) -> None:
+        if not items:
+            return
+        try:
+            pipe = self._get_client().pipeline(transaction=False)
+            for key, value, ttl in items:
+                self._queue_set(pipe, key, value, ttl, (tags or {}).get(key, ()))
+            pipe.execute()
+        except Exception as e:
+            logger.error(f"[Redis] Pipeline set error: {e}")
+
     def delete(self, key: str) -> None:
         try:
             client = self._get_client()
@@ -120,11 +465,511 @@ class RedisCache(CacheBackend):
         except Exception as e:
             logger.error(f"[Redis] Delete error: {e}")
 
+    def delete_many(self, keys: List[str]) -> None:
+        if not keys:
+            return
+        try:
+            client = self._get_client()
+            client.delete(*keys)
+        except Exception as e:
+            logger.error(f"[Redis] Delete error: {e}")
+
+    async def aget(self, key: str) -> Optional[bytes]:
+        try:
+            return await self._get_async_client().get(key)
+        except Exception as e:
+            logger.error(f"[Redis] Async get error: {e}")
+            return None
+
+    async def aget_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        if not keys:
+            return []
+        try:
+            return await self._get_async_client().mget(keys)
+        except Exception as e:
+            logger.error(f"[Redis] Async MGet error: {e}")
+            return [None] * len(keys)
+
+    async def aset(self, key: str, value: bytes, ttl: Optional[int] = None, tags: Sequence[str] = ()) -> None:
+        try:
+            client = self._get_async_client()
+            if not tags:
+                await client.set(key, value, ex=ttl or None)
+                return
+            pipe = client.pipeline(transaction=False)
+            self._queue_set(pipe, key, value, ttl, tags)
+            await pipe.execute()
+        except Exception as e:
+            logger.error(f"[Redis] Async set error: {e}")
+
+    async def aset_many(
+        self,
+        items: List[Tuple[str, bytes, Optional[int]]],
+        tags: Optional[Dict[str, Sequence[str]]] = None
+    ) -> None:
+        if not items:
+            return
+        try:
+            pipe = self._get_async_client().pipeline(transaction=False)
+            for key, value, ttl in items:
+                self._queue_set(pipe, key, value, ttl, (tags or {}).get(key, ()))
+            await pipe.execute()
+        except Exception as e:
+            logger.error(f"[Redis] Async pipeline set error: {e}")
+
+    async def adelete_many(self, keys: List[str]) -> None:
+        if not keys:
+            return
+        try:
+            await self._get_async_client().delete(*keys)
+        except Exception as e:
+            logger.error(f"[Redis] Async delete error: {e}")
+
+    @staticmethod
+    def _queue_pop_tags(pipe: Any, tags: List[str]) -> None:
+        """在事务中取出并删除标签集合（之后写入的条目登记到新的集合中）"""
+        for tag in tags:
+            pipe.smembers(tag)
+        pipe.delete(*tags)
+
+    @staticmethod
+    def _tagged_keys(results: List[Any]) -> List[str]:
+        return list(dict.fromkeys(
+            key.decode() if isinstance(key, bytes) else key
+            for members in results[:-1]
+            for key in members
+        ))
+
+    def invalidate_tags(self, tags: List[str]) -> List[str]:
+        if not tags:
+            return []
+        try:
+            client = self._get_client()
+            pipe = client.pipeline(transaction=True)
+            self._queue_pop_tags(pipe, tags)
+            keys = self._tagged_keys(pipe.execute())
+            if keys:
+                client.delete(*keys)
+            return keys
+        except Exception as e:
+            logger.error(f"[Redis] Invalidate tags error: {e}")
+            return []
+
+    async def ainvalidate_tags(self, tags: List[str]) -> List[str]:
+        if not tags:
+            return []
+        try:
+            client = self._get_async_client()
+            pipe = client.pipeline(transaction=True)
+            self._queue_pop_tags(pipe, tags)
+            keys = self._tagged_keys(await pipe.execute())
+            if keys:
+                await client.delete(*keys)
+            return keys
+        except Exception as e:
+            logger.error(f"[Redis] Async invalidate tags error: {e}")
+            return []
+
+    def incr(self, key: str, initial: int = 0, ttl: Optional[int] = None) -> int:
+        try:
+            pipe = self._get_client().pipeline(transaction=False)
+            pipe.set(key, initial, nx=True, ex=ttl or None)
+            pipe.incr(key)
+            return pipe.execute()[1]
+        except Exception as e:
+            logger.error(f"[Redis] Incr error: {e}")
+            return initial + 1
+
+    async def aincr(self, key: str, initial: int = 0, ttl: Optional[int] = None) -> int:
+        try:
+            pipe = self._get_async_client().pipeline(transaction=False)
+            pipe.set(key, initial, nx=True, ex=ttl or None)
+            pipe.incr(key)
+            return (await pipe.execute())[1]
+        except Exception as e:
+            logger.error(f"[Redis] Async incr error: {e}")
+            return initial + 1
+
+    def publish(self, channel: str, message: str) -> None:
+        try:
+            self._get_client().publish(channel, message)
+        except Exception as e:
+            logger.error(f"[Redis] Publish error: {e}")
+
+    async def apublish(self, channel: str, message: str) -> None:
+        try:
+            await self._get_async_client().publish(channel, message)
+        except Exception as e:
+            logger.error(f"[Redis] Async publish error: {e}")
+
+    def subscribe(
+        self,
+        channel: str,
+        handler: Callable[[str], None],
+        on_error: Optional[Callable[[BaseException], None]] = None
+    ) -> Any:
+        """
+        在后台线程中订阅频道
+
+        Args:
+            channel: 频道名
+            handler: 收到消息时调用（参数为消息内容）
+            on_error: 订阅连接出错时调用（重连期间可能漏掉消息）
+
+        Returns:
+            后台线程（调用 stop() 停止订阅）
+        """
+        pubsub = self._get_client().pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{channel: lambda message: handler(message["data"].decode())})
+
+        def handle_error(error: BaseException, pubsub: Any, thread: Any) -> None:
+            logger.warning(f"[Redis] Subscription error on {channel}: {error}")
+            if on_error is not None:
+                on_error(error)
+            time.sleep(1.0)
+
+        return pubsub.run_in_thread(sleep_time=1.0, daemon=True, exception_handler=handle_error)
+
+    async def aclose(self) -> None:
+        if self._async_client is not None and not self._async_injected:
+            await self._async_client.aclose()
+            self._async_client = None
+        if self._client is not None:
+            self._client.close()
+
+
+class TieredCache(CacheBackend):
+    """
+    两级缓存：进程内 LRU（L1，保存已解码的条目）+ Redis（L2）
+
+    - 热点键的读取直接命中 L1，不经过网络和反序列化
+    - 本进程写入或删除时更新 L1，并通过 Redis pub/sub 广播键名，
+      其他 worker / 节点收到后丢弃各自 L1 中的对应条目
+    - pub/sub 不保证送达，L1 条目另有较短的存活时间兜底；订阅连接出错时清空 L1
+    - L1 返回的对象在多个请求间共享，调用方不得修改
+    """
+
+    CHANNEL = CACHE_PREFIX + "invalidate"
+
+    def __init__(self, l2: RedisCache, max_entries: int = 1000, ttl: float = 30.0, subscribe: bool = True):
+        self.l2 = l2
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self._origin = uuid.uuid4().hex
+
+        self._lock = threading.Lock()
+        # 键 -> (已解码条目, L1 过期时间)，按访问顺序排列
+        self._l1: "OrderedDict[str, Tuple[Tuple[Any, Optional[float], float], float]]" = OrderedDict()
+        # 每次失效递增；读取 L2 期间发生过失效时不回填 L1，避免写回旧值
+        self._epoch = 0
+
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+
+        self._subscriber: Any = None
+        if subscribe:
+            self._subscriber = l2.subscribe(self.CHANNEL, self._on_message, on_error=lambda _: self.clear_l1())
+
+    # ---- L1 ----
+
+    def _l1_get(self, key: str, now: float) -> Optional[Tuple[Any, Optional[float], float]]:
+        with self._lock:
+            item = self._l1.get(key)
+            if item is None or item[1] <= now:
+                if item is not None:
+                    del self._l1[key]
+                self._misses += 1
+                return None
+            self._l1.move_to_end(key)
+            self._hits += 1
+            return item[0]
+
+    def _l1_fill(self, key: str, entry: Optional[Tuple[Any, Optional[float], float]], epoch: int) -> None:
+        if entry is None:
+            return
+        with self._lock:
+            if self._epoch != epoch:
+                return
+            self._l1[key] = (entry, time.monotonic() + self.ttl)
+            self._l1.move_to_end(key)
+            while len(self._l1) > self.max_entries:
+                self._l1.popitem(last=False)
+
+    def _l1_drop(self, keys: List[str]) -> None:
+        with self._lock:
+            self._epoch += 1
+            for key in keys:
+                if self._l1.pop(key, None) is not None:
+                    self._invalidations += 1
+
+    def clear_l1(self) -> None:
+        with self._lock:
+            self._epoch += 1
+            self._l1.clear()
+
+    def _on_message(self, message: Optional[str]) -> None:
+        try:
+            data = json.loads(message or "")
+        except json.JSONDecodeError:
+            return
+        if data.get("origin") != self._origin:
+            self._l1_drop(data.get("keys", []))
+
+    def _message(self, keys: List[str]) -> str:
+        return json.dumps({"origin": self._origin, "keys": keys})
+
+    def _invalidate(self, keys: List[str]) -> None:
+        self._l1_drop(keys)
+        self.l2.publish(self.CHANNEL, self._message(keys))
+
+    async def _ainvalidate(self, keys: List[str]) -> None:
+        self._l1_drop(keys)
+        await self.l2.apublish(self.CHANNEL, self._message(keys))
+
+    # ---- 条目接口（优先读 L1） ----
+
+    def get_entry(self, key: str) -> Optional[Tuple[Any, Optional[float], float]]:
+        entry = self._l1_get(key, time.monotonic())
+        if entry is not None:
+            return entry
+
+        epoch = self._epoch
+        entry = _decode_entry(self.l2.get(key))
+        self._l1_fill(key, entry, epoch)
+        return entry
+
+    def get_entries(self, keys: List[str]) -> List[Optional[Tuple[Any, Optional[float], float]]]:
+        now = time.monotonic()
+        entries = [self._l1_get(key, now) for key in keys]
+        missing = [i for i, entry in enumerate(entries) if entry is None]
+        if missing:
+            epoch = self._epoch
+            for i, raw in zip(missing, self.l2.get_many([keys[i] for i in missing])):
+                entries[i] = _decode_entry(raw)
+                self._l1_fill(keys[i], entries[i], epoch)
+        return entries
+
+    async def aget_entry(self, key: str) -> Optional[Tuple[Any, Optional[float], float]]:
+        entry = self._l1_get(key, time.monotonic())
+        if entry is not None:
+            return entry
+
+        epoch = self._epoch
+        entry = _decode_entry(await self.l2.aget(key))
+        self._l1_fill(key, entry, epoch)
+        return entry
+
+    async def aget_entries(self, keys: List[str]) -> List[Optional[Tuple[Any, Optional[float], float]]]:
+        now = time.monotonic()
+        entries = [self._l1_get(key, now) for key in keys]
+        missing = [i for i, entry in enumerate(entries) if entry is None]
+        if missing:
+            epoch = self._epoch
+            for i, raw in zip(missing, await self.l2.aget_many([keys[i] for i in missing])):
+                entries[i] = _decode_entry(raw)
+                self._l1_fill(keys[i], entries[i], epoch)
+        return entries
+
+    # ---- 原始字符串接口（直接读写 L2，写入时失效 L1） ----
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.l2.get(key)
+
+    def get_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        return self.l2.get_many(keys)
+
+    def set(self, key: str, value: bytes, ttl: Optional[int] = None, tags: Sequence[str] = ()) -> None:
+        self.l2.set(key, value, ttl, tags)
+        self._invalidate([key])
+
+    def set_many(
+        self,
+        items: List[Tuple[str, bytes, Optional[int]]],
+        tags: Optional[Dict[str, Sequence[str]]] = None
+    ) -> None:
+        if not items:
+            return
+        self.l2.set_many(items, tags)
+        self._invalidate([key for key, _, _ in items])
+
+    def invalidate_tags(self, tags: List[str]) -> List[str]:
+        keys = self.l2.invalidate_tags(tags)
+        if keys:
+            self._invalidate(keys)
+        return keys
+
+    def delete(self, key: str) -> None:
+        self.l2.delete(key)
+        self._invalidate([key])
+
+    def delete_many(self, keys: List[str]) -> None:
+        if not keys:
+            return
+        self.l2.delete_many(keys)
+        self._invalidate(keys)
+
+    async def aget(self, key: str) -> Optional[bytes]:
+        return await self.l2.aget(key)
+
+    async def aget_many(self, keys: List[str]) -> List[Optional[bytes]]:
+        return await self.l2.aget_many(keys)
+
+    async def aset(self, key: str, value: bytes, ttl: Optional[int] = None, tags: Sequence[str] = ()) -> None:
+        await self.l2.aset(key, value, ttl, tags)
+        await self._ainvalidate([key])
+
+    async def aset_many(
+        self,
+        items: List[Tuple[str, bytes, Optional[int]]],
+        tags: Optional[Dict[str, Sequence[str]]] = None
+    ) -> None:
+        if not items:
+            return
+        await self.l2.aset_many(items, tags)
+        await self._ainvalidate([key for key, _, _ in items])
+
+    async def ainvalidate_tags(self, tags: List[str]) -> List[str]:
+        keys = await self.l2.ainvalidate_tags(tags)
+        if keys:
+            await self._ainvalidate(keys)
+        return keys
+
+    async def adelete_many(self, keys: List[str]) -> None:
+        if not keys:
+            return
+        await self.l2.adelete_many(keys)
+        await self._ainvalidate(keys)
+
+    def incr(self, key: str, initial: int = 0, ttl: Optional[int] = None) -> int:
+        return self.l2.incr(key, initial, ttl)
+
+    async def aincr(self, key: str, initial: int = 0, ttl: Optional[int] = None) -> int:
+        return await self.l2.aincr(key, initial, ttl)
+
+    async def aclose(self) -> None:
+        if self._subscriber is not None:
+            self._subscriber.stop()
+            self._subscriber = None
+        await self.l2.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "l1Entries": len(self._l1),
+                "l1MaxEntries": self.max_entries,
+                "l1Hits": self._hits,
+                "l1Misses": self._misses,
+                "l1Invalidations": self._invalidations,
+            }
+
+
+class _Call:
+    """一次进行中的同步调用"""
+
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    进程内请求合并（single-flight）
+
+    同一 key 的并发调用只执行一次，其余调用等待并共享结果（包括异常），
+    避免热点缓存过期时所有请求同时重算、同时打到上游。
+    调用结束即移除记录，不缓存结果；结果的缓存仍由调用方写入。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._futures: Dict[Tuple[Any, str], "asyncio.Future[Any]"] = {}
+
+    def do(self, key: str, func: Callable[[], T]) -> T:
+        """同步版本（线程间合并）"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+        return call.result
+
+    async def do_async(self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        """异步版本（同一事件循环内的协程间合并）"""
+        loop = asyncio.get_running_loop()
+        flight_key = (loop, key)
+
+        while True:
+            future = self._futures.get(flight_key)
+            if future is None:
+                break
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # 执行者被取消时由等待者重新执行；等待者自身被取消则向上传播
+                if not future.cancelled():
+                    raise
+
+        future = self._futures[flight_key] = loop.create_future()
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            # 标记异常已读取，没有等待者时不触发 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._futures.pop(flight_key, None)
+
+
+# 全局请求合并实例
+_flight = SingleFlight()
+
+
+def get_single_flight() -> SingleFlight:
+    """获取请求合并实例"""
+    return _flight
+
 
 # 全局缓存实例
 _cache: Optional[CacheBackend] = None
 
 
+def _memory_cache_from_env() -> MemoryCache:
+    """按环境变量创建内存缓存"""
+    return MemoryCache(
+        max_entries=int(os.getenv("MEMORY_CACHE_MAX_ENTRIES", "10000")),
+        max_bytes=int(os.getenv("MEMORY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    )
+
+
 def get_cache() -> CacheBackend:
     """获取缓存实例"""
     global _cache
@@ -137,34 +982,391 @@ def get_cache() -> CacheBackend:
 
     if enabled:
         try:
-            _cache = RedisCache(url)
+            redis_cache = RedisCache(
+                url,
+                max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", "50")),
+                socket_timeout=float(os.getenv("REDIS_SOCKET_TIMEOUT", "1.0")),
+                connect_timeout=float(os.getenv("REDIS_CONNECT_TIMEOUT", "1.0"))
+            )
             # 测试连接
-            _cache.get("__test__")
+            redis_cache.ping()
+
+            l1_entries = int(os.getenv("CACHE_L1_MAX_ENTRIES", "1000"))
+            if l1_entries > 0:
+                _cache = TieredCache(
+                    redis_cache,
+                    max_entries=l1_entries,
+                    ttl=float(os.getenv("CACHE_L1_TTL", "30"))
+                )
+            else:
+                _cache = redis_cache
         except Exception as e:
             logger.warning(f"[Redis] Connection failed, falling back to memory: {e}")
-            _cache = MemoryCache()
+            _cache = _memory_cache_from_env()
     else:
-        _cache = MemoryCache()
+        _cache = _memory_cache_from_env()
 
     return _cache
 
 
+async def close_cache() -> None:
+    """释放缓存连接（应用关闭时调用），下次使用时重新创建"""
+    global _cache
+
+    if _cache is not None:
+        await _cache.aclose()
+        _cache = None
+
+
 def cache_key(*parts: str) -> str:
     """生成缓存键"""
     return CACHE_PREFIX + ":".join(parts)
 
 
-def cached(ttl: int = 300, key_builder: Optional[Callable[..., str]] = None):
+def tag_key(tag: str) -> str:
+    """标签在后端中的键"""
+    return cache_key("tag", tag)
+
+
+def _tag_keys(tags: Sequence[str]) -> List[str]:
+    return [tag_key(tag) for tag in tags]
+
+
+def _encode_entry(value: Any, ttl: Optional[int], delta: float) -> bytes:
     """
-    缓存装饰器
+    编码缓存条目（序列化格式和压缩见 codec 模块）
+
+    指定 TTL 时附带逻辑过期时间和计算耗时（供过期后返回旧值及 XFetch 提前刷新使用）
+    """
+    if not ttl:
+        return get_codec().dumps(value)
+    return get_codec().dumps({
+        _ENTRY_MARKER: 1,
+        "value": value,
+        "expiresAt": time.time() + ttl,
+        "delta": delta
+    })
+
+
+def _decode_entry(raw: Optional[bytes]) -> Optional[Tuple[Any, Optional[float], float]]:
+    """
+    解码缓存条目
+
+    Returns:
+        (值, 逻辑过期时间, 计算耗时)；不带过期信息的旧格式条目过期时间为 None；
+        无法解析时返回 None
+    """
+    if not raw:
+        return None
+    try:
+        data = get_codec().loads(raw)
+    except ValueError:
+        return None
+
+    if isinstance(data, dict) and data.get(_ENTRY_MARKER) == 1:
+        return data["value"], data["expiresAt"], data["delta"]
+    return data, None, 0.0
+
+
+def _should_refresh(expires_at: Optional[float], delta: float, beta: float, now: float) -> bool:
+    """
+    是否需要刷新（XFetch）
+
+    临近过期时按计算耗时随机提前刷新：now - delta * beta * ln(rand) >= expires_at，
+    各节点的刷新时间因此分散开，而不是在过期瞬间同时重算
+    """
+    if expires_at is None:
+        return False
+    if now >= expires_at:
+        return True
+    if delta <= 0 or beta <= 0:
+        return False
+    return now - delta * beta * math.log(1.0 - random.random()) >= expires_at
+
+
+# 后台刷新任务（保留引用，避免任务被回收）
+_refresh_tasks: set = set()
+
+# 正在后台刷新的键：同一键只发起一个后台刷新
+_refreshing: set = set()
+_refreshing_lock = threading.Lock()
+
+# refresh_cached_async 未传入版本号的标记（版本号本身可以是 None）
+_UNREAD: Any = object()
+
+
+def _claim_refresh(key: str) -> bool:
+    """登记后台刷新，已有刷新在进行时返回 False"""
+    with _refreshing_lock:
+        if key in _refreshing:
+            return False
+        _refreshing.add(key)
+        return True
+
+
+def _release_refresh(key: str) -> None:
+    with _refreshing_lock:
+        _refreshing.discard(key)
+
+
+def _encode_computed(result: Any, ttl: int, delta: float) -> Optional[bytes]:
+    """编码计算结果，无需缓存或无法序列化时返回 None"""
+    if result is None:
+        return None
+    try:
+        return _encode_entry(result, ttl, delta)
+    except (TypeError, ValueError):
+        return None
+
+
+def _store_computed(
+    full_key: str,
+    result: Any,
+    ttl: int,
+    stale_ttl: int,
+    delta: float,
+    tags: Sequence[str] = (),
+    agent: Optional[str] = None,
+    version: Optional[bytes] = None
+) -> None:
+    """
+    写入计算结果（后端 TTL 包含返回旧值的时长）
+
+    指定 agent 时 version 为计算开始前读取的该 Agent 数据版本号：写入前版本号已变化（计算期间有 trace 写入）
+    则放弃写入；写入后再检查一次，期间变化则删除刚写入的条目（检查与写入之间的竞争）
+    """
+    encoded = _encode_computed(result, ttl, delta)
+    if encoded is None:
+        return
+
+    cache = get_cache()
+    if agent is not None and _raw_agent_version(cache, agent) != version:
+        return
+    cache.set(full_key, encoded, ttl + stale_ttl, _tag_keys(tags))
+    if agent is not None and _raw_agent_version(cache, agent) != version:
+        cache.delete(full_key)
+
+
+async def _store_computed_async(
+    full_key: str,
+    result: Any,
+    ttl: int,
+    stale_ttl: int,
+    delta: float,
+    tags: Sequence[str] = (),
+    agent: Optional[str] = None,
+    version: Optional[bytes] = None
+) -> None:
+    """写入计算结果（异步版本，规则同 _store_computed）"""
+    encoded = _encode_computed(result, ttl, delta)
+    if encoded is None:
+        return
+
+    cache = get_cache()
+    if agent is not None and await _raw_agent_version_async(cache, agent) != version:
+        return
+    await cache.aset(full_key, encoded, ttl + stale_ttl, _tag_keys(tags))
+    if agent is not None and await _raw_agent_version_async(cache, agent) != version:
+        await cache.adelete_many([full_key])
+
+
+def refresh_cached(
+    key: str,
+    compute: Callable[[], T],
+    ttl: int,
+    stale_ttl: int = 0,
+    tags: Sequence[str] = (),
+    agent: Optional[str] = None
+) -> T:
+    """
+    计算并写入缓存（同步版本）
+
+    同一键的并发调用合并为一次计算；写入时记录计算耗时供 XFetch 使用
+
+    Args:
+        key: 缓存键（不含全局前缀）
+        compute: 计算函数
+        ttl: 逻辑过期时间（秒）
+        stale_ttl: 过期后仍可返回旧值的时长（秒）
+        tags: 条目所属的标签（见 invalidate_tag）
+        agent: 结果依赖的 Agent（Xenos ID），计算期间其数据版本号变化时不写回
+    """
+    full_key = cache_key(key)
+
+    def run() -> T:
+        version = _raw_agent_version(get_cache(), agent) if agent is not None else None
+        started = time.monotonic()
+        result = compute()
+        _store_computed(full_key, result, ttl, stale_ttl, time.monotonic() - started, tags, agent, version)
+        return result
+
+    return _flight.do(full_key, run)
+
+
+async def refresh_cached_async(
+    key: str,
+    compute: Callable[[], Awaitable[T]],
+    ttl: int,
+    stale_ttl: int = 0,
+    tags: Sequence[str] = (),
+    agent: Optional[str] = None,
+    since: Any = _UNREAD
+) -> T:
+    """
+    计算并写入缓存（异步版本，参数同 refresh_cached）
+
+    Args:
+        since: 调用方在准备计算所需数据（如拉取上游 traces）之前读取的版本号（agent_version_token_async），
+            多个键共用一次数据拉取时使用；默认在计算前读取
+    """
+    full_key = cache_key(key)
+
+    async def run() -> T:
+        version = since
+        if agent is not None and version is _UNREAD:
+            version = await _raw_agent_version_async(get_cache(), agent)
+        started = time.monotonic()
+        result = await compute()
+        await _store_computed_async(
+            full_key, result, ttl, stale_ttl, time.monotonic() - started, tags, agent, version
+        )
+        return result
+
+    return await _flight.do_async(full_key, run)
+
+
+def _classify(entry: Optional[Tuple[Any, Optional[float], float]], stale_ttl: int, beta: float) -> Tuple[Any, str]:
+    """
+    判定缓存条目状态
+
+    Returns:
+        (值, 状态)：hit 直接返回；stale 返回旧值并后台刷新；miss 需要同步计算
+    """
+    if entry is None:
+        return None, "miss"
+
+    value, expires_at, delta = entry
+    now = time.time()
+    if not _should_refresh(expires_at, delta, beta, now):
+        return value, "hit"
+    if stale_ttl > 0 or now < expires_at:
+        return value, "stale"
+    return None, "miss"
+
+
+def fetch_cached(
+    key: str,
+    compute: Callable[[], T],
+    ttl: int,
+    stale_ttl: int = 0,
+    beta: float = XFETCH_BETA,
+    tags: Sequence[str] = (),
+    agent: Optional[str] = None
+) -> T:
+    """
+    读取缓存，未命中时计算并写入（同步版本）
+
+    - 未命中：合并并发请求，计算一次后写入
+    - 已过期但仍在 stale_ttl 内，或 XFetch 判定提前刷新：立即返回旧值，后台线程刷新
+    - 同一键同时只有一个后台刷新，刷新与未命中的计算共用请求合并
+
+    Args:
+        key: 缓存键（不含全局前缀）
+        compute: 计算函数
+        ttl: 逻辑过期时间（秒）
+        stale_ttl: 过期后仍可返回旧值的时长（秒）
+        beta: XFetch 提前刷新系数
+        tags: 条目所属的标签（见 invalidate_tag）
+        agent: 结果依赖的 Agent（见 refresh_cached）
+    """
+    value, state = _classify(get_cache().get_entry(cache_key(key)), stale_ttl, beta)
+    if state == "hit":
+        return value
+    if state == "stale":
+        if _claim_refresh(key):
+            threading.Thread(
+                target=_refresh_quietly, args=(key, compute, ttl, stale_ttl, tags, agent), daemon=True
+            ).start()
+        return value
+
+    return refresh_cached(key, compute, ttl, stale_ttl, tags, agent)
+
+
+def _refresh_quietly(
+    key: str,
+    compute: Callable[[], Any],
+    ttl: int,
+    stale_ttl: int,
+    tags: Sequence[str] = (),
+    agent: Optional[str] = None
+) -> None:
+    """后台刷新（失败只记录日志，旧值继续有效直到后端过期）"""
+    try:
+        refresh_cached(key, compute, ttl, stale_ttl, tags, agent)
+    except Exception as e:
+        logger.warning(f"[Cache] Background refresh failed for {key}: {e}")
+    finally:
+        _release_refresh(key)
+
+
+async def fetch_cached_async(
+    key: str,
+    compute: Callable[[], Awaitable[T]],
+    ttl: int,
+    stale_ttl: int = 0,
+    beta: float = XFETCH_BETA,
+    tags: Sequence[str] = (),
+    agent: Optional[str] = None
+) -> T:
+    """读取缓存，未命中时计算并写入（异步版本，规则同 fetch_cached，后台刷新使用任务）"""
+    value, state = _classify(await get_cache().aget_entry(cache_key(key)), stale_ttl, beta)
+    if state == "hit":
+        return value
+    if state == "stale":
+        if _claim_refresh(key):
+            task = asyncio.create_task(_refresh_quietly_async(key, compute, ttl, stale_ttl, tags, agent))
+            _refresh_tasks.add(task)
+            task.add_done_callback(_refresh_tasks.discard)
+            # 任务未开始即被取消时也释放登记
+            task.add_done_callback(lambda _: _release_refresh(key))
+        return value
+
+    return await refresh_cached_async(key, compute, ttl, stale_ttl, tags, agent)
+
+
+async def _refresh_quietly_async(
+    key: str,
+    compute: Callable[[], Awaitable[Any]],
+    ttl: int,
+    stale_ttl: int,
+    tags: Sequence[str] = (),
+    agent: Optional[str] = None
+) -> None:
+    """后台刷新（异步版本）"""
+    try:
+        await refresh_cached_async(key, compute, ttl, stale_ttl, tags, agent)
+    except Exception as e:
+        logger.warning(f"[Cache] Background refresh failed for {key}: {e}")
+
+
+def cached(
+    ttl: int = 300,
+    key_builder: Optional[Callable[..., str]] = None,
+    stale_ttl: int = 0,
+    tags_builder: Optional[Callable[..., Sequence[str]]] = None
+):
+    """
+    缓存装饰器（请求合并、过期后返回旧值并后台刷新、XFetch 提前刷新，见 fetch_cached）
 
     用法：
         @cached(ttl=300)
         async def get_reputation(xenos_id: str) -> dict:
             ...
 
-        @cached(key_builder=lambda xid: f"rep:{xid}")
-        async def get_reputation(xenos_id: str) -> dict:
+        @cached(ttl=CACHE_TTL["traces"], stale_ttl=CACHE_STALE_TTL["traces"],
+                key_builder=lambda xid: f"traces:{xid}",
+                tags_builder=lambda xid: [agent_tag(xid)])
+        async def get_traces(xenos_id: str) -> dict:
             ...
     """
 
@@ -177,28 +1379,8 @@ def cached(ttl: int = 300, key_builder: Optional[Callable[..., str]] = None):
             else:
                 k = f"{func.__name__}:{':'.join(str(a) for a in args)}"
 
-            full_key = cache_key(k)
-
-            # 尝试从缓存获取
-            cache = get_cache()
-            cached_value = cache.get(full_key)
-            if cached_value is not None:
-                try:
-                    return json.loads(cached_value)
-                except json.JSONDecodeError:
-                    pass
-
-            # 执行函数
-            result = await func(*args, **kwargs)
-
-            # 缓存结果
-            if result is not None:
-                try:
-                    cache.set(full_key, json.dumps(result), ttl)
-                except (TypeError, json.JSONDecodeError):
-                    pass
-
-            return result
+            tags = tags_builder(*args, **kwargs) if tags_builder else ()
+            return await fetch_cached_async(k, lambda: func(*args, **kwargs), ttl, stale_ttl, tags=tags)
 
         return wrapper  # type: ignore
 
@@ -206,25 +1388,242 @@ def cached(ttl: int = 300, key_builder: Optional[Callable[..., str]] = None):
 
 
 # 便捷函数
+def _fresh_value(entry: Optional[Tuple[Any, Optional[float], float]]) -> Optional[dict]:
+    """只返回未过期的值"""
+    if entry is None:
+        return None
+    value, expires_at, _ = entry
+    if expires_at is not None and time.time() >= expires_at:
+        return None
+    return value
+
+
 def get_cached(key: str) -> Optional[dict]:
-    """获取缓存的字典"""
+    """获取缓存的字典（已过期的旧值视为未命中）"""
     cache = get_cache()
-    value = cache.get(cache_key(key))
-    if value:
-        try:
-            return json.loads(value)
-        except json.JSONDecodeError:
-            pass
-    return None
+    return _fresh_value(cache.get_entry(cache_key(key)))
+
+
+async def get_cached_async(key: str) -> Optional[dict]:
+    """获取缓存的字典（异步版本）"""
+    cache = get_cache()
+    return _fresh_value(await cache.aget_entry(cache_key(key)))
+
+
+def get_many_cached(keys: List[str]) -> List[Optional[dict]]:
+    """批量获取缓存的字典（一次 multi-get），结果与 keys 一一对应"""
+    cache = get_cache()
+    return [_fresh_value(entry) for entry in cache.get_entries([cache_key(key) for key in keys])]
+
+
+async def get_many_cached_async(keys: List[str]) -> List[Optional[dict]]:
+    """批量获取缓存的字典（异步版本）"""
+    cache = get_cache()
+    return [_fresh_value(entry) for entry in await cache.aget_entries([cache_key(key) for key in keys])]
+
+
+def set_cached(
+    key: str,
+    value: dict,
+    ttl: Optional[int] = None,
+    stale_ttl: int = 0,
+    tags: Sequence[str] = ()
+) -> None:
+    """
+    设置缓存
+
+    Args:
+        key: 缓存键（不含全局前缀）
+        value: 值
+        ttl: 逻辑过期时间（秒）
+        stale_ttl: 过期后仍可由 fetch_cached 返回旧值的时长（秒）
+        tags: 条目所属的标签（见 invalidate_tag）
+    """
+    cache = get_cache()
+    cache.set(cache_key(key), _encode_entry(value, ttl, 0.0), (ttl + stale_ttl) if ttl else ttl, _tag_keys(tags))
 
 
-def set_cached(key: str, value: dict, ttl: Optional[int] = None) -> None:
-    """设置缓存"""
+async def set_many_cached_async(
+    items: List[Tuple[str, dict]],
+    ttl: Optional[int] = None,
+    stale_ttl: int = 0,
+    tags: Optional[Dict[str, Sequence[str]]] = None
+) -> None:
+    """批量设置缓存（一次 pipeline），参数同 set_cached，tags 按键（不含全局前缀）指定标签"""
     cache = get_cache()
-    cache.set(cache_key(key), json.dumps(value), ttl)
+    await cache.aset_many(
+        [
+            (cache_key(key), _encode_entry(value, ttl, 0.0), (ttl + stale_ttl) if ttl else ttl)
+            for key, value in items
+        ],
+        {cache_key(key): _tag_keys(key_tags) for key, key_tags in (tags or {}).items()}
+    )
 
 
 def delete_cached(key: str) -> None:
     """删除缓存"""
     cache = get_cache()
     cache.delete(cache_key(key))
+
+
+class CachedResponse:
+    """缓存的接口响应（已编码的响应体）"""
+
+    __slots__ = ("body", "media_type", "etag")
+
+    def __init__(self, body: bytes, media_type: str, etag: str):
+        self.body = body
+        self.media_type = media_type
+        self.etag = etag
+
+
+async def get_cached_response_async(key: str) -> Optional[CachedResponse]:
+    """
+    读取缓存的响应体（直接返回字节，不做反序列化）
+
+    Args:
+        key: 缓存键（不含全局前缀）
+    """
+    raw = await get_cache().aget(cache_key(key))
+    if not raw or raw[:1] != _RESPONSE_MARKER:
+        return None
+
+    etag, media_type, body = raw[1:].split(b"\n", 2)
+    return CachedResponse(body, media_type.decode(), etag.decode())
+
+
+async def set_cached_response_async(
+    key: str,
+    body: bytes,
+    media_type: str,
+    ttl: Optional[int] = None,
+    etag: Optional[str] = None,
+    tags: Sequence[str] = ()
+) -> CachedResponse:
+    """
+    缓存已编码的响应体
+
+    Args:
+        key: 缓存键（不含全局前缀）
+        body: 响应体
+        media_type: 媒体类型
+        ttl: 过期时间（秒）
+        etag: ETag（默认取响应体摘要）
+        tags: 条目所属的标签（见 invalidate_tag）
+    """
+    etag = etag or f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+    response = CachedResponse(body, media_type, etag)
+    raw = b"\n".join((response.etag.encode(), media_type.encode(), body))
+    await get_cache().aset(cache_key(key), _RESPONSE_MARKER + raw, ttl, _tag_keys(tags))
+    return response
+
+
+def agent_tag(xenos_id: str) -> str:
+    """Agent 相关缓存条目（信誉、响应体等）共用的标签"""
+    return f"agent:{xenos_id}"
+
+
+def invalidate_tag(tag: str) -> int:
+    """
+    删除带有该标签的所有缓存条目（如 agent_tag(xenos_id) 删除该 Agent 的全部缓存）
+
+    Returns:
+        删除的条目数
+    """
+    return len(get_cache().invalidate_tags([tag_key(tag)]))
+
+
+async def invalidate_tags_async(tags: Iterable[str]) -> int:
+    """删除带有任一标签的所有缓存条目（异步版本）"""
+    return len(await get_cache().ainvalidate_tags(_tag_keys(list(dict.fromkeys(tags)))))
+
+
+def reputation_cache_key(xenos_id: str, context: Optional[str] = None) -> str:
+    """信誉缓存键（不含全局前缀）"""
+    return f"rep:{xenos_id}:{context or 'all'}"
+
+
+def reputation_response_key(xenos_id: str, context: Optional[str] = None, view: str = "full") -> str:
+    """信誉接口响应体缓存键（不含全局前缀），view 取值见 RESPONSE_VIEWS"""
+    return f"resp:{reputation_cache_key(xenos_id, context)}:{view}"
+
+
+def agent_version_key(xenos_id: str) -> str:
+    """Agent 数据版本号的缓存键（不含全局前缀）"""
+    return f"ver:{xenos_id}"
+
+
+def _raw_agent_version(cache: CacheBackend, xenos_id: str) -> Optional[bytes]:
+    """读取 Agent 数据版本号的原始值（不存在时不创建），只用于比较是否变化"""
+    return cache.get(cache_key(agent_version_key(xenos_id)))
+
+
+async def _raw_agent_version_async(cache: CacheBackend, xenos_id: str) -> Optional[bytes]:
+    """读取 Agent 数据版本号的原始值（异步版本）"""
+    return await cache.aget(cache_key(agent_version_key(xenos_id)))
+
+
+async def agent_version_token_async(xenos_id: str) -> Optional[bytes]:
+    """读取 Agent 数据版本号的原始值，作为 refresh_cached_async 的 since 参数（不存在时不创建）"""
+    return await _raw_agent_version_async(get_cache(), xenos_id)
+
+
+def _version_seed() -> int:
+    """
+    版本号起始值（微秒时间戳）
+
+    计数器过期或被淘汰后重新起始时大于此前发出的所有版本号，客户端持有的旧 ETag 不会被误判为最新
+    """
+    return time.time_ns() // 1000
+
+
+async def get_agent_version_async(xenos_id: str) -> int:
+    """读取 Agent 的数据版本号（trace 写入完成后递增）"""
+    cache = get_cache()
+    key = cache_key(agent_version_key(xenos_id))
+
+    raw = await cache.aget(key)
+    if raw:
+        try:
+            return int(raw)
+        except ValueError:
+            pass
+    return await cache.aincr(key, _version_seed(), VERSION_TTL)
+
+
+def bump_agent_version(xenos_id: str) -> int:
+    """递增 Agent 的数据版本号（trace 写入并失效缓存后调用）"""
+    return get_cache().incr(cache_key(agent_version_key(xenos_id)), _version_seed(), VERSION_TTL)
+
+
+async def bump_agent_versions_async(xenos_ids: Iterable[str]) -> None:
+    """递增多个 Agent 的数据版本号（异步版本）"""
+    cache = get_cache()
+    await asyncio.gather(*(
+        cache.aincr(cache_key(agent_version_key(xenos_id)), _version_seed(), VERSION_TTL)
+        for xenos_id in dict.fromkeys(xenos_ids)
+    ))
+
+
+def mark_agent_changed(xenos_id: str) -> None:
+    """
+    trace 写入完成后使 Agent 的缓存失效并递增数据版本号（ETag）
+
+    顺序：按 agent_tag 失效 -> 递增版本号 -> 再失效一次
+    - 第一次失效在递增之前：新 ETag 不会与失效前的旧信誉、旧响应体配对
+    - 写入前开始的计算在写回前后检查版本号（见 _store_computed），递增之后的写回被放弃或删除；
+      检查通过、在递增之前写回的条目由第二次失效删除
+    """
+    tag = agent_tag(xenos_id)
+    invalidate_tag(tag)
+    bump_agent_version(xenos_id)
+    invalidate_tag(tag)
+
+
+async def mark_agents_changed_async(xenos_ids: Iterable[str]) -> None:
+    """trace 写入完成后使多个 Agent 的缓存失效并递增数据版本号（异步版本，顺序同 mark_agent_changed）"""
+    xenos_ids = list(dict.fromkeys(xenos_ids))
+    tags = [agent_tag(xenos_id) for xenos_id in xenos_ids]
+    await invalidate_tags_async(tags)
+    await bump_agent_versions_async(xenos_ids)
+    await invalidate_tags_async(tags)
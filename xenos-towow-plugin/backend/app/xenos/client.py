@@ -0,0 +1,250 @@
+"""
+Xenos 上游 HTTP 客户端
+应用级共享连接池，供 trace / identity 等服务调用 Xenos API
+
+连接池由 FastAPI lifespan 创建和释放（见 app.main），配置项：
+- XENOS_HTTP_MAX_CONNECTIONS: 最大连接数
+- XENOS_HTTP_MAX_KEEPALIVE: 最大保活连接数
+- XENOS_HTTP_KEEPALIVE_EXPIRY: 保活连接过期时间（秒）
+- XENOS_HTTP_TIMEOUT: 请求超时（秒）
+- XENOS_HTTP2: 是否启用 HTTP/2（需要安装 h2）
+"""
+
+import logging
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+import httpx
+
+from .resilience import UpstreamUnavailable, get_upstream_guard
+
+logger = logging.getLogger(__name__)
+
+# 连接池默认配置
+HTTP_POOL_DEFAULTS: Dict[str, Any] = {
+    "max_connections": 100,
+    "max_keepalive_connections": 20,
+    "keepalive_expiry": 30.0,
+    "timeout": 5.0,
+    "http2": True,
+}
+
+_options: Dict[str, Any] = dict(HTTP_POOL_DEFAULTS)
+_client_kwargs: Optional[Dict[str, Any]] = None
+
+# 应用级共享客户端（lifespan 中创建）
+_async_client: Optional[httpx.AsyncClient] = None
+_sync_client: Optional[httpx.Client] = None
+
+
+# 当前上游调用收到的响应状态码（由响应钩子记录，调用结束时交给熔断器判断 5xx）
+_call_statuses: ContextVar[Optional[List[int]]] = ContextVar("xenos_upstream_statuses", default=None)
+
+
+def _track_status(response: httpx.Response) -> None:
+    statuses = _call_statuses.get()
+    if statuses is not None:
+        statuses.append(response.status_code)
+
+
+async def _track_status_async(response: httpx.Response) -> None:
+    _track_status(response)
+
+
+def _new_async_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(**_get_client_kwargs(), event_hooks={"response": [_track_status_async]})
+
+
+def _new_sync_client() -> httpx.Client:
+    return httpx.Client(**_get_client_kwargs(), event_hooks={"response": [_track_status]})
+
+
+def _get_client_kwargs() -> Dict[str, Any]:
+    """根据当前配置生成 httpx 客户端参数"""
+    global _client_kwargs
+
+    if _client_kwargs is not None:
+        return _client_kwargs
+
+    http2 = bool(_options["http2"])
+    if http2:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            logger.warning("[HTTP] h2 package not installed, falling back to HTTP/1.1")
+            http2 = False
+
+    _client_kwargs = {
+        "limits": httpx.Limits(
+            max_connections=_options["max_connections"],
+            max_keepalive_connections=_options["max_keepalive_connections"],
+            keepalive_expiry=_options["keepalive_expiry"],
+        ),
+        "timeout": httpx.Timeout(_options["timeout"]),
+        "http2": http2,
+    }
+    return _client_kwargs
+
+
+def init_http_clients(**options: Any) -> httpx.AsyncClient:
+    """
+    创建应用级共享连接池
+
+    Args:
+        **options: 覆盖 HTTP_POOL_DEFAULTS 中的配置项
+
+    Returns:
+        共享的 AsyncClient
+    """
+    global _async_client, _sync_client, _client_kwargs
+
+    _options.update({k: v for k, v in options.items() if v is not None})
+    _client_kwargs = None
+
+    kwargs = _get_client_kwargs()
+    _async_client = _new_async_client()
+    _sync_client = _new_sync_client()
+
+    logger.info(
+        f"[HTTP] Upstream pool ready (max_connections={_options['max_connections']}, "
+        f"keepalive={_options['max_keepalive_connections']}, http2={kwargs['http2']})"
+    )
+    return _async_client
+
+
+async def close_http_clients() -> None:
+    """关闭共享连接池"""
+    global _async_client, _sync_client
+
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+    if _sync_client is not None:
+        _sync_client.close()
+        _sync_client = None
+
+
+def get_async_client() -> Optional[httpx.AsyncClient]:
+    """获取共享 AsyncClient（未初始化时返回 None）"""
+    return _async_client
+
+
+def get_sync_client() -> Optional[httpx.Client]:
+    """获取共享同步 Client（未初始化时返回 None）"""
+    return _sync_client
+
+
+@asynccontextmanager
+async def async_upstream_client() -> AsyncIterator[httpx.AsyncClient]:
+    """
+    获取上游异步客户端
+
+    优先复用共享连接池；未经 lifespan 初始化时（脚本、单元测试）退化为临时客户端。
+    每次调用都经过熔断器和舱壁，被拒绝时抛出 UpstreamUnavailable；
+    调用结束时按异常和最后一个响应的状态码（5xx）记录熔断结果。
+    """
+    guard = get_upstream_guard()
+    guard.acquire()
+    statuses: List[int] = []
+    token = _call_statuses.set(statuses)
+
+    try:
+        if _async_client is not None:
+            yield _async_client
+        else:
+            async with _new_async_client() as client:
+                yield client
+    except BaseException as e:
+        guard.release(e, statuses[-1] if statuses else None)
+        raise
+    else:
+        guard.release(status_code=statuses[-1] if statuses else None)
+    finally:
+        _call_statuses.reset(token)
+
+
+@contextmanager
+def upstream_client() -> Iterator[httpx.Client]:
+    """获取上游同步客户端（规则同 async_upstream_client）"""
+    guard = get_upstream_guard()
+    guard.acquire()
+    statuses: List[int] = []
+    token = _call_statuses.set(statuses)
+
+    try:
+        if _sync_client is not None:
+            yield _sync_client
+        else:
+            with _new_sync_client() as client:
+                yield client
+    except BaseException as e:
+        guard.release(e, statuses[-1] if statuses else None)
+        raise
+    else:
+        guard.release(status_code=statuses[-1] if statuses else None)
+    finally:
+        _call_statuses.reset(token)
+
+
+class UpstreamRequest:
+    """
+    一次上游调用：请求参数 + 响应解析
+
+    同步 / 异步入口共用同一个请求对象，只有发送（send_upstream / send_upstream_async）不同
+    """
+
+    __slots__ = ("method", "url", "parse", "kwargs")
+
+    def __init__(
+        self,
+        method: str,
+        url: str,
+        parse: Optional[Callable[[httpx.Response], Any]] = None,
+        **kwargs: Any
+    ):
+        self.method = method
+        self.url = url
+        self.parse = parse or response_data
+        # 透传给 httpx 的参数（json / params 等）
+        self.kwargs = kwargs
+
+
+def response_data(response: httpx.Response) -> Optional[Any]:
+    """上游 200 响应体中的 data 字段，其他状态码返回 None"""
+    if response.status_code == 200:
+        return response.json()["data"]
+    return None
+
+
+def send_upstream(request: UpstreamRequest) -> Optional[Any]:
+    """
+    发送上游请求并解析响应
+
+    熔断 / 舱壁拒绝按请求频率发生，只记 debug 日志（熔断状态切换由 CircuitBreaker 记录一次）
+
+    Returns:
+        解析结果；上游不可用、请求失败或解析失败时返回 None，由调用方走本地兜底
+    """
+    try:
+        with upstream_client() as client:
+            return request.parse(client.request(request.method, request.url, **request.kwargs))
+    except UpstreamUnavailable as e:
+        logger.debug(f"[HTTP] Xenos API {request.method} {request.url} skipped: {e}")
+        return None
+    except Exception as e:
+        logger.warning(f"[HTTP] Xenos API {request.method} {request.url} failed: {e}")
+        return None
+
+
+async def send_upstream_async(request: UpstreamRequest) -> Optional[Any]:
+    """发送上游请求并解析响应（异步版本，规则同 send_upstream）"""
+    try:
+        async with async_upstream_client() as client:
+            return request.parse(await client.request(request.method, request.url, **request.kwargs))
+    except UpstreamUnavailable as e:
+        logger.debug(f"[HTTP] Xenos API {request.method} {request.url} skipped: {e}")
+        return None
+    except Exception as e:
+        logger.warning(f"[HTTP] Xenos API {request.method} {request.url} failed: {e}")
+        return None
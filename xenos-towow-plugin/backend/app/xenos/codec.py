@@ -0,0 +1,169 @@
+"""
+Xenos 缓存值编解码
+缓存层写入前把值序列化为字节，读取后还原
+
+存储格式：1 字节头 + 负载
+- 头的低 7 位为序列化格式（1 = JSON，2 = MessagePack），最高位表示负载经 zlib 压缩
+- 不带头的值（首字节为 JSON 文本字符）按旧版 JSON 文本读取，升级后无需清空缓存
+- 遇到未知的头（更新版本写入的格式）时解码失败，调用方按未命中处理并用当前格式写回
+
+环境变量：
+- CACHE_SERIALIZER: json / msgpack（默认 json；安装了 orjson 时 JSON 由 orjson 编解码）
+- CACHE_COMPRESS_MIN_BYTES: 序列化结果超过该字节数时压缩（默认 1024，0 表示不压缩）
+"""
+
+import json
+import logging
+import os
+import zlib
+from typing import Any, Callable, Dict, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    # 可选依赖：未安装时 JSON 使用标准库编解码
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    # 可选依赖：未安装时不支持 MessagePack 格式
+    msgpack = None
+
+# 序列化格式（写入头的低 7 位）
+FORMAT_JSON = 0x01
+FORMAT_MSGPACK = 0x02
+
+# 压缩标记（头的最高位）
+FLAG_ZLIB = 0x80
+
+# zlib 压缩级别：缓存写入在请求路径上，优先速度
+COMPRESS_LEVEL = 1
+
+
+def _json_dumps(value: Any) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # orjson 不支持的值（如超过 64 位的整数）交给标准库处理
+            pass
+    return json.dumps(value, separators=(",", ":")).encode()
+
+
+def _json_loads(payload: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(payload)
+    return json.loads(payload)
+
+
+def _msgpack_dumps(value: Any) -> bytes:
+    return msgpack.packb(value, use_bin_type=True)
+
+
+def _msgpack_loads(payload: bytes) -> Any:
+    return msgpack.unpackb(payload, raw=False, strict_map_key=False)
+
+
+# 格式 -> (序列化, 反序列化)
+_FORMATS: Dict[int, Tuple[Callable[[Any], bytes], Callable[[bytes], Any]]] = {
+    FORMAT_JSON: (_json_dumps, _json_loads),
+}
+if msgpack is not None:
+    _FORMATS[FORMAT_MSGPACK] = (_msgpack_dumps, _msgpack_loads)
+
+_SERIALIZERS = {
+    "json": FORMAT_JSON,
+    "msgpack": FORMAT_MSGPACK,
+}
+
+
+class CacheCodec:
+    """缓存值编解码器"""
+
+    def __init__(self, serializer: str = "json", compress_min_bytes: int = 1024):
+        fmt = _SERIALIZERS.get(serializer)
+        if fmt is None:
+            raise ValueError(f"Unknown cache serializer: {serializer}")
+        if fmt not in _FORMATS:
+            logger.warning(f"[Cache] {serializer} package not installed, using json")
+            fmt = FORMAT_JSON
+
+        self.format = fmt
+        self.compress_min_bytes = compress_min_bytes
+        self._dumps = _FORMATS[fmt][0]
+
+    def dumps(self, value: Any) -> bytes:
+        """
+        序列化（超过阈值且压缩后更小时压缩）
+
+        Raises:
+            TypeError / ValueError: 值无法序列化
+        """
+        payload = self._dumps(value)
+        header = self.format
+
+        if 0 < self.compress_min_bytes <= len(payload):
+            compressed = zlib.compress(payload, COMPRESS_LEVEL)
+            if len(compressed) < len(payload):
+                payload = compressed
+                header |= FLAG_ZLIB
+
+        return bytes((header,)) + payload
+
+    @staticmethod
+    def loads(raw: Union[bytes, str]) -> Any:
+        """
+        反序列化（任意已知格式及不带头的旧版 JSON 文本）
+
+        Raises:
+            ValueError: 数据损坏或格式未知
+        """
+        if isinstance(raw, str):
+            raw = raw.encode()
+        if not raw:
+            raise ValueError("Empty cache value")
+
+        header = raw[0]
+        if 0x20 <= header < 0x80 or header in b"\t\n\r":
+            return json.loads(raw)
+
+        formats = _FORMATS.get(header & ~FLAG_ZLIB)
+        if formats is None:
+            raise ValueError(f"Unknown cache value header: {header:#04x}")
+
+        payload = raw[1:]
+        try:
+            if header & FLAG_ZLIB:
+                payload = zlib.decompress(payload)
+            return formats[1](payload)
+        except ValueError:
+            raise
+        except Exception as e:
+            raise ValueError(f"Corrupt cache value: {e}") from e
+
+
+# 全局编解码器实例
+_codec: Optional[CacheCodec] = None
+
+
+def get_codec() -> CacheCodec:
+    """获取编解码器实例（首次使用时按环境变量创建）"""
+    global _codec
+
+    if _codec is None:
+        _codec = CacheCodec(
+            serializer=os.getenv("CACHE_SERIALIZER", "json").lower(),
+            compress_min_bytes=int(os.getenv("CACHE_COMPRESS_MIN_BYTES", "1024"))
+        )
+    return _codec
+
+
+def configure_codec(serializer: str = "json", compress_min_bytes: int = 1024) -> CacheCodec:
+    """按配置重建编解码器实例"""
+    global _codec
+
+    _codec = CacheCodec(serializer, compress_min_bytes)
+    return _codec
@@ -5,14 +5,131 @@ from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.backends import default_backend
 from cryptography.exceptions import InvalidSignature
 import base58
-import httpx
 from typing import Optional, Dict, Any
 from datetime import datetime
 
+from .client import UpstreamRequest, response_data, send_upstream, send_upstream_async
+
 
 XENOS_API_BASE = "http://localhost:3000/api/v1"
 
 
+def _existing_agent_result(existing_xenos_id: str, data: Optional[Dict[str, Any]] = None) -> dict:
+    """构造已存在 Agent 的查询结果（data 为上游响应的 data 字段，服务不可用时为空）"""
+    if data is not None:
+        return {
+            "agentId": data.get("agentId", ""),
+            "xenosId": existing_xenos_id,
+            "privateKey": "",  # 不返回私钥
+            "didDocument": data.get("didDocument", {})
+        }
+
+    return {
+        "agentId": "",
+        "xenosId": existing_xenos_id,
+        "privateKey": "",
+        "didDocument": {}
+    }
+
+
+def _create_identity(agent_name: str) -> tuple:
+    """
+    生成 Ed25519 密钥对和 DID 文档
+
+    Returns:
+        (private_key, xenos_id, did_document, register_payload)
+    """
+    # 生成 Ed25519 密钥对
+    private_key = ed25519.Ed25519PrivateKey.generate()
+    public_key = private_key.public_key()
+
+    # 公钥序列化
+    public_key_bytes = public_key.public_bytes_raw()
+    public_key_hex = public_key_bytes.hex()
+
+    # 编码为 did:key 格式
+    # Multicodec Ed25519-Public key: 0xed01 + public_key (32 bytes)
+    # 参考规范: https://github.com/multiformats/multicodec/blob/master/table.csv
+    multicodec = bytes([0xed, 0x01]) + public_key_bytes
+    # 使用 base58.b58encode（不带校验和），这是 did:key 规范的要求
+    public_key_b58 = base58.b58encode(multicodec)
+    xenos_id = f"did:key:z{public_key_b58.decode('utf-8')}"
+
+    # 构造 DID 文档
+    did_document = {
+        "@context": [
+            "https://www.w3.org/ns/did/v1",
+            "https://w3id.org/security/v2"
+        ],
+        "id": xenos_id,
+        "type": ["DIDDocument", "VerifiableCredential"],
+        "verificationMethod": [
+            {
+                "id": f"{xenos_id}#key-1",
+                "type": "Ed25519VerificationKey2020",
+                "controller": xenos_id,
+                "publicKeyJwk": {
+                    "kty": "OKP",
+                    "crv": "Ed25519",
+                    "x": public_key_hex
+                },
+                "publicKeyMultibase": f"z{public_key_b58.decode('utf-8')}"
+            }
+        ],
+        "authentication": [f"{xenos_id}#key-1"],
+        "assertionMethod": [f"{xenos_id}#key-1"]
+    }
+
+    register_payload = {
+        "agentName": agent_name or f"Agent-{xenos_id[:8]}",
+        "agentType": "towow-agent",
+        "capabilities": ["negotiation", "task-execution", "communication"]
+    }
+
+    return private_key, xenos_id, did_document, register_payload
+
+
+def _new_identity_result(
+    private_key: Any,
+    xenos_id: str,
+    did_document: Dict[str, Any],
+    data: Optional[Dict[str, Any]] = None
+) -> dict:
+    """构造新生成身份的返回结果（data 为注册响应的 data 字段，服务不可用时为空）"""
+    if data is not None:
+        return {
+            "agentId": data.get("agentId", ""),
+            "xenosId": xenos_id,
+            "privateKey": private_key.private_bytes_raw().hex(),
+            "didDocument": did_document
+        }
+
+    # 如果 Xenos 服务不可用，返回本地生成的 ID
+    return {
+        "agentId": "",
+        "xenosId": xenos_id,
+        "privateKey": private_key.private_bytes_raw().hex(),
+        "didDocument": did_document,
+        "notice": "Xenos service unavailable, using locally generated ID"
+    }
+
+
+def _agent_request(existing_xenos_id: str) -> UpstreamRequest:
+    """查询已存在 Agent 的上游请求"""
+    return UpstreamRequest("GET", f"{XENOS_API_BASE}/agent/{existing_xenos_id}", _parse_agent_data)
+
+
+def _register_request(register_payload: Dict[str, Any]) -> UpstreamRequest:
+    """注册新 Agent 的上游请求"""
+    return UpstreamRequest("POST", f"{XENOS_API_BASE}/agent/register", _parse_agent_data, json=register_payload)
+
+
+def _parse_agent_data(response: Any) -> Optional[Dict[str, Any]]:
+    """解析上游 Agent 响应，非 200 或格式不符时返回 None（按服务不可用处理）"""
+    data = response_data(response)
+    return data if isinstance(data, dict) else None
+
+
 def generate_xenos_id(agent_name: str = "", existing_xenos_id: str = "") -> dict:
     """
     生成或获取 Xenos ID
@@ -27,97 +144,31 @@ def generate_xenos_id(agent_name: str = "", existing_xenos_id: str = "") -> dict
 
     if existing_xenos_id:
         # 查询已存在的 Agent
-        try:
-            with httpx.Client() as client:
-                response = client.get(f"{XENOS_API_BASE}/agent/{existing_xenos_id}")
-                if response.status_code == 200:
-                    data = response.json()
-                    return {
-                        "agentId": data["data"].get("agentId", ""),
-                        "xenosId": existing_xenos_id,
-                        "privateKey": "",  # 不返回私钥
-                        "didDocument": data["data"].get("didDocument", {})
-                    }
-        except:
-            pass
-
-        return {
-            "agentId": "",
-            "xenosId": existing_xenos_id,
-            "privateKey": "",
-            "didDocument": {}
-        }
+        return _existing_agent_result(existing_xenos_id, send_upstream(_agent_request(existing_xenos_id)))
 
     # 生成新的 Xenos ID
     try:
-        # 生成 Ed25519 密钥对
-        private_key = ed25519.Ed25519PrivateKey.generate()
-        public_key = private_key.public_key()
-
-        # 公钥序列化
-        public_key_bytes = public_key.public_bytes_raw()
-        public_key_hex = public_key_bytes.hex()
-
-        # 编码为 did:key 格式
-        # Multicodec Ed25519-Public key: 0xed01 + public_key (32 bytes)
-        # 参考规范: https://github.com/multiformats/multicodec/blob/master/table.csv
-        multicodec = bytes([0xed, 0x01]) + public_key_bytes
-        # 使用 base58.b58encode（不带校验和），这是 did:key 规范的要求
-        public_key_b58 = base58.b58encode(multicodec)
-        xenos_id = f"did:key:z{public_key_b58.decode('utf-8')}"
-
-        # 构造 DID 文档
-        did_document = {
-            "@context": [
-                "https://www.w3.org/ns/did/v1",
-                "https://w3id.org/security/v2"
-            ],
-            "id": xenos_id,
-            "type": ["DIDDocument", "VerifiableCredential"],
-            "verificationMethod": [
-                {
-                    "id": f"{xenos_id}#key-1",
-                    "type": "Ed25519VerificationKey2020",
-                    "controller": xenos_id,
-                    "publicKeyJwk": {
-                        "kty": "OKP",
-                        "crv": "Ed25519",
-                        "x": public_key_hex
-                    },
-                    "publicKeyMultibase": f"z{public_key_b58.decode('utf-8')}"
-                }
-            ],
-            "authentication": [f"{xenos_id}#key-1"],
-            "assertionMethod": [f"{xenos_id}#key-1"]
-        }
+        private_key, xenos_id, did_document, register_payload = _create_identity(agent_name)
 
         # 尝试注册到 Xenos 服务
-        try:
-            with httpx.Client() as client:
-                response = client.post(f"{XENOS_API_BASE}/agent/register", json={
-                    "agentName": agent_name or f"Agent-{xenos_id[:8]}",
-                    "agentType": "towow-agent",
-                    "capabilities": ["negotiation", "task-execution", "communication"]
-                })
-                if response.status_code == 200:
-                    data = response.json()
-                    return {
-                        "agentId": data["data"].get("agentId", ""),
-                        "xenosId": xenos_id,
-                        "privateKey": private_key.private_bytes_raw().hex(),
-                        "didDocument": did_document
-                    }
-        except:
-            pass
-
-        # 如果 Xenos 服务不可用，返回本地生成的 ID
-        return {
-            "agentId": "",
-            "xenosId": xenos_id,
-            "privateKey": private_key.private_bytes_raw().hex(),
-            "didDocument": did_document,
-            "notice": "Xenos service unavailable, using locally generated ID"
-        }
+        data = send_upstream(_register_request(register_payload))
+        return _new_identity_result(private_key, xenos_id, did_document, data)
+
+    except Exception as e:
+        raise Exception(f"Xenos ID generation failed: {str(e)}")
+
+
+async def generate_xenos_id_async(agent_name: str = "", existing_xenos_id: str = "") -> dict:
+    """生成或获取 Xenos ID（异步版本，参数同 generate_xenos_id）"""
+
+    if existing_xenos_id:
+        return _existing_agent_result(existing_xenos_id, await send_upstream_async(_agent_request(existing_xenos_id)))
+
+    try:
+        private_key, xenos_id, did_document, register_payload = _create_identity(agent_name)
+
+        data = await send_upstream_async(_register_request(register_payload))
+        return _new_identity_result(private_key, xenos_id, did_document, data)
 
     except Exception as e:
         raise Exception(f"Xenos ID generation failed: {str(e)}")
@@ -284,37 +335,53 @@ def get_agent_reputation(xenos_id: str, context: Optional[str] = None) -> dict:
 
     except Exception as e:
         # 如果信誉服务不可用，返回模拟数据
-        return {
-            "xenosId": xenos_id,
-            "agentName": "Demo Agent",
-            "overallScore": 850,
-            "contexts": [
-                {
-                    "context": "negotiation",
-                    "contextName": "协商",
-                    "fulfillmentRate": 0.92,
-                    "fulfilledCount": 46,
-                    "failedCount": 4,
-                    "total": 50,
-                    "score": 920,
-                    "confidence": "high"
-                },
-                {
-                    "context": "task_execution",
-                    "contextName": "任务执行",
-                    "fulfillmentRate": 0.88,
-                    "fulfilledCount": 35,
-                    "failedCount": 5,
-                    "total": 40,
-                    "score": 880,
-                    "confidence": "medium"
-                }
-            ],
-            "details": {
-                "fulfillmentRate": 0.90,
-                "fulfilledCount": 81,
-                "failedCount": 9,
-                "totalCount": 90
+        return _demo_reputation(xenos_id)
+
+
+async def get_agent_reputation_async(xenos_id: str, context: Optional[str] = None) -> dict:
+    """获取 Agent 场景化信誉（异步版本）"""
+    try:
+        from .reputation import calculate_agent_reputation_async
+
+        return await calculate_agent_reputation_async(xenos_id, context)
+
+    except Exception as e:
+        return _demo_reputation(xenos_id)
+
+
+def _demo_reputation(xenos_id: str) -> dict:
+    """信誉服务不可用时的模拟数据"""
+    return {
+        "xenosId": xenos_id,
+        "agentName": "Demo Agent",
+        "overallScore": 850,
+        "contexts": [
+            {
+                "context": "negotiation",
+                "contextName": "协商",
+                "fulfillmentRate": 0.92,
+                "fulfilledCount": 46,
+                "failedCount": 4,
+                "total": 50,
+                "score": 920,
+                "confidence": "high"
             },
-            "timestamp": datetime.now().isoformat()
-        }
+            {
+                "context": "task_execution",
+                "contextName": "任务执行",
+                "fulfillmentRate": 0.88,
+                "fulfilledCount": 35,
+                "failedCount": 5,
+                "total": 40,
+                "score": 880,
+                "confidence": "medium"
+            }
+        ],
+        "details": {
+            "fulfillmentRate": 0.90,
+            "fulfilledCount": 81,
+            "failedCount": 9,
+            "totalCount": 90
+        },
+        "timestamp": datetime.now().isoformat()
+    }
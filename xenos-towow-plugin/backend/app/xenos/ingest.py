@@ -0,0 +1,182 @@
+"""
+Xenos Trace 写入队列
+Write-behind 批量写入：请求线程只负责入队，后台任务按批量大小或时间间隔向上游批量提交
+
+配置项（见 app.main.Settings）：
+- TRACE_QUEUE_ENABLED: 是否启用写入队列
+- TRACE_QUEUE_BATCH_SIZE: 单批最大条数
+- TRACE_QUEUE_FLUSH_INTERVAL: 最长刷新间隔（秒）
+- TRACE_QUEUE_MAX_PENDING: 队列最大积压条数（超出后由调用方直接落本地）
+"""
+
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 批量提交函数：接收一批待写入记录
+FlushFunc = Callable[[List[Any]], Awaitable[None]]
+
+
+class TraceIngestQueue:
+    """有界 write-behind 写入队列（绑定到创建它的事件循环）"""
+
+    def __init__(
+        self,
+        flush: FlushFunc,
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+        max_pending: int = 10000
+    ):
+        self._flush = flush
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_pending = max(1, max_pending)
+
+        self._pending: Deque[Any] = deque()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+        self._stats = {
+            "submitted": 0,
+            "flushed": 0,
+            "batches": 0,
+            "rejected": 0,
+            "errors": 0,
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._closing
+
+    def submit(self, record: Any) -> bool:
+        """
+        入队一条记录（不阻塞；可在事件循环之外的线程调用，如同步接口所在的线程池）
+
+        Returns:
+            是否入队成功；队列已满或已停止时返回 False，由调用方自行兜底
+        """
+        if not self.running or len(self._pending) >= self.max_pending:
+            self._stats["rejected"] += 1
+            return False
+
+        self._pending.append(record)
+        self._stats["submitted"] += 1
+
+        # 达到批量大小立即唤醒刷新
+        if len(self._pending) >= self.batch_size and self._wakeup is not None:
+            self._wake()
+
+        return True
+
+    def _wake(self) -> None:
+        """唤醒刷新任务（asyncio.Event 不是线程安全的，其他线程经事件循环转发）"""
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+
+        if running is self._loop:
+            self._wakeup.set()
+        else:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def start(self) -> None:
+        """启动后台刷新任务"""
+        if self._task is not None:
+            return
+
+        self._closing = False
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            f"[Ingest] Trace queue started (batch_size={self.batch_size}, "
+            f"interval={self.flush_interval}s, max_pending={self.max_pending})"
+        )
+
+    async def stop(self) -> None:
+        """停止后台任务并刷新剩余记录"""
+        if self._task is None:
+            return
+
+        self._closing = True
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+        try:
+            await self._task
+        finally:
+            self._task = None
+
+        # 优雅关闭：刷新剩余记录
+        await self._flush_pending()
+        logger.info(f"[Ingest] Trace queue stopped, flushed {self._stats['flushed']} traces")
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+
+            self._wakeup.clear()
+            await self._flush_pending()
+
+    async def _flush_pending(self) -> None:
+        """按批量大小刷新当前所有积压记录"""
+        while self._pending:
+            batch = [
+                self._pending.popleft()
+                for _ in range(min(self.batch_size, len(self._pending)))
+            ]
+
+            try:
+                await self._flush(batch)
+                self._stats["flushed"] += len(batch)
+                self._stats["batches"] += 1
+            except Exception as e:
+                self._stats["errors"] += 1
+                logger.error(f"[Ingest] Flush error ({len(batch)} traces): {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """队列统计"""
+        return {
+            **self._stats,
+            "pending": len(self._pending),
+            "running": self.running,
+        }
+
+
+# 全局写入队列实例
+_queue: Optional[TraceIngestQueue] = None
+
+
+def get_ingest_queue() -> Optional[TraceIngestQueue]:
+    """获取写入队列（未启动时返回 None）"""
+    return _queue
+
+
+async def start_ingest_queue(flush: FlushFunc, **options: Any) -> TraceIngestQueue:
+    """创建并启动全局写入队列"""
+    global _queue
+
+    if _queue is not None:
+        await _queue.stop()
+
+    _queue = TraceIngestQueue(flush, **options)
+    await _queue.start()
+    return _queue
+
+
+async def stop_ingest_queue() -> None:
+    """停止全局写入队列（刷新剩余记录）"""
+    global _queue
+
+    if _queue is not None:
+        queue, _queue = _queue, None
+        await queue.stop()
@@ -1,12 +1,36 @@
 """Xenos Reputation Service - 场景化信誉计算"""
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 from datetime import datetime, timedelta
+import asyncio
 import math
 import logging
 
 from .context import get_context_service
-from .trace import get_agent_traces
-from .cache import cached, get_cached, set_cached, CACHE_TTL
+from .trace import fetch_upstream_traces, fetch_upstream_traces_async
+from .aggregates import (
+    DECAY_PERIODS,
+    FRAUD_ACTIONS,
+    PERIOD_MAX_DAYS,
+    get_reputation_aggregates,
+    is_context_fraud_trace,
+    is_fraud_trace
+)
+from .cache import (
+    agent_tag,
+    fetch_cached,
+    fetch_cached_async,
+    get_many_cached_async,
+    refresh_cached_async,
+    reputation_cache_key,
+    CACHE_TTL,
+    CACHE_STALE_TTL
+)
+
+try:
+    import numpy as np
+except ImportError:
+    # 可选依赖：未安装时全部走纯 Python 单遍统计
+    np = None
 
 logger = logging.getLogger(__name__)
 
@@ -21,14 +45,138 @@ DECAY_WEIGHTS = {
 # 恶意欺诈永久标记，不参与衰减
 FRAUD_PERMANENT = True
 
-# 恶意行为标记列表
-FRAUD_ACTIONS = [
-    "fraud",
-    "cheat",
-    "malicious",
-    "double_spend",
-    "backtrack"
-]
+# 计算信誉时从上游拉取的 traces 上限：只统计最近的这些记录，更早的记录不参与计算
+REPUTATION_TRACE_LIMIT = 1000
+
+# 批量信誉查询时并发拉取上游 traces 的上限
+BATCH_CONCURRENCY = 10
+
+# traces 数量达到该值且安装了 NumPy 时使用向量化统计
+VECTORIZE_MIN_TRACES = 1000
+
+_DAY_MICROSECONDS = 86400 * 1000000
+
+
+def _parse_timestamp(value: Any) -> Optional[datetime]:
+    """解析 trace 时间；无法解析或带时区（无法与本地时间相减）时返回 None"""
+    try:
+        timestamp = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except Exception:
+        return None
+    return timestamp if timestamp.tzinfo is None else None
+
+
+def _datetime64_column(raw: List[Any], parsed: List[Optional[datetime]], default: datetime) -> Any:
+    """
+    时间列转为 datetime64[us]
+
+    isoformat() 形式的原始字符串直接交给 NumPy 解析（比逐个转换 datetime 对象快得多），
+    其余已解析的记录用 isoformat() 重新格式化，无法解析的记录填充 default；
+    NumPy 无法解析时整体退回重新格式化。
+    """
+    filler = default.isoformat()
+    canonical = [
+        filler if ts is None
+        else value if type(value) is str and value[10:11] == "T" and (
+            len(value) == 19 or (len(value) == 26 and value[19] == ".")
+        )
+        else ts.isoformat()
+        for value, ts in zip(raw, parsed)
+    ]
+
+    try:
+        return np.array(canonical, dtype="datetime64[us]")
+    except ValueError:
+        return np.array([(ts or default).isoformat() for ts in parsed], dtype="datetime64[us]")
+
+
+def _sequential_sum(values: Any) -> float:
+    """按顺序逐项累加（与 Python 逐项求和结果一致，np.sum 的成对求和会有舍入差异）"""
+    return float(np.cumsum(values)[-1]) if values.size else 0.0
+
+
+class TraceStats:
+    """
+    一组 traces 的统计量（信誉结果只依赖这些值）
+
+    加权值按 DECAY_WEIGHTS 计；weighted_count 含时间无法解析的记录（按最小权重），
+    weighted_total 只含可解析的记录（对应 decayApplied.weightedTotal）。
+    """
+
+    __slots__ = (
+        "total", "success", "failed", "fraud", "context_fraud", "by_period",
+        "weighted_success", "weighted_failed", "weighted_count", "weighted_total"
+    )
+
+    def __init__(self):
+        self.total = 0
+        self.success = 0
+        self.failed = 0
+        # 整体判定（恶意行为 / result=fraud / isFraud is True）的欺诈数
+        self.fraud = 0
+        # 上下文判定（result=fraud / isFraud 为真值）的欺诈数
+        self.context_fraud = 0
+        self.by_period = {name: 0 for name in DECAY_PERIODS}
+        self.weighted_success = 0.0
+        self.weighted_failed = 0.0
+        self.weighted_count = 0.0
+        self.weighted_total = 0.0
+
+    def add(
+        self,
+        result: Any,
+        fraud: bool,
+        context_fraud: bool,
+        period: Optional[str],
+        weight: float
+    ) -> None:
+        """累加一条记录（period 为 None 表示时间无法解析）"""
+        self.total += 1
+        if result == "success":
+            self.success += 1
+            self.weighted_success += weight
+        elif result == "failed":
+            self.failed += 1
+            self.weighted_failed += weight
+        self.fraud += fraud
+        self.context_fraud += context_fraud
+        self.weighted_count += weight
+        if period is not None:
+            self.by_period[period] += 1
+            self.weighted_total += weight
+
+    @classmethod
+    def from_aggregate(cls, aggregate: Dict[str, Any]) -> "TraceStats":
+        """由 aggregates 快照换算（各时段计数乘以衰减权重）"""
+        stats = cls()
+        stats.total = aggregate["total"]
+        stats.success = aggregate["success"]
+        stats.failed = aggregate["failed"]
+        stats.fraud = aggregate["fraud"]
+        stats.context_fraud = aggregate["contextFraud"]
+
+        for name, (count, success, failed) in aggregate["byPeriod"].items():
+            weight = DECAY_WEIGHTS[name]
+            stats.by_period[name] = count
+            stats.weighted_success += weight * success
+            stats.weighted_failed += weight * failed
+            stats.weighted_count += weight * count
+        stats.weighted_total = stats.weighted_count
+
+        return stats
+
+    def merge(self, other: "TraceStats") -> None:
+        self.total += other.total
+        self.success += other.success
+        self.failed += other.failed
+        self.fraud += other.fraud
+        self.context_fraud += other.context_fraud
+        for name in DECAY_PERIODS:
+            self.by_period[name] += other.by_period[name]
+        self.weighted_success += other.weighted_success
+        self.weighted_failed += other.weighted_failed
+        self.weighted_count += other.weighted_count
+        self.weighted_total += other.weighted_total
 
 
 class ReputationService:
@@ -54,32 +202,110 @@ class ReputationService:
         Returns:
             信誉分数和详细信息
         """
-        # 获取行为记录
-        traces_result = get_agent_traces(xenos_id, limit=1000)
-        traces = traces_result.get("traces", [])
+        upstream = fetch_upstream_traces(xenos_id, limit=REPUTATION_TRACE_LIMIT)
+        return self.score_upstream(xenos_id, upstream, context, time_window_days)
+
+    async def calculate_reputation_async(
+        self,
+        xenos_id: str,
+        context: Optional[str] = None,
+        time_window_days: int = 90
+    ) -> Dict[str, Any]:
+        """计算 Agent 的场景化信誉（异步版本，参数同 calculate_reputation）"""
+        upstream = await fetch_upstream_traces_async(xenos_id, limit=REPUTATION_TRACE_LIMIT)
+        return self.score_upstream(xenos_id, upstream, context, time_window_days)
+
+    def score_upstream(
+        self,
+        xenos_id: str,
+        upstream: Optional[Dict[str, Any]],
+        context: Optional[str] = None,
+        time_window_days: int = 90
+    ) -> Dict[str, Any]:
+        """
+        基于已拉取的上游 traces 计算信誉（供同时需要 traces 的调用方复用同一次拉取）
+
+        Args:
+            xenos_id: Xenos ID
+            upstream: fetch_upstream_traces 的返回值；None 表示上游不可用，读取本地存储的增量聚合
+            context: 上下文类型（None 表示综合信誉）
+            time_window_days: 时间窗口（天数）
+
+        Returns:
+            信誉分数和详细信息
+        """
+        if upstream is None:
+            return self.score_aggregates(xenos_id, context, time_window_days)
+
+        return self.score_traces(xenos_id, upstream.get("traces", []), context, time_window_days)
+
+    def score_aggregates(
+        self,
+        xenos_id: str,
+        context: Optional[str] = None,
+        time_window_days: int = 90
+    ) -> Dict[str, Any]:
+        """
+        基于本地存储的增量聚合计算信誉（结果与逐条计算本地存储中的记录一致）
+
+        仅用于上游不可用时的兜底：聚合只包含本地存储中的记录（上游不可用时的兜底写入），
+        上游可用时以上游 traces 为准（最多 REPUTATION_TRACE_LIMIT 条）
+
+        Args:
+            xenos_id: Xenos ID
+            context: 上下文类型（None 表示综合信誉）
+            time_window_days: 时间窗口（天数）
+
+        Returns:
+            信誉分数和详细信息
+        """
+        snapshot = get_reputation_aggregates().snapshot(xenos_id) or {}
+
+        overall = TraceStats()
+        contexts: Dict[str, TraceStats] = {}
+        for ctx_id, aggregate in snapshot.items():
+            stats = contexts[ctx_id] = TraceStats.from_aggregate(aggregate)
+            overall.merge(stats)
 
-        # 检查是否有恶意欺诈行为
-        fraud_traces = self._check_fraud_traces(traces)
-        has_fraud = len(fraud_traces) > 0
+        return self.build_reputation(xenos_id, overall, contexts, context, time_window_days)
+
+    def build_reputation(
+        self,
+        xenos_id: str,
+        overall: TraceStats,
+        contexts: Dict[str, TraceStats],
+        context: Optional[str] = None,
+        time_window_days: int = 90
+    ) -> Dict[str, Any]:
+        """
+        由统计量生成信誉结果
 
-        # 使用衰减机制计算整体信誉
-        overall_score = self._calculate_overall_score_with_decay(traces, has_fraud)
+        规则：
+        - 没有记录：初始分数 500
+        - 存在欺诈记录：整体分数归零，含欺诈记录的上下文分数归零
+        - 整体分数 = 加权履约率 × 1000 + 活跃度加成（加权记录数 × 2，上限 100）
+        - 上下文分数 = 加权履约率 × 1000 × 上下文权重；指定上下文时按未加权的记录计算
 
-        # 计算各上下文信誉
-        context_scores = self._calculate_context_scores_with_decay(traces, has_fraud)
+        Args:
+            overall: 全部 traces 的统计量
+            contexts: 各上下文的统计量
+        """
+        has_fraud = overall.fraud > 0
+        overall_score = self._score_from_stats(overall, has_fraud)
 
-        # 如果指定了上下文，返回该上下文的信誉
         if context:
             context_data = self.context_service.get_context(context)
             if context_data:
-                context_traces = [
-                    t for t in traces
-                    if t.get("context") == context
-                ]
-                context_score = self._calculate_context_score_with_decay(context_traces, context_data["weight"], has_fraud)
+                stats = contexts.get(context) or TraceStats()
 
-                # 获取该上下文的欺诈记录
-                context_fraud = [t for t in fraud_traces if t.get("context") == context]
+                # 指定上下文时按未加权的记录计算
+                if not stats.total:
+                    context_score = 500.0
+                elif has_fraud and FRAUD_PERMANENT and stats.context_fraud:
+                    context_score = 0.0
+                else:
+                    rate = self._rate(float(stats.success), float(stats.failed))
+                    context_score = min(max(rate * 1000 * context_data["weight"], 0), 1000)
 
                 return {
                     "xenosId": xenos_id,
@@ -88,261 +314,257 @@ class ReputationService:
                     "score": context_score,
                     "overallScore": overall_score,
                     "details": {
-                        "fulfillmentRate": self._calculate_fulfillment_rate(context_traces),
-                        "fulfilledCount": len([t for t in context_traces if t.get("result") == "success"]),
-                        "failedCount": len([t for t in context_traces if t.get("result") == "failed"]),
-                        "totalCount": len(context_traces),
-                        "recentActivity": len(context_traces),
-                        "confidence": self._calculate_confidence(context_traces),
-                        "hasFraud": len(context_fraud) > 0,
-                        "fraudCount": len(context_fraud),
-                        "decayApplied": self._get_decay_summary(context_traces)
+                        "fulfillmentRate": self._rate(stats.success, stats.failed),
+                        "fulfilledCount": stats.success,
+                        "failedCount": stats.failed,
+                        "totalCount": stats.total,
+                        "recentActivity": stats.total,
+                        "confidence": self._confidence(stats.total),
+                        "hasFraud": stats.fraud > 0,
+                        "fraudCount": stats.fraud,
+                        "decayApplied": self._decay_summary_from_stats(stats)
                     },
                     "timestamp": datetime.now().isoformat()
                 }
 
-        # 返回综合信誉
+        context_scores = []
+        for ctx in self.context_service.list_contexts():
+            stats = contexts.get(ctx["id"])
+            if not stats or not stats.total:
+                continue
+
+            if has_fraud and FRAUD_PERMANENT and stats.context_fraud:
+                score = 0.0
+            else:
+                rate = self._rate(stats.weighted_success, stats.weighted_failed)
+                score = min(max(rate * 1000 * ctx["weight"], 0), 1000)
+
+            context_scores.append({
+                "context": ctx["id"],
+                "contextName": ctx["name"],
+                "score": score,
+                "fulfillmentRate": self._rate(stats.weighted_success, stats.weighted_failed),
+                "fulfilledCount": stats.success,
+                "failedCount": stats.failed,
+                "totalCount": stats.total,
+                "confidence": self._confidence(stats.weighted_count),
+                "hasFraud": stats.context_fraud > 0,
+                "fraudCount": stats.context_fraud
+            })
+
         return {
             "xenosId": xenos_id,
             "overallScore": overall_score,
             "hasFraud": has_fraud,
-            "fraudCount": len(fraud_traces),
+            "fraudCount": overall.fraud,
             "contexts": context_scores,
             "details": {
-                "fulfillmentRate": self._calculate_fulfillment_rate(traces),
-                "fulfilledCount": len([t for t in traces if t.get("result") == "success"]),
-                "failedCount": len([t for t in traces if t.get("result") == "failed"]),
-                "totalCount": len(traces),
+                "fulfillmentRate": self._rate(overall.success, overall.failed),
+                "fulfilledCount": overall.success,
+                "failedCount": overall.failed,
+                "totalCount": overall.total,
                 "timeWindowDays": time_window_days,
-                "decayApplied": self._get_decay_summary(traces)
+                "decayApplied": self._decay_summary_from_stats(overall)
             },
             "timestamp": datetime.now().isoformat()
         }
 
-    def _check_fraud_traces(self, traces: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """检查是否有欺诈行为记录"""
-        return [
-            t for t in traces
-            if t.get("action", "").lower() in [f.lower() for f in FRAUD_ACTIONS]
-            or t.get("result") == "fraud"
-            or t.get("metadata", {}).get("isFraud") is True
-        ]
+    @staticmethod
+    def _rate(success: float, failed: float) -> float:
+        """履约率（没有成功/失败记录时为 0.5）"""
+        total = success + failed
+        if total == 0:
+            return 0.5
+        return success / total
 
-    def _apply_decay_weights(self, traces: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """
-        应用衰减权重到 traces
+    @staticmethod
+    def _confidence(count: float) -> str:
+        if count < 5:
+            return "low"
+        elif count < 20:
+            return "medium"
+        else:
+            return "high"
 
-        衰减规则：
-        - 最近 30 天：权重 1.0
-        - 31-90 天：权重 0.7
-        - 91-180 天：权重 0.4
-        - 180 天以上：权重 0.2
-        - 恶意欺诈：永久标记（已在其他方法处理）
-        """
-        now = datetime.now()
-        weighted_traces = []
+    def _score_from_stats(self, stats: TraceStats, has_fraud: bool) -> float:
+        """整体信誉分数（限制在 0-1000）"""
+        if not stats.total:
+            return 500.0
 
-        for trace in traces:
-            timestamp_str = trace.get("timestamp", "")
-            try:
-                timestamp = datetime.fromisoformat(timestamp_str.replace("Z", "+00:00"))
-                days_ago = (now - timestamp).days
+        if has_fraud and FRAUD_PERMANENT:
+            return 0.0
 
-                # 确定衰减权重
-                if days_ago <= 30:
-                    weight = DECAY_WEIGHTS["recent_30_days"]
-                elif days_ago <= 90:
-                    weight = DECAY_WEIGHTS["days_31_to_90"]
-                elif days_ago <= 180:
-                    weight = DECAY_WEIGHTS["days_91_to_180"]
-                else:
-                    weight = DECAY_WEIGHTS["over_180_days"]
+        base_score = self._rate(stats.weighted_success, stats.weighted_failed) * 1000
+        activity_bonus = min(stats.weighted_count * 2, 100)
+
+        return min(max(base_score + activity_bonus, 0), 1000)
+
+    @staticmethod
+    def _decay_summary_from_stats(stats: TraceStats) -> Dict[str, Any]:
+        return {
+            "totalTraces": stats.total,
+            "byTimePeriod": dict(stats.by_period),
+            "weightedTotal": stats.weighted_total
+        }
+
+    def score_traces(
+        self,
+        xenos_id: str,
+        traces: List[Dict[str, Any]],
+        context: Optional[str] = None,
+        time_window_days: int = 90
+    ) -> Dict[str, Any]:
+        """
+        基于已获取的行为记录计算信誉（纯计算，不访问上游）
+
+        Args:
+            xenos_id: Xenos ID
+            traces: 行为记录列表
+            context: 上下文类型（None 表示综合信誉）
+            time_window_days: 时间窗口（天数）
 
-                weighted_traces.append({**trace, "decayWeight": weight})
-            except:
-                # 时间解析失败，使用最小权重
-                weighted_traces.append({**trace, "decayWeight": DECAY_WEIGHTS["over_180_days"]})
+        Returns:
+            信誉分数和详细信息
+        """
+        if np is not None and len(traces) >= VECTORIZE_MIN_TRACES:
+            overall, contexts = self._accumulate_vectorized(traces)
+        else:
+            overall, contexts = self._accumulate(traces)
 
-        return weighted_traces
+        return self.build_reputation(xenos_id, overall, contexts, context, time_window_days)
 
-    def _calculate_overall_score_with_decay(self, traces: List[Dict[str, Any]], has_fraud: bool) -> float:
+    def _accumulate(
+        self,
+        traces: List[Dict[str, Any]],
+        now: Optional[datetime] = None
+    ) -> Tuple[TraceStats, Dict[Any, TraceStats]]:
         """
-        计算整体信誉分数（含衰减机制）
+        单遍扫描 traces，同时累计整体、各上下文、衰减时段和欺诈统计
 
         衰减规则：
         - 最近 30 天：权重 1.0
         - 31-90 天：权重 0.7
         - 91-180 天：权重 0.4
         - 180 天以上：权重 0.2
-        - 恶意欺诈：永久标记，不参与衰减
-        """
-        if not traces:
-            return 500.0  # 初始分数
-
-        # 欺诈行为直接扣分
-        if has_fraud and FRAUD_PERMANENT:
-            return 0.0  # 有欺诈记录直接归零
-
-        # 将 traces 按时间分组并应用衰减权重
-        weighted_traces = self._apply_decay_weights(traces)
-
-        # 基于加权履约率的分数
-        weighted_fulfillment_rate = self._calculate_weighted_fulfillment_rate(weighted_traces)
-        base_score = weighted_fulfillment_rate * 1000
+        - 时间无法解析：按最小权重计，不计入衰减摘要
+        - 恶意欺诈：永久标记（见 build_reputation）
 
-        # 活跃度加成（使用加权后的数量）
-        activity_bonus = min(sum(w["decayWeight"] for w in weighted_traces) * 2, 100)
+        每条记录的时间戳只解析一次；加权值按记录顺序累加，与逐项求和结果一致。
 
-        # 综合分数
-        total_score = base_score + activity_bonus
-
-        return min(max(total_score, 0), 1000)  # 限制在 0-1000
-
-    def _calculate_context_scores_with_decay(self, traces: List[Dict[str, Any]], has_fraud: bool) -> List[Dict[str, Any]]:
-        """计算各上下文信誉分数（含衰减机制）"""
-        context_scores = []
-        contexts = self.context_service.list_contexts()
-
-        weighted_traces = self._apply_decay_weights(traces)
-
-        for ctx in contexts:
-            ctx_id = ctx["id"]
-            ctx_weighted_traces = [t for t in weighted_traces if t.get("context") == ctx_id]
-
-            if ctx_weighted_traces:
-                score = self._calculate_context_score_with_decay(ctx_weighted_traces, ctx["weight"], has_fraud)
-
-                # 统计该上下文的欺诈记录
-                fraud_in_context = [t for t in ctx_weighted_traces if t.get("result") == "fraud" or t.get("metadata", {}).get("isFraud")]
-
-                context_scores.append({
-                    "context": ctx_id,
-                    "contextName": ctx["name"],
-                    "score": score,
-                    "fulfillmentRate": self._calculate_weighted_fulfillment_rate(ctx_weighted_traces),
-                    "fulfilledCount": len([t for t in ctx_weighted_traces if t.get("result") == "success"]),
-                    "failedCount": len([t for t in ctx_weighted_traces if t.get("result") == "failed"]),
-                    "totalCount": len(ctx_weighted_traces),
-                    "confidence": self._calculate_weighted_confidence(ctx_weighted_traces),
-                    "hasFraud": len(fraud_in_context) > 0,
-                    "fraudCount": len(fraud_in_context)
-                })
-
-        return context_scores
-
-    def _calculate_context_score_with_decay(self, weighted_traces: List[Dict[str, Any]], weight: float, has_fraud: bool) -> float:
-        """计算单个上下文的分数（含衰减机制）"""
-        if not weighted_traces:
-            return 500.0
-
-        # 检查是否有欺诈
-        if has_fraud and FRAUD_PERMANENT:
-            fraud_in_context = [t for t in weighted_traces if t.get("result") == "fraud" or t.get("metadata", {}).get("isFraud")]
-            if fraud_in_context:
-                return 0.0
+        Args:
+            traces: 行为记录列表
+            now: 计算衰减的当前时间（默认 datetime.now()）
 
-        weighted_fulfillment_rate = self._calculate_weighted_fulfillment_rate(weighted_traces)
-        base_score = weighted_fulfillment_rate * 1000
+        Returns:
+            (全部 traces 的统计量, 上下文 -> 统计量)
+        """
+        now = now or datetime.now()
+        fallback_weight = DECAY_WEIGHTS["over_180_days"]
+        periods = [(max_days, name, DECAY_WEIGHTS[name]) for max_days, name in zip(PERIOD_MAX_DAYS, DECAY_PERIODS)]
+        last_period = (DECAY_PERIODS[-1], DECAY_WEIGHTS[DECAY_PERIODS[-1]])
 
-        # 应用权重
-        weighted_score = base_score * weight
+        overall = TraceStats()
+        contexts: Dict[Any, TraceStats] = {}
 
-        return min(max(weighted_score, 0), 1000)
+        for trace in traces:
+            result = trace.get("result")
+            metadata = trace.get("metadata") or {}
+            fraud = is_fraud_trace(trace.get("action"), result, metadata)
+            context_fraud = is_context_fraud_trace(result, metadata)
 
-    def _calculate_fulfillment_rate(self, traces: List[Dict[str, Any]]) -> float:
-        """计算履约率（未加权）"""
-        if not traces:
-            return 0.5
+            try:
+                timestamp = datetime.fromisoformat(trace.get("timestamp", "").replace("Z", "+00:00"))
+                days_ago = (now - timestamp).days
+            except Exception:
+                period, weight = None, fallback_weight
+            else:
+                period, weight = last_period
+                for max_days, name, period_weight in periods:
+                    if days_ago <= max_days:
+                        period, weight = name, period_weight
+                        break
 
-        success_count = len([t for t in traces if t.get("result") == "success"])
-        failed_count = len([t for t in traces if t.get("result") == "failed"])
-        total = success_count + failed_count
+            stats = contexts.get(trace.get("context"))
+            if stats is None:
+                stats = contexts[trace.get("context")] = TraceStats()
 
-        if total == 0:
-            return 0.5
+            overall.add(result, fraud, context_fraud, period, weight)
+            stats.add(result, fraud, context_fraud, period, weight)
 
-        return success_count / total
+        return overall, contexts
 
-    def _calculate_weighted_fulfillment_rate(self, weighted_traces: List[Dict[str, Any]]) -> float:
-        """计算加权履约率"""
-        if not weighted_traces:
-            return 0.5
+    def _accumulate_vectorized(
+        self,
+        traces: List[Dict[str, Any]],
+        now: Optional[datetime] = None
+    ) -> Tuple[TraceStats, Dict[Any, TraceStats]]:
+        """
+        NumPy 版本的 _accumulate（规则和结果相同）
 
-        weighted_success = sum(
-            t.get("decayWeight", 1.0)
-            for t in weighted_traces
-            if t.get("result") == "success"
+        traces 转为列数组（距今天数、时段、上下文编码、成功/失败/欺诈掩码），
+        衰减权重、计数和加权和都用数组运算完成。
+        """
+        n = len(traces)
+        now = now or datetime.now()
+
+        results = [t.get("result") for t in traces]
+        metadatas = [t.get("metadata") or {} for t in traces]
+        raw_timestamps = [t.get("timestamp", "") for t in traces]
+        timestamps = [_parse_timestamp(value) for value in raw_timestamps]
+
+        valid = np.fromiter((ts is not None for ts in timestamps), dtype=bool, count=n)
+        stamps = _datetime64_column(raw_timestamps, timestamps, now)
+        days_ago = (np.datetime64(now, "us") - stamps).astype(np.int64) // _DAY_MICROSECONDS
+
+        # 距今天数 -> 时段下标 -> 衰减权重；无法解析的按最小权重
+        period = np.searchsorted(np.array(PERIOD_MAX_DAYS), days_ago, side="left")
+        period_weights = np.array([DECAY_WEIGHTS[name] for name in DECAY_PERIODS])
+        weights = np.where(valid, period_weights[period], DECAY_WEIGHTS["over_180_days"])
+
+        success = np.fromiter((r == "success" for r in results), dtype=bool, count=n)
+        failed = np.fromiter((r == "failed" for r in results), dtype=bool, count=n)
+        fraud = np.fromiter(
+            (is_fraud_trace(t.get("action"), r, m) for t, r, m in zip(traces, results, metadatas)),
+            dtype=bool, count=n
         )
-        weighted_failed = sum(
-            t.get("decayWeight", 1.0)
-            for t in weighted_traces
-            if t.get("result") == "failed"
+        context_fraud = np.fromiter(
+            (is_context_fraud_trace(r, m) for r, m in zip(results, metadatas)),
+            dtype=bool, count=n
         )
-        weighted_total = weighted_success + weighted_failed
-
-        if weighted_total == 0:
-            return 0.5
-
-        return weighted_success / weighted_total
 
-    def _calculate_confidence(self, traces: List[Dict[str, Any]]) -> str:
-        """计算可信度（未加权）"""
-        if len(traces) < 5:
-            return "low"
-        elif len(traces) < 20:
-            return "medium"
-        else:
-            return "high"
-
-    def _calculate_weighted_confidence(self, weighted_traces: List[Dict[str, Any]]) -> str:
-        """计算加权可信度"""
-        weighted_count = sum(t.get("decayWeight", 1.0) for t in weighted_traces)
-
-        if weighted_count < 5:
-            return "low"
-        elif weighted_count < 20:
-            return "medium"
-        else:
-            return "high"
+        codes: Dict[Any, int] = {}
+        context_codes = np.fromiter(
+            (codes.setdefault(t.get("context"), len(codes)) for t in traces),
+            dtype=np.intp, count=n
+        )
 
-    def _get_decay_summary(self, traces: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """获取衰减摘要统计"""
-        now = datetime.now()
-
-        summary = {
-            "totalTraces": len(traces),
-            "byTimePeriod": {
-                "recent_30_days": 0,
-                "days_31_to_90": 0,
-                "days_91_to_180": 0,
-                "over_180_days": 0
-            },
-            "weightedTotal": 0.0
+        columns = (weights, period, valid, success, failed, fraud, context_fraud)
+        overall = self._vector_stats(*columns)
+        contexts = {
+            ctx: self._vector_stats(*(column[context_codes == code] for column in columns))
+            for ctx, code in codes.items()
         }
 
-        weighted_traces = self._apply_decay_weights(traces)
+        return overall, contexts
 
-        for trace in weighted_traces:
-            weight = trace.get("decayWeight", 1.0)
-            timestamp_str = trace.get("timestamp", "")
-            try:
-                timestamp = datetime.fromisoformat(timestamp_str.replace("Z", "+00:00"))
-                days_ago = (now - timestamp).days
+    @staticmethod
+    def _vector_stats(weights, period, valid, success, failed, fraud, context_fraud) -> TraceStats:
+        stats = TraceStats()
+        stats.total = int(weights.size)
+        stats.success = int(np.count_nonzero(success))
+        stats.failed = int(np.count_nonzero(failed))
+        stats.fraud = int(np.count_nonzero(fraud))
+        stats.context_fraud = int(np.count_nonzero(context_fraud))
 
-                if days_ago <= 30:
-                    summary["byTimePeriod"]["recent_30_days"] += 1
-                elif days_ago <= 90:
-                    summary["byTimePeriod"]["days_31_to_90"] += 1
-                elif days_ago <= 180:
-                    summary["byTimePeriod"]["days_91_to_180"] += 1
-                else:
-                    summary["byTimePeriod"]["over_180_days"] += 1
+        counts = np.bincount(period[valid], minlength=len(DECAY_PERIODS))
+        stats.by_period = {name: int(count) for name, count in zip(DECAY_PERIODS, counts)}
 
-                summary["weightedTotal"] += weight
-            except:
-                pass
+        stats.weighted_success = _sequential_sum(weights[success])
+        stats.weighted_failed = _sequential_sum(weights[failed])
+        stats.weighted_count = _sequential_sum(weights)
+        stats.weighted_total = _sequential_sum(weights[valid])
 
-        return summary
+        return stats
 
 
 # 全局信誉服务实例
@@ -368,22 +590,93 @@ def calculate_agent_reputation(
         time_window_days: 时间窗口
         use_cache: 是否使用缓存
     """
-    # 生成缓存键
-    cache_key = f"rep:{xenos_id}:{context or 'all'}"
+    if not use_cache:
+        return reputation_service.calculate_reputation(xenos_id, context, time_window_days)
+
+    # 并发未命中合并为一次计算；过期后短时间内返回旧值并后台刷新
+    return fetch_cached(
+        reputation_cache_key(xenos_id, context),
+        lambda: reputation_service.calculate_reputation(xenos_id, context, time_window_days),
+        CACHE_TTL["reputation"],
+        CACHE_STALE_TTL["reputation"],
+        tags=[agent_tag(xenos_id)],
+        agent=xenos_id
+    )
+
+
+async def calculate_agent_reputation_async(
+    xenos_id: str,
+    context: Optional[str] = None,
+    time_window_days: int = 90,
+    use_cache: bool = True
+) -> Dict[str, Any]:
+    """计算 Agent 信誉（异步版本，参数同 calculate_agent_reputation）"""
+    if not use_cache:
+        return await reputation_service.calculate_reputation_async(xenos_id, context, time_window_days)
+
+    return await fetch_cached_async(
+        reputation_cache_key(xenos_id, context),
+        lambda: reputation_service.calculate_reputation_async(xenos_id, context, time_window_days),
+        CACHE_TTL["reputation"],
+        CACHE_STALE_TTL["reputation"],
+        tags=[agent_tag(xenos_id)],
+        agent=xenos_id
+    )
+
+
+async def calculate_agents_reputation_async(
+    xenos_ids: List[str],
+    context: Optional[str] = None,
+    time_window_days: int = 90,
+    use_cache: bool = True
+) -> Dict[str, Dict[str, Any]]:
+    """批量计算 Agent 信誉（异步）
 
-    # 尝试从缓存获取
-    if use_cache:
-        cached = get_cached(cache_key)
-        if cached:
-            logger.debug(f"[Reputation] Cache hit for {xenos_id}")
-            return cached
+    缓存命中部分一次 multi-get 读出，未命中的 Agent 并发拉取上游 traces 并计算
+    （并发数不超过 BATCH_CONCURRENCY，与其他请求中同一 Agent 的计算合并），结果写回缓存。
 
-    # 计算信誉
-    result = reputation_service.calculate_reputation(xenos_id, context, time_window_days)
+    Args:
+        xenos_ids: Xenos ID 列表（重复的只计算一次）
+        context: 上下文（可选）
+        time_window_days: 时间窗口
+        use_cache: 是否使用缓存
+
+    Returns:
+        Xenos ID -> 信誉（按 xenos_ids 首次出现顺序）
+    """
+    xenos_ids = list(dict.fromkeys(xenos_ids))
+    results: Dict[str, Dict[str, Any]] = dict.fromkeys(xenos_ids)
+
+    if use_cache and xenos_ids:
+        keys = [reputation_cache_key(xenos_id, context) for xenos_id in xenos_ids]
+        for xenos_id, hit in zip(xenos_ids, await get_many_cached_async(keys)):
+            if hit:
+                results[xenos_id] = hit
+
+    missing = [xenos_id for xenos_id, result in results.items() if not result]
+    logger.debug(f"[Reputation] Batch of {len(xenos_ids)}: {len(xenos_ids) - len(missing)} cache hits")
+
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def compute(xenos_id: str) -> Dict[str, Any]:
+        async def score() -> Dict[str, Any]:
+            async with semaphore:
+                return await reputation_service.calculate_reputation_async(xenos_id, context, time_window_days)
+
+        if not use_cache:
+            return await score()
+
+        # 与单个查询共用请求合并，同一 Agent 的并发未命中只计算一次
+        return await refresh_cached_async(
+            reputation_cache_key(xenos_id, context),
+            score,
+            CACHE_TTL["reputation"],
+            CACHE_STALE_TTL["reputation"],
+            tags=[agent_tag(xenos_id)],
+            agent=xenos_id
+        )
 
-    # 缓存结果
-    if use_cache:
-        set_cached(cache_key, result, CACHE_TTL["reputation"])
-        logger.debug(f"[Reputation] Cached for {xenos_id}")
+    computed = await asyncio.gather(*(compute(xenos_id) for xenos_id in missing))
+    results.update(zip(missing, computed))
 
-    return result
+    return results
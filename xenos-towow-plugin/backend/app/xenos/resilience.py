@@ -0,0 +1,231 @@
+"""
+Xenos 上游容错模块
+熔断器（closed / open / half-open）+ 舱壁（在途请求并发上限）
+
+上游不可用时快速失败，调用方立即走本地兜底，而不是每次等待超时；
+熔断打开一段时间后放行少量探测请求，探测成功即自动恢复。
+
+配置项（见 app.main.Settings）：
+- XENOS_BREAKER_FAILURE_THRESHOLD: 连续失败多少次后熔断
+- XENOS_BREAKER_RECOVERY_TIMEOUT: 熔断后多久进入半开探测（秒）
+- XENOS_BREAKER_HALF_OPEN_CALLS: 半开状态允许的探测请求数
+- XENOS_MAX_INFLIGHT: 上游在途请求上限
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# 计入熔断失败的异常：网络层错误（连接失败、httpx 超时等）和其他超时
+FAILURE_ERRORS = (httpx.TransportError, TimeoutError, asyncio.TimeoutError)
+
+
+class UpstreamUnavailable(Exception):
+    """上游被熔断或在途请求已满，调用被直接拒绝"""
+
+
+class CircuitBreaker:
+    """熔断器（线程安全，同步/异步调用共用）"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        half_open_max_calls: int = 1
+    ):
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = max(1, half_open_max_calls)
+
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._half_open_calls = 0
+        self._rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    def _maybe_half_open(self) -> None:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = self.HALF_OPEN
+            self._half_open_calls = 0
+            logger.info("[Breaker] Half-open, probing upstream")
+
+    def allow_request(self) -> bool:
+        """是否放行本次请求（半开状态下占用一个探测名额）"""
+        with self._lock:
+            self._maybe_half_open()
+
+            if self._state == self.CLOSED:
+                return True
+
+            if self._state == self.HALF_OPEN and self._half_open_calls < self.half_open_max_calls:
+                self._half_open_calls += 1
+                return True
+
+            self._rejected += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info("[Breaker] Upstream recovered, circuit closed")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._half_open_calls = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning(f"[Breaker] Circuit opened after {self._failures} failures")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._half_open_calls = 0
+
+    def record_cancelled(self) -> None:
+        """调用被取消：不计入成功或失败，半开状态下归还探测名额"""
+        with self._lock:
+            if self._state == self.HALF_OPEN and self._half_open_calls > 0:
+                self._half_open_calls -= 1
+
+    def reset(self) -> None:
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._half_open_calls = 0
+            self._rejected = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._maybe_half_open()
+            return {
+                "state": self._state,
+                "failures": self._failures,
+                "rejected": self._rejected,
+            }
+
+
+class Bulkhead:
+    """舱壁：限制在途请求数，超出时立即拒绝（不排队等待）"""
+
+    def __init__(self, max_concurrent: int = 50):
+        self.max_concurrent = max(1, max_concurrent)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._rejected = 0
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self._in_flight >= self.max_concurrent:
+                self._rejected += 1
+                return False
+            self._in_flight += 1
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self._in_flight = max(0, self._in_flight - 1)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "inFlight": self._in_flight,
+                "maxConcurrent": self.max_concurrent,
+                "rejected": self._rejected,
+            }
+
+
+class UpstreamGuard:
+    """熔断器 + 舱壁组合，包裹每一次上游调用"""
+
+    def __init__(self, breaker: CircuitBreaker, bulkhead: Bulkhead):
+        self.breaker = breaker
+        self.bulkhead = bulkhead
+
+    def acquire(self) -> None:
+        """
+        申请一次上游调用
+
+        Raises:
+            UpstreamUnavailable: 熔断打开或在途请求已满
+        """
+        if not self.bulkhead.try_acquire():
+            raise UpstreamUnavailable("Too many in-flight Xenos API calls")
+
+        if not self.breaker.allow_request():
+            self.bulkhead.release()
+            raise UpstreamUnavailable("Xenos API circuit open")
+
+    def release(self, error: Optional[BaseException] = None, status_code: Optional[int] = None) -> None:
+        """
+        结束一次上游调用
+
+        Args:
+            error: 调用过程中抛出的异常
+            status_code: 调用收到的最后一个上游响应的状态码
+
+        网络层错误（连接失败、超时）和 5xx 响应计入熔断失败；取消（CancelledError 等非 Exception 的
+        BaseException）不计入成功也不计入失败；其他情况（包括 4xx、响应解析失败等业务异常）计入成功
+        """
+        self.bulkhead.release()
+
+        if error is not None and not isinstance(error, Exception):
+            # 调用被取消（客户端断开、任务取消）或进程退出：无法判断上游是否健康
+            self.breaker.record_cancelled()
+        elif isinstance(error, FAILURE_ERRORS) or (status_code or 0) >= 500:
+            self.breaker.record_failure()
+        else:
+            # 上游可达且正常响应
+            self.breaker.record_success()
+
+    def reset(self) -> None:
+        self.breaker.reset()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "breaker": self.breaker.stats(),
+            "bulkhead": self.bulkhead.stats(),
+        }
+
+
+# 全局上游保护实例
+_guard = UpstreamGuard(CircuitBreaker(), Bulkhead())
+
+
+def get_upstream_guard() -> UpstreamGuard:
+    """获取上游保护实例"""
+    return _guard
+
+
+def configure_upstream_guard(
+    failure_threshold: int = 5,
+    recovery_timeout: float = 30.0,
+    half_open_max_calls: int = 1,
+    max_concurrent: int = 50
+) -> UpstreamGuard:
+    """按配置重建上游保护实例"""
+    global _guard
+
+    _guard = UpstreamGuard(
+        CircuitBreaker(failure_threshold, recovery_timeout, half_open_max_calls),
+        Bulkhead(max_concurrent)
+    )
+    return _guard
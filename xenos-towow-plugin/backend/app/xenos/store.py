@@ -0,0 +1,914 @@
+"""
+Xenos 本地 Trace 存储
+Xenos 服务不可用时的兜底存储，维护二级索引供 query_traces 使用
+
+存储后端（TRACE_STORE 环境变量选择）：
+- memory: 进程内存储（默认），重启丢失，多 worker 之间不可见
+- sqlite: SQLite（WAL 模式）持久化存储，重启保留，同机多 worker 共享（TRACE_STORE_PATH 指定文件）
+
+内存存储
+记录采用紧凑表示（TraceRecord）：
+- __slots__ 对象，不带每条记录的 __dict__
+- network / context / action / result 存为驻留的小整数编码
+- 时间戳存为 epoch 浮点数，metadata 中由 _build_trace 追加的时间戳同样存为浮点数
+- 只在 API 边界（to_dict）物化为原来的字典结构
+
+索引：
+- 每个 Agent 一个定长环形缓冲区，按 epoch 时间戳有序存放，最近 N 条倒序读取，时间范围是二分查找
+- 按 network / context / action / result 取值的倒排索引
+- 全局时间序索引（时间戳在写锁内生成，时钟回拨时不早于上一条，插入顺序即时间顺序）
+
+过滤查询从最小的候选集合出发倒序遍历，命中 limit 或越过 start_time 即停止，
+不再扫描全部 traces。
+
+信誉聚合
+存储写入、淘汰和清除记录时同步增减信誉聚合（见 aggregates 模块），聚合与存储内容一致
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .aggregates import ReputationAggregates, get_reputation_aggregates
+
+logger = logging.getLogger(__name__)
+
+# 每个 Agent 最多保留的记录数
+MAX_TRACES_PER_AGENT = 1000
+
+# SQLite 按阈值裁剪：Agent 记录数超过 max_per_agent 的该比例（至少 1 条）后一次裁剪回 max_per_agent
+TRIM_SLACK_RATIO = 0.1
+
+# 建立倒排索引的字段
+INDEXED_FIELDS = ("network", "context", "action", "result")
+
+
+class _Interner:
+    """取值 <-> 小整数编码（只增不减，取值基数很小）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._codes: Dict[Any, int] = {}
+        self._values: List[Any] = []
+
+    def encode(self, value: Any) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            with self._lock:
+                code = self._codes.get(value)
+                if code is None:
+                    code = len(self._values)
+                    self._values.append(value)
+                    self._codes[value] = code
+        return code
+
+    def lookup(self, value: Any) -> Optional[int]:
+        """已有取值的编码（未出现过返回 None）"""
+        return self._codes.get(value)
+
+    def decode(self, code: int) -> Any:
+        return self._values[code]
+
+
+# network / context / action / result 共用的编码表
+_interner = _Interner()
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts).isoformat()
+
+
+def _split_metadata(metadata: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[float]]:
+    """
+    拆出 _build_trace 追加在末尾的 ISO 时间戳
+
+    只有能原样还原（键在末尾、字符串往返一致）时才拆分，否则保持原样。
+    """
+    if not metadata:
+        return metadata, None
+
+    last = next(reversed(metadata))
+    value = metadata[last]
+    if last != "timestamp" or not isinstance(value, str):
+        return metadata, None
+
+    try:
+        ts = datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return metadata, None
+    if _iso(ts) != value:
+        return metadata, None
+
+    rest = dict(metadata)
+    del rest["timestamp"]
+    return rest, ts
+
+
+class TraceRecord:
+    """紧凑的 trace 记录"""
+
+    __slots__ = ("id", "xenos_id", "codes", "metadata", "meta_ts", "ts", "synced")
+
+    def __init__(self, trace_id: str, xenos_id: str, payload: Dict[str, Any], ts: float):
+        self.id = trace_id
+        self.xenos_id = xenos_id
+        # network / context / action / result 的编码
+        self.codes = tuple(_interner.encode(payload[field]) for field in INDEXED_FIELDS)
+        self.metadata, self.meta_ts = _split_metadata(payload["metadata"])
+        self.ts = ts
+        self.synced = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        """物化为 API 返回的记录结构"""
+        network, context, action, result = (_interner.decode(code) for code in self.codes)
+        metadata = self.metadata
+        if self.meta_ts is not None:
+            metadata = {**metadata, "timestamp": _iso(self.meta_ts)}
+
+        return {
+            "id": self.id,
+            "xenosId": self.xenos_id,
+            "network": network,
+            "context": context,
+            "action": action,
+            "result": result,
+            "metadata": metadata,
+            "timestamp": _iso(self.ts),
+            "synced": self.synced
+        }
+
+
+class TraceRingBuffer:
+    """
+    单个 Agent 的定长环形缓冲区，按时间戳升序存放 (epoch 时间戳, seq)
+
+    未写满前按需增长，写满后覆盖最旧的槽位：追加和淘汰都是 O(1)，不再每次重新切片分配列表。
+    下标均为逻辑下标（0 为最旧），读取时直接按槽位访问，不复制。
+    """
+
+    __slots__ = ("capacity", "_timestamps", "_seqs", "_head")
+
+    def __init__(self, capacity: int = MAX_TRACES_PER_AGENT):
+        self.capacity = max(1, capacity)
+        self._timestamps: List[float] = []
+        self._seqs: List[int] = []
+        # 最旧记录所在槽位（写满后随覆盖前移）
+        self._head = 0
+
+    def __len__(self) -> int:
+        return len(self._seqs)
+
+    def __iter__(self) -> Iterator[int]:
+        """按时间升序遍历 seq"""
+        for i in range(len(self._seqs)):
+            yield self.seq_at(i)
+
+    def append(self, ts: float, seq: int) -> Optional[int]:
+        """
+        追加一条记录
+
+        时钟回拨时时间戳按上一条记录处理，保持缓冲区有序（与全局插入顺序一致）。
+
+        Returns:
+            被覆盖淘汰的 seq（未满时为 None）
+        """
+        if self._seqs:
+            ts = max(ts, self.ts_at(len(self._seqs) - 1))
+
+        if len(self._seqs) < self.capacity:
+            self._timestamps.append(ts)
+            self._seqs.append(seq)
+            return None
+
+        head = self._head
+        evicted = self._seqs[head]
+        self._timestamps[head] = ts
+        self._seqs[head] = seq
+        self._head = (head + 1) % self.capacity
+        return evicted
+
+    def ts_at(self, i: int) -> float:
+        return self._timestamps[(self._head + i) % self.capacity]
+
+    def seq_at(self, i: int) -> int:
+        return self._seqs[(self._head + i) % self.capacity]
+
+    def newest(self, limit: int) -> List[int]:
+        """最近 limit 条记录的 seq（按时间倒序）"""
+        size = len(self._seqs)
+        return [self.seq_at(i) for i in range(size - 1, max(size - limit, 0) - 1, -1)]
+
+    def _bisect(self, ts: float, right: bool) -> int:
+        lo, hi = 0, len(self._seqs)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            value = self.ts_at(mid)
+            if value < ts or (right and value == ts):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def range(self, start_ts: Optional[float], end_ts: Optional[float]) -> Tuple[int, int]:
+        """时间范围 [start_ts, end_ts] 对应的逻辑下标区间（二分查找）"""
+        lo = 0 if start_ts is None else self._bisect(start_ts, right=False)
+        hi = len(self._seqs) if end_ts is None else self._bisect(end_ts, right=True)
+        return lo, hi
+
+
+class TraceStore:
+    """本地 trace 存储抽象"""
+
+    def append(self, trace_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def append_many(self, items: List[Tuple[str, Dict[str, Any]]]) -> int:
+        """批量写入 (trace_id, payload)，返回写入条数"""
+        for trace_id, payload in items:
+            self.append(trace_id, payload)
+        return len(items)
+
+    def agent_traces(self, xenos_id: str, limit: int) -> Tuple[List[Dict[str, Any]], int]:
+        raise NotImplementedError
+
+    def query(
+        self,
+        xenos_id: Optional[str] = None,
+        network: Optional[str] = None,
+        context: Optional[str] = None,
+        action: Optional[str] = None,
+        result: Optional[str] = None,
+        start_ts: Optional[float] = None,
+        end_ts: Optional[float] = None,
+        limit: int = 100
+    ) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def count(self, xenos_id: Optional[str] = None) -> int:
+        raise NotImplementedError
+
+    def clear(self, xenos_id: Optional[str] = None) -> int:
+        raise NotImplementedError
+
+    def unsynced(self, limit: int) -> List[Tuple[int, Dict[str, Any]]]:
+        """最早的 limit 条未同步记录（按写入顺序），返回 (seq, 记录)"""
+        raise NotImplementedError
+
+    def claim_unsynced(self, limit: int, owner: str, lease: float) -> List[Tuple[int, Dict[str, Any]]]:
+        """
+        认领最早的 limit 条未同步记录供 owner 补推（按写入顺序），返回 (seq, 记录)
+
+        认领在 lease 秒内有效，期间其他 owner 不会认领同一记录；owner 自己可以重新认领（推送失败后重试）。
+        进程内存储只有本进程的同步任务读取，默认直接返回 unsynced(limit)
+        """
+        return self.unsynced(limit)
+
+    def mark_synced(self, seqs: List[int]) -> int:
+        """标记记录已同步到上游，返回标记条数"""
+        raise NotImplementedError
+
+    def sync_backlog(self) -> Tuple[int, Optional[float]]:
+        """未同步积压：(条数, 最早一条的 epoch 时间戳)"""
+        raise NotImplementedError
+
+    def iter_records(self) -> Iterator[Dict[str, Any]]:
+        """按写入顺序遍历全部记录（启动时重建信誉聚合用）"""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryTraceStore(TraceStore):
+    """进程内 trace 存储（带二级索引）"""
+
+    def __init__(self, max_per_agent: int = MAX_TRACES_PER_AGENT, aggregates: Optional[ReputationAggregates] = None):
+        self.max_per_agent = max_per_agent
+        self.aggregates = aggregates
+
+        self._lock = threading.Lock()
+        self._seq = 0
+        # 最近一条记录的时间戳（时钟回拨时新记录不早于它）
+        self._last_ts = 0.0
+        # 全局时间序索引：seq -> 记录
+        self._entries: Dict[int, TraceRecord] = {}
+        # 每个 Agent 的记录（定长环形缓冲区，按时间戳有序）
+        self._agents: Dict[str, TraceRingBuffer] = {}
+        # 未同步到上游的记录：{seq: None}（按写入顺序）
+        self._unsynced: Dict[int, None] = {}
+        # 倒排索引：字段 -> 取值编码 -> {seq: None}
+        self._indexes: Dict[str, Dict[int, Dict[int, None]]] = {
+            field: {} for field in INDEXED_FIELDS
+        }
+
+    def append(self, trace_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        写入一条 trace
+
+        Args:
+            trace_id: trace ID
+            payload: 上游请求体（xenosId / network / context / action / result / metadata）
+
+        Returns:
+            存储的记录（字典结构）
+        """
+        xenos_id = payload["xenosId"]
+
+        with self._lock:
+            # 时钟回拨时按上一条记录的时间戳写入，保持全局时间序索引单调（query 依赖它提前结束遍历）
+            ts = self._last_ts = max(datetime.now().timestamp(), self._last_ts)
+            record = TraceRecord(trace_id, xenos_id, payload, ts)
+
+            self._seq += 1
+            seq = self._seq
+            self._entries[seq] = record
+            self._unsynced[seq] = None
+            for field, code in zip(INDEXED_FIELDS, record.codes):
+                self._indexes[field].setdefault(code, {})[seq] = None
+
+            agent = self._agents.get(xenos_id)
+            if agent is None:
+                agent = self._agents[xenos_id] = TraceRingBuffer(self.max_per_agent)
+
+            # 写满后覆盖最旧的记录，保持最多 max_per_agent 条
+            evicted = agent.append(ts, seq)
+            if evicted is not None:
+                evicted = self._unindex(evicted)
+
+            if self.aggregates is not None:
+                self.aggregates.record(payload, ts)
+                if evicted is not None:
+                    self.aggregates.discard(evicted.to_dict(), evicted.ts)
+
+        return record.to_dict()
+
+    def _unindex(self, seq: int) -> TraceRecord:
+        """从全局索引和倒排索引中移除一条记录（需持有写锁），返回移除的记录"""
+        record = self._entries.pop(seq)
+        self._unsynced.pop(seq, None)
+        for field, code in zip(INDEXED_FIELDS, record.codes):
+            bucket = self._indexes[field].get(code)
+            if bucket is not None:
+                bucket.pop(seq, None)
+                if not bucket:
+                    del self._indexes[field][code]
+        return record
+
+    def agent_traces(self, xenos_id: str, limit: int) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        获取 Agent 最近的记录
+
+        Returns:
+            (按时间倒序的记录, 该 Agent 的记录总数)
+        """
+        with self._lock:
+            agent = self._agents.get(xenos_id)
+            if agent is None or limit <= 0:
+                return [], len(agent) if agent else 0
+
+            records = [self._entries[seq] for seq in agent.newest(limit)]
+            total = len(agent)
+
+        return [record.to_dict() for record in records], total
+
+    def query(
+        self,
+        xenos_id: Optional[str] = None,
+        network: Optional[str] = None,
+        context: Optional[str] = None,
+        action: Optional[str] = None,
+        result: Optional[str] = None,
+        start_ts: Optional[float] = None,
+        end_ts: Optional[float] = None,
+        limit: int = 100
+    ) -> List[Dict[str, Any]]:
+        """
+        按条件查询记录（按时间倒序）
+
+        Args:
+            start_ts / end_ts: epoch 秒（闭区间）
+
+        Returns:
+            命中的记录，最多 limit 条
+        """
+        if limit <= 0:
+            return []
+
+        matched: List[TraceRecord] = []
+        with self._lock:
+            others = [
+                self._indexes[field].get(_interner.lookup(value), {})
+                for field, value in zip(INDEXED_FIELDS, (network, context, action, result))
+                if value
+            ]
+
+            if xenos_id:
+                # 指定 Agent：在其有序记录上二分出时间范围，倒序遍历
+                agent = self._agents.get(xenos_id)
+                lo, hi = agent.range(start_ts, end_ts) if agent is not None else (0, 0)
+                for i in range(hi - 1, lo - 1, -1):
+                    seq = agent.seq_at(i)
+                    if all(seq in other for other in others):
+                        matched.append(self._entries[seq])
+                        if len(matched) >= limit:
+                            break
+            else:
+                if others:
+                    # 从最小的候选集合出发，其余条件做成员判断
+                    others.sort(key=len)
+                    driver, others = others[0], others[1:]
+                else:
+                    driver = self._entries
+
+                for seq in reversed(driver):
+                    record = self._entries[seq]
+                    if end_ts is not None and record.ts > end_ts:
+                        continue
+                    if start_ts is not None and record.ts < start_ts:
+                        break
+                    if all(seq in other for other in others):
+                        matched.append(record)
+                        if len(matched) >= limit:
+                            break
+
+        return [record.to_dict() for record in matched]
+
+    def count(self, xenos_id: Optional[str] = None) -> int:
+        with self._lock:
+            if xenos_id is None:
+                return len(self._entries)
+            agent = self._agents.get(xenos_id)
+            return len(agent) if agent else 0
+
+    def clear(self, xenos_id: Optional[str] = None) -> int:
+        """
+        清除记录
+
+        Args:
+            xenos_id: Xenos ID（None 表示清除所有）
+
+        Returns:
+            清除的记录数
+        """
+        with self._lock:
+            if self.aggregates is not None:
+                self.aggregates.clear(xenos_id)
+
+            if xenos_id is None:
+                total = len(self._entries)
+                self._entries.clear()
+                self._unsynced.clear()
+                self._agents.clear()
+                for index in self._indexes.values():
+                    index.clear()
+                return total
+
+            agent = self._agents.pop(xenos_id, None)
+            if agent is None:
+                return 0
+            for seq in agent:
+                self._unindex(seq)
+            return len(agent)
+
+    def unsynced(self, limit: int) -> List[Tuple[int, Dict[str, Any]]]:
+        with self._lock:
+            seqs = []
+            for seq in self._unsynced:
+                if len(seqs) >= limit:
+                    break
+                seqs.append(seq)
+            records = [(seq, self._entries[seq]) for seq in seqs]
+
+        return [(seq, record.to_dict()) for seq, record in records]
+
+    def mark_synced(self, seqs: List[int]) -> int:
+        marked = 0
+        with self._lock:
+            for seq in seqs:
+                if seq in self._unsynced:
+                    del self._unsynced[seq]
+                    self._entries[seq].synced = True
+                    marked += 1
+        return marked
+
+    def sync_backlog(self) -> Tuple[int, Optional[float]]:
+        with self._lock:
+            if not self._unsynced:
+                return 0, None
+            return len(self._unsynced), self._entries[next(iter(self._unsynced))].ts
+
+    def iter_records(self) -> Iterator[Dict[str, Any]]:
+        with self._lock:
+            records = list(self._entries.values())
+
+        for record in records:
+            yield record.to_dict()
+
+
+class SQLiteTraceStore(TraceStore):
+    """
+    SQLite 持久化 trace 存储
+
+    - WAL 模式：读写互不阻塞，同机多个 worker 进程共享同一文件
+    - 索引：(xenos_id, ts)、(context, ts)、(action)，查询走索引而不是扫描；
+      (synced, seq) 供同步任务按写入顺序读取未同步记录
+    - append 逐条提交：返回"已本地记录"时记录已落盘，且不长时间占用跨进程的写锁；
+      append_many 在单个事务内 executemany 批量写入（写入队列按批调用）
+    - 容量按阈值裁剪：进程内维护每个 Agent 的记录数，超过 max_per_agent + 裁剪余量后一次删除多出的
+      记录，而不是每次写入都查询裁剪；因此每个 Agent 最多保留 max_per_agent + 裁剪余量条。
+      多 worker 时计数不含其他进程的写入，各进程按自己的计数裁剪
+    - 补推认领：每个 worker 的同步任务先原子认领（claimed_by / claimed_at）未同步记录再推送，
+      同一记录不会被多个 worker 重复推送；认领超过租期（worker 退出或卡住）后可被其他 worker 接手
+    """
+
+    _SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS traces (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            id TEXT NOT NULL,
+            xenos_id TEXT NOT NULL,
+            network TEXT,
+            context TEXT,
+            action TEXT,
+            result TEXT,
+            metadata TEXT NOT NULL,
+            ts REAL NOT NULL,
+            synced INTEGER NOT NULL DEFAULT 0,
+            claimed_by TEXT,
+            claimed_at REAL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_traces_agent_ts ON traces (xenos_id, ts)",
+        "CREATE INDEX IF NOT EXISTS idx_traces_context_ts ON traces (context, ts)",
+        "CREATE INDEX IF NOT EXISTS idx_traces_action ON traces (action)",
+        "CREATE INDEX IF NOT EXISTS idx_traces_unsynced ON traces (synced, seq)",
+    )
+
+    # 旧版本建的表补充的列（补推认领）：列名 -> 语句
+    _MIGRATIONS = {
+        "claimed_by": "ALTER TABLE traces ADD COLUMN claimed_by TEXT",
+        "claimed_at": "ALTER TABLE traces ADD COLUMN claimed_at REAL",
+    }
+
+    _COLUMNS = "id, xenos_id, network, context, action, result, metadata, ts, synced"
+
+    def __init__(
+        self,
+        path: str,
+        max_per_agent: int = MAX_TRACES_PER_AGENT,
+        aggregates: Optional[ReputationAggregates] = None
+    ):
+        self.path = path
+        self.max_per_agent = max(1, max_per_agent)
+        self.trim_slack = max(1, int(self.max_per_agent * TRIM_SLACK_RATIO))
+        self.aggregates = aggregates
+
+        # 每个 Agent 的记录数（首次写入时从表中读取）
+        self._counts: Dict[str, int] = {}
+
+        if path != ":memory:":
+            directory = os.path.dirname(os.path.abspath(path))
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            for statement in self._SCHEMA:
+                self._conn.execute(statement)
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(traces)")}
+            for column, statement in self._MIGRATIONS.items():
+                if column not in columns:
+                    try:
+                        self._conn.execute(statement)
+                    except sqlite3.OperationalError as e:
+                        # 其他 worker 进程同时启动并已补充该列
+                        if "duplicate column" not in str(e):
+                            raise
+
+        logger.info(f"[TraceStore] SQLite store ready at {path}")
+
+    @staticmethod
+    def _row(trace_id: str, payload: Dict[str, Any], ts: float) -> tuple:
+        return (
+            trace_id,
+            payload["xenosId"],
+            payload["network"],
+            payload["context"],
+            payload["action"],
+            payload["result"],
+            json.dumps(payload["metadata"], ensure_ascii=False),
+            ts,
+        )
+
+    @staticmethod
+    def _to_dict(row: tuple) -> Dict[str, Any]:
+        trace_id, xenos_id, network, context, action, result, metadata, ts, synced = row
+        return {
+            "id": trace_id,
+            "xenosId": xenos_id,
+            "network": network,
+            "context": context,
+            "action": action,
+            "result": result,
+            "metadata": json.loads(metadata),
+            "timestamp": _iso(ts),
+            "synced": bool(synced)
+        }
+
+    def _trim(self, xenos_id: str) -> List[tuple]:
+        """Agent 保留最近 max_per_agent 条（需持有写锁），返回删除的记录行"""
+        rows = self._conn.execute(
+            f"SELECT seq, {self._COLUMNS} FROM traces WHERE xenos_id = ? "
+            "ORDER BY ts DESC, seq DESC LIMIT -1 OFFSET ?",
+            (xenos_id, self.max_per_agent)
+        ).fetchall()
+        if rows:
+            self._conn.executemany("DELETE FROM traces WHERE seq = ?", [(row[0],) for row in rows])
+        return [row[1:] for row in rows]
+
+    def _trim_over_limit(self, added: Counter) -> List[tuple]:
+        """
+        累加写入后每个 Agent 的记录数，超过 max_per_agent + trim_slack 时裁剪（需持有写锁）
+
+        Args:
+            added: 本次写入的每个 Agent 的条数（写入已执行）
+
+        Returns:
+            删除的记录行
+        """
+        removed: List[tuple] = []
+        for xenos_id, n in added.items():
+            count = self._counts.get(xenos_id)
+            if count is None:
+                # 首次写入该 Agent：表中的计数已包含本次写入
+                count = self._conn.execute(
+                    "SELECT COUNT(*) FROM traces WHERE xenos_id = ?", (xenos_id,)
+                ).fetchone()[0]
+            else:
+                count += n
+
+            if count > self.max_per_agent + self.trim_slack:
+                rows = self._trim(xenos_id)
+                removed.extend(rows)
+                count -= len(rows)
+            self._counts[xenos_id] = count
+        return removed
+
+    def _update_aggregates(self, added: List[Tuple[Dict[str, Any], float]], removed: List[tuple]) -> None:
+        """写入事务提交后同步信誉聚合（需持有写锁）"""
+        if self.aggregates is None:
+            return
+        for payload, ts in added:
+            self.aggregates.record(payload, ts)
+        for row in removed:
+            self.aggregates.discard(self._to_dict(row), row[7])
+
+    @contextmanager
+    def _write(self) -> Iterator[None]:
+        """
+        写事务（需持有写锁）：正常结束时提交
+
+        失败时回滚，按回滚后的表内容重建计数和信誉聚合，并重新抛出异常。
+        """
+        try:
+            yield
+            self._conn.commit()
+        except sqlite3.Error:
+            self._conn.rollback()
+            self._counts.clear()
+            if self.aggregates is not None:
+                self.aggregates.rebuild(
+                    self._to_dict(row)
+                    for row in self._conn.execute(f"SELECT {self._COLUMNS} FROM traces ORDER BY seq")
+                )
+            raise
+
+    def append(self, trace_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        ts = datetime.now().timestamp()
+        row = self._row(trace_id, payload, ts)
+
+        with self._lock, self._write():
+            self._conn.execute(
+                "INSERT INTO traces (id, xenos_id, network, context, action, result, metadata, ts) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                row
+            )
+            removed = self._trim_over_limit(Counter((payload["xenosId"],)))
+            self._update_aggregates([(payload, ts)], removed)
+
+        return self._to_dict(row + (0,))
+
+    def append_many(self, items: List[Tuple[str, Dict[str, Any]]]) -> int:
+        if not items:
+            return 0
+
+        ts = datetime.now().timestamp()
+        rows = [self._row(trace_id, payload, ts) for trace_id, payload in items]
+
+        with self._lock, self._write():
+            self._conn.executemany(
+                "INSERT INTO traces (id, xenos_id, network, context, action, result, metadata, ts) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            removed = self._trim_over_limit(Counter(payload["xenosId"] for _, payload in items))
+            self._update_aggregates([(payload, ts) for _, payload in items], removed)
+
+        return len(rows)
+
+    def agent_traces(self, xenos_id: str, limit: int) -> Tuple[List[Dict[str, Any]], int]:
+        with self._lock:
+            total = self._conn.execute(
+                "SELECT COUNT(*) FROM traces WHERE xenos_id = ?", (xenos_id,)
+            ).fetchone()[0]
+            rows = self._conn.execute(
+                f"SELECT {self._COLUMNS} FROM traces WHERE xenos_id = ? "
+                "ORDER BY ts DESC, seq DESC LIMIT ?",
+                (xenos_id, max(0, limit))
+            ).fetchall()
+
+        return [self._to_dict(row) for row in rows], total
+
+    def query(
+        self,
+        xenos_id: Optional[str] = None,
+        network: Optional[str] = None,
+        context: Optional[str] = None,
+        action: Optional[str] = None,
+        result: Optional[str] = None,
+        start_ts: Optional[float] = None,
+        end_ts: Optional[float] = None,
+        limit: int = 100
+    ) -> List[Dict[str, Any]]:
+        clauses: List[str] = []
+        params: List[Any] = []
+
+        for column, value in (
+            ("xenos_id", xenos_id),
+            ("network", network),
+            ("context", context),
+            ("action", action),
+            ("result", result),
+        ):
+            if value:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if start_ts is not None:
+            clauses.append("ts >= ?")
+            params.append(start_ts)
+        if end_ts is not None:
+            clauses.append("ts <= ?")
+            params.append(end_ts)
+
+        where = f"WHERE {' AND '.join(clauses)} " if clauses else ""
+        params.append(max(0, limit))
+
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {self._COLUMNS} FROM traces {where}ORDER BY ts DESC, seq DESC LIMIT ?",
+                params
+            ).fetchall()
+
+        return [self._to_dict(row) for row in rows]
+
+    def count(self, xenos_id: Optional[str] = None) -> int:
+        with self._lock:
+            if xenos_id is None:
+                return self._conn.execute("SELECT COUNT(*) FROM traces").fetchone()[0]
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM traces WHERE xenos_id = ?", (xenos_id,)
+            ).fetchone()[0]
+
+    def clear(self, xenos_id: Optional[str] = None) -> int:
+        with self._lock, self._write():
+            if self.aggregates is not None:
+                self.aggregates.clear(xenos_id)
+
+            if xenos_id is None:
+                cleared = self._conn.execute("DELETE FROM traces").rowcount
+                self._counts.clear()
+            else:
+                cleared = self._conn.execute(
+                    "DELETE FROM traces WHERE xenos_id = ?", (xenos_id,)
+                ).rowcount
+                self._counts.pop(xenos_id, None)
+            return cleared
+
+    def unsynced(self, limit: int) -> List[Tuple[int, Dict[str, Any]]]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT seq, {self._COLUMNS} FROM traces WHERE synced = 0 ORDER BY seq LIMIT ?",
+                (max(0, limit),)
+            ).fetchall()
+
+        return [(row[0], self._to_dict(row[1:])) for row in rows]
+
+    def claim_unsynced(self, limit: int, owner: str, lease: float) -> List[Tuple[int, Dict[str, Any]]]:
+        """
+        原子认领未同步记录：单条 UPDATE ... RETURNING，多个 worker 进程并发认领时互不重叠
+        """
+        now = datetime.now().timestamp()
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "UPDATE traces SET claimed_by = ?, claimed_at = ? WHERE seq IN ("
+                "SELECT seq FROM traces WHERE synced = 0 "
+                "AND (claimed_by IS NULL OR claimed_by = ? OR claimed_at < ?) "
+                "ORDER BY seq LIMIT ?"
+                f") RETURNING seq, {self._COLUMNS}",
+                (owner, now, owner, now - lease, max(0, limit))
+            ).fetchall()
+
+        rows.sort(key=lambda row: row[0])
+        return [(row[0], self._to_dict(row[1:])) for row in rows]
+
+    def mark_synced(self, seqs: List[int]) -> int:
+        with self._lock, self._write():
+            cursor = self._conn.executemany(
+                "UPDATE traces SET synced = 1 WHERE seq = ? AND synced = 0",
+                [(seq,) for seq in seqs]
+            )
+            return cursor.rowcount
+
+    def sync_backlog(self) -> Tuple[int, Optional[float]]:
+        with self._lock:
+            pending = self._conn.execute(
+                "SELECT COUNT(*) FROM traces WHERE synced = 0"
+            ).fetchone()[0]
+            oldest = self._conn.execute(
+                "SELECT ts FROM traces WHERE synced = 0 ORDER BY seq LIMIT 1"
+            ).fetchone()
+
+        return pending, oldest[0] if oldest else None
+
+    def iter_records(self) -> Iterator[Dict[str, Any]]:
+        last_seq = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT seq, {self._COLUMNS} FROM traces WHERE seq > ? ORDER BY seq LIMIT 1000",
+                    (last_seq,)
+                ).fetchall()
+            if not rows:
+                return
+
+            for row in rows:
+                yield self._to_dict(row[1:])
+            last_seq = rows[-1][0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# 全局本地存储实例（同步维护全局信誉聚合）
+_store: TraceStore = MemoryTraceStore(aggregates=get_reputation_aggregates())
+
+
+def get_trace_store() -> TraceStore:
+    """获取本地 trace 存储"""
+    return _store
+
+
+def configure_trace_store(
+    backend: str = "memory",
+    path: str = "./data/traces.db",
+    max_per_agent: int = MAX_TRACES_PER_AGENT
+) -> TraceStore:
+    """
+    按配置重建本地存储，并从存储中已有的记录重建信誉聚合
+
+    Args:
+        backend: memory / sqlite
+        path: SQLite 文件路径
+        max_per_agent: 每个 Agent 保留的最大条数
+    """
+    global _store
+
+    _store.close()
+    aggregates = get_reputation_aggregates()
+
+    if backend == "sqlite":
+        try:
+            _store = SQLiteTraceStore(path, max_per_agent=max_per_agent, aggregates=aggregates)
+        except (sqlite3.Error, OSError) as e:
+            logger.warning(f"[TraceStore] SQLite store unavailable, falling back to memory: {e}")
+            _store = MemoryTraceStore(max_per_agent=max_per_agent, aggregates=aggregates)
+    else:
+        _store = MemoryTraceStore(max_per_agent=max_per_agent, aggregates=aggregates)
+
+    # 持久化存储重启后，聚合从已有记录恢复
+    aggregates.rebuild(_store.iter_records())
+    return _store
+
+
+def close_trace_store() -> None:
+    """关闭本地存储（SQLite 连接）"""
+    _store.close()
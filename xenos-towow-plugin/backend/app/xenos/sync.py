@@ -0,0 +1,212 @@
+"""
+Xenos 本地 Trace 同步任务
+上游不可用期间落在本地存储的记录（synced=False）按写入顺序分批补推到 Xenos 服务，
+成功后标记已同步；失败按指数退避 + 随机抖动重试，避免上游恢复时被集中重推打满。
+
+配置项（见 app.main.Settings）：
+- TRACE_SYNC_ENABLED: 是否启用同步任务
+- TRACE_SYNC_BATCH_SIZE: 单批补推条数
+- TRACE_SYNC_INTERVAL: 无积压时的轮询间隔（秒）
+- TRACE_SYNC_MAX_BACKOFF: 失败重试的最大退避（秒）
+- TRACE_SYNC_CLAIM_LEASE: 认领记录的租期（秒），超过后其他 worker 可接手
+
+多 worker 进程共享 SQLite 存储时，每个进程都运行同步任务：推送前先认领（见 TraceStore.claim_unsynced），
+各进程推送互不重叠的记录，不会重复补推。
+"""
+
+import asyncio
+import logging
+import os
+import random
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from .store import TraceStore, get_trace_store
+
+logger = logging.getLogger(__name__)
+
+# 推送函数：接收一批本地记录，返回是否成功
+PushFunc = Callable[[List[Dict[str, Any]]], Awaitable[bool]]
+
+
+class TraceSyncWorker:
+    """本地 trace 补推任务（绑定到创建它的事件循环）"""
+
+    def __init__(
+        self,
+        push: PushFunc,
+        batch_size: int = 100,
+        interval: float = 5.0,
+        max_backoff: float = 300.0,
+        claim_lease: float = 60.0,
+        store: Optional[TraceStore] = None
+    ):
+        """
+        Args:
+            claim_lease: 认领记录的租期（秒），应大于一次推送的最长耗时
+            store: 本地存储（默认使用全局本地存储）
+        """
+        self._push = push
+        self.batch_size = max(1, batch_size)
+        self.interval = interval
+        self.max_backoff = max(interval, max_backoff)
+        self.claim_lease = claim_lease
+        self._store = store
+        # 认领者标识（进程内唯一，跨进程用 pid 区分）
+        self.owner = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._consecutive_failures = 0
+        self._next_attempt = 0.0
+
+        self._stats = {
+            "synced": 0,
+            "batches": 0,
+            "failures": 0,
+        }
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._closing
+
+    def backoff_delay(self, failures: int) -> float:
+        """第 failures 次连续失败后的等待时间：指数退避，保留一半并在另一半内随机抖动"""
+        delay = min(self.max_backoff, self.interval * (2 ** (failures - 1)))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    async def start(self) -> None:
+        """启动后台同步任务"""
+        if self._task is not None:
+            return
+
+        self._closing = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            f"[Sync] Trace sync started (batch_size={self.batch_size}, "
+            f"interval={self.interval}s, max_backoff={self.max_backoff}s)"
+        )
+
+    async def stop(self) -> None:
+        """停止后台任务（未同步记录留在本地存储，下次启动继续）"""
+        if self._task is None:
+            return
+
+        self._closing = True
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+        try:
+            await self._task
+        finally:
+            self._task = None
+
+        logger.info(f"[Sync] Trace sync stopped, synced {self._stats['synced']} traces")
+
+    async def _sleep(self, delay: float) -> None:
+        self._next_attempt = time.time() + delay
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                synced = await self.sync_once()
+            except Exception as e:
+                logger.error(f"[Sync] Sync error: {e}")
+                synced = None
+
+            if synced is None:
+                # 推送失败：指数退避
+                self._consecutive_failures += 1
+                self._stats["failures"] += 1
+                await self._sleep(self.backoff_delay(self._consecutive_failures))
+            elif synced < self.batch_size:
+                # 积压已清空：按间隔轮询
+                await self._sleep(self.interval)
+
+    async def sync_once(self) -> Optional[int]:
+        """
+        认领并补推一批最早的未同步记录
+
+        推送失败时认领保留到租期结束，本任务退避后可以重新认领重试
+
+        Returns:
+            同步条数；推送失败返回 None
+        """
+        store = self._store or get_trace_store()
+        batch = store.claim_unsynced(self.batch_size, self.owner, self.claim_lease)
+        if not batch:
+            return 0
+
+        if not await self._push([record for _, record in batch]):
+            return None
+
+        store.mark_synced([seq for seq, _ in batch])
+        self._consecutive_failures = 0
+        self._stats["synced"] += len(batch)
+        self._stats["batches"] += 1
+        return len(batch)
+
+    def stats(self) -> Dict[str, Any]:
+        """同步统计（含本地积压）"""
+        pending, oldest = (self._store or get_trace_store()).sync_backlog()
+        retry_in = max(0.0, self._next_attempt - time.time()) if self._consecutive_failures else 0.0
+
+        return {
+            **self._stats,
+            "pending": pending,
+            "oldestAgeSeconds": round(time.time() - oldest, 3) if oldest is not None else None,
+            "consecutiveFailures": self._consecutive_failures,
+            "retryInSeconds": round(retry_in, 3),
+            "running": self.running,
+        }
+
+
+# 全局同步任务实例
+_worker: Optional[TraceSyncWorker] = None
+
+
+def get_sync_worker() -> Optional[TraceSyncWorker]:
+    """获取同步任务（未启动时返回 None）"""
+    return _worker
+
+
+def get_sync_status() -> Dict[str, Any]:
+    """同步状态；任务未启动时只返回本地积压"""
+    if _worker is not None:
+        return _worker.stats()
+
+    pending, oldest = get_trace_store().sync_backlog()
+    return {
+        "pending": pending,
+        "oldestAgeSeconds": round(time.time() - oldest, 3) if oldest is not None else None,
+        "running": False,
+    }
+
+
+async def start_sync_worker(push: PushFunc, **options: Any) -> TraceSyncWorker:
+    """创建并启动全局同步任务"""
+    global _worker
+
+    if _worker is not None:
+        await _worker.stop()
+
+    _worker = TraceSyncWorker(push, **options)
+    await _worker.start()
+    return _worker
+
+
+async def stop_sync_worker() -> None:
+    """停止全局同步任务"""
+    global _worker
+
+    if _worker is not None:
+        worker, _worker = _worker, None
+        await worker.stop()
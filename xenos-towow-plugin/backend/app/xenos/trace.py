@@ -1,15 +1,129 @@
 """Xenos Trace Service - 记录 Agent 在网络中的行为痕迹"""
 from typing import Optional, Dict, Any, List
 from datetime import datetime
-import httpx
-import threading
+
+from .client import UpstreamRequest, response_data, send_upstream, send_upstream_async
+from .cache import mark_agent_changed, mark_agents_changed_async
+from .ingest import get_ingest_queue
+from .store import get_trace_store
 
 
 XENOS_API_BASE = "http://localhost:3000/api/v1"
 
-# 本地内存存储（用于演示和测试）
-_local_traces: Dict[str, List[Dict[str, Any]]] = {}
-_local_lock = threading.Lock()
+# 高级查询从上游拉取 limit 的多少倍，过滤后再截断到 limit
+QUERY_FETCH_FACTOR = 10
+
+
+def _build_trace(
+    xenos_id: str,
+    network: str,
+    context: str,
+    action: str,
+    result: str,
+    metadata: Optional[Dict[str, Any]] = None
+) -> tuple:
+    """
+    构造 trace ID 和上游请求体
+
+    Returns:
+        (trace_id, payload)
+    """
+    # 生成 trace ID
+    trace_id = f"trace_{datetime.now().timestamp()}_{hash(xenos_id + action) % 10000}"
+
+    payload = {
+        "xenosId": xenos_id,
+        "network": network,
+        "context": context,
+        "action": action,
+        "result": result,
+        "metadata": {
+            **(metadata or {}),
+            "timestamp": datetime.now().isoformat()
+        }
+    }
+
+    return trace_id, payload
+
+
+def _parse_record_response(response: Any, trace_id: str) -> Optional[dict]:
+    """解析上游记录响应，失败返回 None"""
+    data = response_data(response)
+    if data is None:
+        return None
+    return {
+        "success": True,
+        "traceId": data.get("traceId", trace_id),
+        "recorded": True
+    }
+
+
+def _record_request(trace_id: str, payload: Dict[str, Any]) -> UpstreamRequest:
+    """上游记录请求"""
+    return UpstreamRequest(
+        "POST",
+        f"{XENOS_API_BASE}/trace/record",
+        lambda response: _parse_record_response(response, trace_id),
+        json=payload
+    )
+
+
+def _enqueue_trace(trace_id: str, payload: Dict[str, Any]) -> Optional[dict]:
+    """
+    写入队列启动时入队（由 flush_trace_batch 在批量提交后失效缓存并递增版本号）
+
+    Returns:
+        入队结果；队列积压已满时直接落本地并返回本地记录结果；未启用队列时返回 None
+    """
+    queue = get_ingest_queue()
+    if queue is None:
+        return None
+
+    if queue.submit((trace_id, payload)):
+        return {
+            "success": True,
+            "traceId": trace_id,
+            "recorded": True,
+            "queued": True
+        }
+
+    # 队列积压已满：直接落本地，避免阻塞请求
+    return _record_local(trace_id, payload)
+
+
+def _record_failed(error: Exception) -> dict:
+    """构造记录失败结果"""
+    return {
+        "success": False,
+        "error": f"Failed to record trace: {str(error)}"
+    }
+
+
+def _record_local(trace_id: str, payload: Dict[str, Any]) -> dict:
+    """Xenos 服务不可用时记录到本地"""
+    get_trace_store().append(trace_id, payload)
+
+    return {
+        "success": True,
+        "traceId": trace_id,
+        "recorded": True,
+        "notice": "Recorded locally (Xenos service unavailable)"
+    }
+
+
+def _record_written(payload: Dict[str, Any]) -> None:
+    """
+    trace 写入上游或本地后按 agent 标签删除该 Agent 的全部信誉缓存及响应体，并递增数据版本号（ETag）
+
+    必须在写入完成后执行：写入期间的读取仍按旧数据计算并写回缓存，提前失效会让旧信誉再保留一个 TTL；
+    失效与递增的顺序见 mark_agent_changed
+    """
+    mark_agent_changed(payload["xenosId"])
+
+
+async def _record_written_async(payload: Dict[str, Any]) -> None:
+    """trace 写入上游或本地后使该 Agent 的信誉缓存失效并递增数据版本号（异步版本）"""
+    await mark_agents_changed_async([payload["xenosId"]])
 
 
 def record_trace(
@@ -31,73 +145,145 @@ def record_trace(
         result: 结果（success/failed/cancelled）
         metadata: 额外元数据
 
+    写入队列启动时只入队并立即返回 traceId，由后台任务批量提交上游
+
     Returns:
         记录结果
     """
     try:
-        # 生成 trace ID
-        trace_id = f"trace_{datetime.now().timestamp()}_{hash(xenos_id + action) % 10000}"
+        trace_id, payload = _build_trace(xenos_id, network, context, action, result, metadata)
 
-        payload = {
-            "xenosId": xenos_id,
-            "network": network,
-            "context": context,
-            "action": action,
-            "result": result,
-            "metadata": {
-                **(metadata or {}),
-                "timestamp": datetime.now().isoformat()
-            }
+        recorded = _enqueue_trace(trace_id, payload)
+        if recorded is None:
+            # 尝试发送到 Xenos 服务，不可用时记录到本地
+            recorded = send_upstream(_record_request(trace_id, payload)) or _record_local(trace_id, payload)
+
+        if not recorded.get("queued"):
+            _record_written(payload)
+        return recorded
+
+    except Exception as e:
+        return _record_failed(e)
+
+
+async def record_trace_async(
+    xenos_id: str,
+    network: str,
+    context: str,
+    action: str,
+    result: str,
+    metadata: Optional[Dict[str, Any]] = None
+) -> dict:
+    """记录行为到 Xenos 服务（异步版本，参数和规则同 record_trace）"""
+    try:
+        trace_id, payload = _build_trace(xenos_id, network, context, action, result, metadata)
+
+        recorded = _enqueue_trace(trace_id, payload)
+        if recorded is None:
+            recorded = await send_upstream_async(_record_request(trace_id, payload)) or _record_local(trace_id, payload)
+
+        if not recorded.get("queued"):
+            await _record_written_async(payload)
+        return recorded
+
+    except Exception as e:
+        return _record_failed(e)
+
+
+async def _post_trace_batch(traces: List[Dict[str, Any]]) -> bool:
+    """POST 一批 traces 到 Xenos 服务，返回是否成功"""
+    request = UpstreamRequest(
+        "POST",
+        f"{XENOS_API_BASE}/trace/batch",
+        lambda response: response.status_code == 200,
+        json={"traces": traces}
+    )
+    return bool(await send_upstream_async(request))
+
+
+async def flush_trace_batch(batch: List[tuple]) -> None:
+    """
+    批量提交 traces 到 Xenos 服务（写入队列的刷新函数）
+
+    Args:
+        batch: (trace_id, payload) 列表
+    """
+    if not await _post_trace_batch([{**payload, "traceId": trace_id} for trace_id, payload in batch]):
+        # 批量提交失败，整批落本地
+        get_trace_store().append_many(batch)
+
+    # 提交完成后再失效：入队到提交之间的读取仍按旧数据写回缓存
+    await mark_agents_changed_async(payload["xenosId"] for _, payload in batch)
+
+
+async def push_local_traces(records: List[Dict[str, Any]]) -> bool:
+    """
+    补推本地兜底记录到 Xenos 服务（同步任务的推送函数）
+
+    Args:
+        records: 本地存储的记录（按写入顺序）
+    """
+    return await _post_trace_batch([
+        {
+            "xenosId": record["xenosId"],
+            "network": record["network"],
+            "context": record["context"],
+            "action": record["action"],
+            "result": record["result"],
+            "metadata": record["metadata"],
+            "traceId": record["id"]
         }
+        for record in records
+    ])
 
-        # 尝试发送到 Xenos 服务
-        try:
-            with httpx.Client(timeout=5.0) as client:
-                response = client.post(f"{XENOS_API_BASE}/trace/record", json=payload)
-
-                if response.status_code == 200:
-                    data = response.json()
-                    return {
-                        "success": True,
-                        "traceId": data["data"].get("traceId", trace_id),
-                        "recorded": True
-                    }
-        except Exception as e:
-            print(f"[Trace Service] Xenos API error: {e}")
-
-        # 如果 Xenos 服务不可用，记录到本地
-        with _local_lock:
-            if xenos_id not in _local_traces:
-                _local_traces[xenos_id] = []
-
-            trace_record = {
-                "id": trace_id,
-                "xenosId": xenos_id,
-                "network": network,
-                "context": context,
-                "action": action,
-                "result": result,
-                "metadata": payload["metadata"],
-                "timestamp": datetime.now().isoformat(),
-                "synced": False
-            }
-
-            _local_traces[xenos_id].append(trace_record)
-            # 保持最多 1000 条记录
-            if len(_local_traces[xenos_id]) > 1000:
-                _local_traces[xenos_id] = _local_traces[xenos_id][-1000:]
 
-        return {
-            "success": True,
-            "traceId": trace_id,
-            "recorded": True,
-            "notice": "Recorded locally (Xenos service unavailable)"
+def _get_local_agent_traces(xenos_id: str, limit: int) -> dict:
+    """从本地存储读取 Agent 行为记录"""
+    traces, total = get_trace_store().agent_traces(xenos_id, limit)
+
+    return {
+        "xenosId": xenos_id,
+        "traces": traces,
+        "total": total,
+        "source": "local"
+    }
+
+
+def _query_request(xenos_id: str, limit: int) -> UpstreamRequest:
+    """上游 traces 查询请求"""
+    return UpstreamRequest(
+        "GET",
+        f"{XENOS_API_BASE}/trace/query",
+        params={
+            "xenosId": xenos_id,
+            "limit": limit
         }
+    )
+
+
+def fetch_upstream_traces(xenos_id: str, limit: int) -> Optional[dict]:
+    """从 Xenos 服务获取 Agent 行为记录，服务不可用时返回 None"""
+    return send_upstream(_query_request(xenos_id, limit))
+
+
+async def fetch_upstream_traces_async(xenos_id: str, limit: int) -> Optional[dict]:
+    """从 Xenos 服务获取 Agent 行为记录（异步版本）"""
+    return await send_upstream_async(_query_request(xenos_id, limit))
+
+
+def _agent_traces_result(xenos_id: str, upstream: Optional[dict], limit: int) -> dict:
+    """上游结果优先，上游不可用时从本地存储读取"""
+    try:
+        if upstream is not None:
+            return upstream
+
+        # 从本地存储返回
+        return _get_local_agent_traces(xenos_id, limit)
 
     except Exception as e:
         return {
-            "success": False,
-            "error": f"Failed to record trace: {str(e)}"
+            "xenosId": xenos_id,
+            "error": f"Failed to get traces: {str(e)}"
         }
 
 
@@ -112,46 +298,121 @@ def get_agent_traces(xenos_id: str, limit: int = 10) -> dict:
     Returns:
         行为记录列表
     """
-    try:
-        # 尝试从 Xenos 服务获取
-        try:
-            with httpx.Client(timeout=5.0) as client:
-                response = client.get(
-                    f"{XENOS_API_BASE}/trace/query",
-                    params={
-                        "xenosId": xenos_id,
-                        "limit": limit
-                    }
-                )
-
-                if response.status_code == 200:
-                    data = response.json()
-                    return data["data"]
-        except Exception as e:
-            print(f"[Trace Service] Xenos API error: {e}")
+    return _agent_traces_result(xenos_id, fetch_upstream_traces(xenos_id, limit), limit)
 
-        # 从本地存储返回
-        with _local_lock:
-            traces = _local_traces.get(xenos_id, []).copy()
 
-        # 按时间倒序排列
-        traces.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
+async def get_agent_traces_async(xenos_id: str, limit: int = 10) -> dict:
+    """获取 Agent 行为记录（异步版本，参数同 get_agent_traces）"""
+    return _agent_traces_result(xenos_id, await fetch_upstream_traces_async(xenos_id, limit), limit)
 
-        # 应用限制
-        traces = traces[:limit]
 
-        return {
+def _query_error(error: Exception, xenos_id: Optional[str], limit: int) -> dict:
+    """构造查询失败结果"""
+    return {
+        "error": f"Failed to query traces: {str(error)}",
+        "query": {
             "xenosId": xenos_id,
-            "traces": traces,
-            "total": len(_local_traces.get(xenos_id, [])),
-            "source": "local"
+            "limit": limit
         }
-
-    except Exception as e:
-        return {
+    }
+
+
+def _query_result(
+    traces: List[Dict[str, Any]],
+    xenos_id: Optional[str],
+    network: Optional[str],
+    context: Optional[str],
+    action: Optional[str],
+    result: Optional[str],
+    start_time: Optional[str],
+    end_time: Optional[str],
+    limit: int
+) -> dict:
+    """构造查询结果"""
+    return {
+        "traces": traces,
+        "total": len(traces),
+        "query": {
             "xenosId": xenos_id,
-            "error": f"Failed to get traces: {str(e)}"
+            "network": network,
+            "context": context,
+            "action": action,
+            "result": result,
+            "startTime": start_time,
+            "endTime": end_time,
+            "limit": limit
         }
+    }
+
+
+def _filter_traces(
+    all_traces: List[Dict[str, Any]],
+    network: Optional[str],
+    context: Optional[str],
+    action: Optional[str],
+    result: Optional[str],
+    start_time: Optional[str],
+    end_time: Optional[str],
+    limit: int
+) -> List[Dict[str, Any]]:
+    """对上游返回的 traces 应用过滤条件"""
+    # 应用过滤条件
+    filtered_traces = all_traces
+
+    if network:
+        filtered_traces = [t for t in filtered_traces if t.get("network") == network]
+
+    if context:
+        filtered_traces = [t for t in filtered_traces if t.get("context") == context]
+
+    if action:
+        filtered_traces = [t for t in filtered_traces if t.get("action") == action]
+
+    if result:
+        filtered_traces = [t for t in filtered_traces if t.get("result") == result]
+
+    if start_time:
+        start_dt = datetime.fromisoformat(start_time)
+        filtered_traces = [
+            t for t in filtered_traces
+            if datetime.fromisoformat(t.get("timestamp", "")) >= start_dt
+        ]
+
+    if end_time:
+        end_dt = datetime.fromisoformat(end_time)
+        filtered_traces = [
+            t for t in filtered_traces
+            if datetime.fromisoformat(t.get("timestamp", "")) <= end_dt
+        ]
+
+    # 按时间倒序排列
+    filtered_traces.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
+
+    # 应用限制
+    return filtered_traces[:limit]
+
+
+def _query_local(
+    xenos_id: Optional[str],
+    network: Optional[str],
+    context: Optional[str],
+    action: Optional[str],
+    result: Optional[str],
+    start_time: Optional[str],
+    end_time: Optional[str],
+    limit: int
+) -> List[Dict[str, Any]]:
+    """通过本地存储的二级索引查询"""
+    return get_trace_store().query(
+        xenos_id=xenos_id,
+        network=network,
+        context=context,
+        action=action,
+        result=result,
+        start_ts=datetime.fromisoformat(start_time).timestamp() if start_time else None,
+        end_ts=datetime.fromisoformat(end_time).timestamp() if end_time else None,
+        limit=limit
+    )
 
 
 def query_traces(
@@ -180,78 +441,60 @@ def query_traces(
     Returns:
         查询结果
     """
-    try:
-        # 收集所有 traces
-        all_traces = []
-
-        if xenos_id:
-            # 查询特定 agent 的 traces
-            result_data = get_agent_traces(xenos_id, limit=limit * 10)
-            all_traces = result_data.get("traces", [])
-        else:
-            # 查询所有 traces
-            with _local_lock:
-                for traces in _local_traces.values():
-                    all_traces.extend(traces)
-
-        # 应用过滤条件
-        filtered_traces = all_traces
-
-        if network:
-            filtered_traces = [t for t in filtered_traces if t.get("network") == network]
+    # 查询特定 agent 的 traces，优先使用 Xenos 服务；否则按本地存储索引查询
+    upstream = fetch_upstream_traces(xenos_id, limit * QUERY_FETCH_FACTOR) if xenos_id else None
+    return query_fetched_traces(xenos_id, upstream, network, context, action, result, start_time, end_time, limit)
 
-        if context:
-            filtered_traces = [t for t in filtered_traces if t.get("context") == context]
 
-        if action:
-            filtered_traces = [t for t in filtered_traces if t.get("action") == action]
-
-        if result:
-            filtered_traces = [t for t in filtered_traces if t.get("result") == result]
+async def query_traces_async(
+    xenos_id: Optional[str] = None,
+    network: Optional[str] = None,
+    context: Optional[str] = None,
+    action: Optional[str] = None,
+    result: Optional[str] = None,
+    start_time: Optional[str] = None,
+    end_time: Optional[str] = None,
+    limit: int = 100
+) -> dict:
+    """查询行为记录（异步版本，参数同 query_traces）"""
+    upstream = await fetch_upstream_traces_async(xenos_id, limit * QUERY_FETCH_FACTOR) if xenos_id else None
+    return query_fetched_traces(xenos_id, upstream, network, context, action, result, start_time, end_time, limit)
 
-        if start_time:
-            start_dt = datetime.fromisoformat(start_time)
-            filtered_traces = [
-                t for t in filtered_traces
-                if datetime.fromisoformat(t.get("timestamp", "")) >= start_dt
-            ]
 
-        if end_time:
-            end_dt = datetime.fromisoformat(end_time)
-            filtered_traces = [
-                t for t in filtered_traces
-                if datetime.fromisoformat(t.get("timestamp", "")) <= end_dt
-            ]
+def query_fetched_traces(
+    xenos_id: Optional[str],
+    upstream: Optional[dict],
+    network: Optional[str] = None,
+    context: Optional[str] = None,
+    action: Optional[str] = None,
+    result: Optional[str] = None,
+    start_time: Optional[str] = None,
+    end_time: Optional[str] = None,
+    limit: int = 100
+) -> dict:
+    """
+    对已拉取的上游 traces 执行查询（供同时计算信誉的调用方复用同一次拉取）
 
-        # 按时间倒序排列
-        filtered_traces.sort(key=lambda x: x.get("timestamp", ""), reverse=True)
+    Args:
+        xenos_id: Xenos ID
+        upstream: fetch_upstream_traces 的返回值；None 表示上游不可用，走本地索引
+        其余参数同 query_traces
 
-        # 应用限制
-        filtered_traces = filtered_traces[:limit]
+    Returns:
+        查询结果（格式同 query_traces）
+    """
+    filters = (network, context, action, result, start_time, end_time, limit)
 
-        return {
-            "traces": filtered_traces,
-            "total": len(filtered_traces),
-            "query": {
-                "xenosId": xenos_id,
-                "network": network,
-                "context": context,
-                "action": action,
-                "result": result,
-                "startTime": start_time,
-                "endTime": end_time,
-                "limit": limit
-            }
-        }
+    try:
+        if upstream is not None:
+            # 复制一份再排序，不改动调用方共享的列表
+            traces = _filter_traces(list(upstream.get("traces", [])), *filters)
+        else:
+            traces = _query_local(xenos_id, *filters)
+        return _query_result(traces, xenos_id, *filters)
 
     except Exception as e:
-        return {
-            "error": f"Failed to query traces: {str(e)}",
-            "query": {
-                "xenosId": xenos_id,
-                "limit": limit
-            }
-        }
+        return _query_error(e, xenos_id, limit)
 
 
 def get_trace_statistics(xenos_id: str) -> dict:
@@ -320,7 +563,7 @@ def get_trace_statistics(xenos_id: str) -> dict:
 
 def clear_local_traces(xenos_id: Optional[str] = None) -> dict:
     """
-    清除本地存储的 traces（用于测试）
+    清除本地存储的 traces（聚合随存储一并清除，用于测试），并删除该 Agent 的缓存
 
     Args:
         xenos_id: Xenos ID（None 表示清除所有）
@@ -329,23 +572,14 @@ def clear_local_traces(xenos_id: Optional[str] = None) -> dict:
         清除结果
     """
     try:
-        with _local_lock:
-            if xenos_id:
-                count = len(_local_traces.get(xenos_id, []))
-                _local_traces[xenos_id] = []
-                return {
-                    "success": True,
-                    "cleared": count,
-                    "xenosId": xenos_id
-                }
-            else:
-                total = sum(len(traces) for traces in _local_traces.values())
-                _local_traces.clear()
-                return {
-                    "success": True,
-                    "cleared": total,
-                    "xenosId": "all"
-                }
+        cleared = get_trace_store().clear(xenos_id)
+        if xenos_id is not None:
+            mark_agent_changed(xenos_id)
+        return {
+            "success": True,
+            "cleared": cleared,
+            "xenosId": xenos_id or "all"
+        }
     except Exception as e:
         return {
             "success": False,
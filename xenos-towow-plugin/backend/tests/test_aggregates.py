@@ -0,0 +1,200 @@
+"""Xenos 信誉增量聚合测试"""
+import time
+import pytest
+from app.xenos.aggregates import ReputationAggregates
+from app.xenos.reputation import get_reputation_service
+from app.xenos.store import MemoryTraceStore, SQLiteTraceStore, configure_trace_store, get_trace_store
+from app.xenos.trace import record_trace, clear_local_traces
+
+DAY = 86400
+
+
+def _payload(xenos_id, context="negotiation", action="accept_demand", result="success", metadata=None):
+    return {
+        "xenosId": xenos_id,
+        "network": "towow",
+        "context": context,
+        "action": action,
+        "result": result,
+        "metadata": metadata or {}
+    }
+
+
+class TestReputationAggregates:
+    """聚合计数测试"""
+
+    def test_counts_per_context(self):
+        """测试按上下文累加计数和欺诈标记"""
+        aggregates = ReputationAggregates()
+        aggregates.record(_payload("did:key:a", result="success"))
+        aggregates.record(_payload("did:key:a", result="failed"))
+        aggregates.record(_payload("did:key:a", context="task_execution", action="cheat"))
+        aggregates.record(_payload("did:key:a", context="task_execution", metadata={"isFraud": 1}))
+
+        snapshot = aggregates.snapshot("did:key:a")
+
+        assert list(snapshot) == ["negotiation", "task_execution"]
+        assert snapshot["negotiation"]["total"] == 2
+        assert snapshot["negotiation"]["byPeriod"]["recent_30_days"] == (2, 1, 1)
+        # 恶意行为计入整体欺诈；isFraud 为真值（非 True）只计入上下文欺诈
+        assert snapshot["task_execution"]["fraud"] == 1
+        assert snapshot["task_execution"]["contextFraud"] == 1
+        assert aggregates.snapshot("did:key:unknown") is None
+
+        print(f"✅ 聚合计数测试通过")
+
+    def test_periods_age(self):
+        """测试时段随时间老化"""
+        aggregates = ReputationAggregates()
+        now = time.time()
+        aggregates.record(_payload("did:key:a"), ts=now)
+        aggregates.record(_payload("did:key:a", result="failed"), ts=now - 40 * DAY)
+
+        periods = aggregates.snapshot("did:key:a", now)["negotiation"]["byPeriod"]
+        assert periods["recent_30_days"] == (1, 1, 0)
+        assert periods["days_31_to_90"] == (1, 0, 1)
+
+        periods = aggregates.snapshot("did:key:a", now + 60 * DAY)["negotiation"]["byPeriod"]
+        assert periods["recent_30_days"] == (0, 0, 0)
+        assert periods["days_31_to_90"] == (1, 1, 0)
+        assert periods["days_91_to_180"] == (1, 0, 1)
+
+        periods = aggregates.snapshot("did:key:a", now + 400 * DAY)["negotiation"]["byPeriod"]
+        assert periods["over_180_days"] == (2, 1, 1)
+
+        print(f"✅ 时段老化测试通过")
+
+    def test_rebuild_from_store(self):
+        """测试从存储记录重建聚合"""
+        store = MemoryTraceStore()
+        store.append("t1", _payload("did:key:a"))
+        store.append("t2", _payload("did:key:a", context="task_execution", result="failed"))
+
+        aggregates = ReputationAggregates()
+        aggregates.record(_payload("did:key:stale"))
+
+        assert aggregates.rebuild(store.iter_records()) == 2
+        assert aggregates.snapshot("did:key:stale") is None
+        assert aggregates.snapshot("did:key:a")["task_execution"]["failed"] == 1
+
+        print(f"✅ 重建聚合测试通过")
+
+    def test_discard_across_periods(self):
+        """测试扣减已老化到各时段的记录"""
+        aggregates = ReputationAggregates()
+        now = time.time()
+        aggregates.record(_payload("did:key:a"), ts=now)
+        aggregates.record(_payload("did:key:a", result="failed"), ts=now - 40 * DAY)
+        aggregates.record(_payload("did:key:a", action="cheat"), ts=now - 200 * DAY)
+
+        aggregates.discard(_payload("did:key:a", action="cheat"), now - 200 * DAY)
+        aggregates.discard(_payload("did:key:a", result="failed"), now - 40 * DAY)
+
+        snapshot = aggregates.snapshot("did:key:a")["negotiation"]
+        assert snapshot["total"] == 1 and snapshot["failed"] == 0 and snapshot["fraud"] == 0
+        assert snapshot["byPeriod"]["recent_30_days"] == (1, 1, 0)
+        assert snapshot["byPeriod"]["days_31_to_90"] == (0, 0, 0)
+        assert snapshot["byPeriod"]["over_180_days"] == (0, 0, 0)
+
+        aggregates.discard(_payload("did:key:a"), now)
+        assert aggregates.snapshot("did:key:a") is None
+
+        print(f"✅ 跨时段扣减测试通过")
+
+    @pytest.mark.parametrize("backend", ["memory", "sqlite"])
+    def test_follows_store_eviction(self, backend):
+        """测试存储淘汰和清除记录时聚合同步扣减，与从存储重建的结果一致"""
+        aggregates = ReputationAggregates()
+        if backend == "sqlite":
+            store = SQLiteTraceStore(":memory:", max_per_agent=3, aggregates=aggregates)
+        else:
+            store = MemoryTraceStore(max_per_agent=3, aggregates=aggregates)
+
+        for i in range(4):
+            store.append(f"t{i}", _payload("did:key:a", result="success" if i % 2 else "failed"))
+        store.append_many([
+            ("t4", _payload("did:key:a", context="task_execution", action="cheat")),
+            ("t5", _payload("did:key:b"))
+        ])
+
+        rebuilt = ReputationAggregates()
+        rebuilt.rebuild(store.iter_records())
+        for xenos_id in ("did:key:a", "did:key:b"):
+            assert aggregates.snapshot(xenos_id) == rebuilt.snapshot(xenos_id)
+        assert sum(c["total"] for c in aggregates.snapshot("did:key:a").values()) == 3
+
+        store.clear("did:key:a")
+        assert aggregates.snapshot("did:key:a") is None
+        assert aggregates.snapshot("did:key:b") is not None
+
+        print(f"✅ {backend} 存储淘汰同步聚合测试通过")
+
+
+class TestAggregateScoring:
+    """基于聚合的信誉计算测试"""
+
+    def setup_method(self):
+        """每个测试前清除本地数据"""
+        clear_local_traces()
+
+    def _compare(self, xenos_id, context=None):
+        service = get_reputation_service()
+        traces, _ = get_trace_store().agent_traces(xenos_id, 1000)
+
+        from_traces = service.score_traces(xenos_id, traces, context)
+        from_aggregates = service.score_aggregates(xenos_id, context)
+
+        from_traces.pop("timestamp")
+        from_aggregates.pop("timestamp")
+        assert from_aggregates == from_traces
+        return from_aggregates
+
+    def test_matches_trace_scoring(self):
+        """测试聚合结果与逐条计算一致"""
+        xenos_id = "did:key:test_agg_match"
+        for i in range(8):
+            record_trace(xenos_id, "towow", "negotiation", f"action_{i}", "success" if i % 3 else "failed")
+        for i in range(4):
+            record_trace(xenos_id, "towow", "task_execution", f"task_{i}", "success")
+        record_trace(xenos_id, "towow", "unknown_context", "action", "success")
+
+        overall = self._compare(xenos_id)
+        assert overall["details"]["totalCount"] == 13
+        self._compare(xenos_id, "negotiation")
+        self._compare(xenos_id, "task_execution")
+        self._compare(xenos_id, "data_sharing")
+
+        print(f"✅ 聚合与逐条计算一致测试通过: {overall['overallScore']}")
+
+    def test_matches_with_fraud(self):
+        """测试含欺诈记录时结果一致"""
+        xenos_id = "did:key:test_agg_fraud"
+        record_trace(xenos_id, "towow", "negotiation", "accept", "success")
+        record_trace(xenos_id, "towow", "negotiation", "double_spend", "success")
+        record_trace(xenos_id, "towow", "task_execution", "deliver", "fraud")
+
+        overall = self._compare(xenos_id)
+        assert overall["overallScore"] == 0.0
+        self._compare(xenos_id, "negotiation")
+        self._compare(xenos_id, "task_execution")
+
+        print(f"✅ 含欺诈一致性测试通过")
+
+    def test_matches_store_after_eviction(self):
+        """测试本地存储淘汰旧记录后，聚合结果与逐条计算存储中的记录一致"""
+        xenos_id = "did:key:test_agg_cap"
+        configure_trace_store(max_per_agent=5)
+        try:
+            for i in range(8):
+                record_trace(xenos_id, "towow", "negotiation", f"action_{i}", "success" if i < 3 else "failed")
+
+            overall = self._compare(xenos_id)
+            assert overall["details"]["totalCount"] == 5
+            assert overall["details"]["fulfillmentRate"] == 0.0
+        finally:
+            configure_trace_store()
+
+        print(f"✅ 淘汰后一致性测试通过")
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
@@ -0,0 +1,944 @@
+"""Xenos 缓存层测试"""
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+from app.xenos import cache as cache_module
+from app.xenos.cache import (
+    MemoryCache,
+    RedisCache,
+    SingleFlight,
+    TieredCache,
+    agent_tag,
+    bump_agent_version,
+    bump_agent_versions_async,
+    cached,
+    cache_key,
+    delete_cached,
+    fetch_cached,
+    fetch_cached_async,
+    get_agent_version_async,
+    get_cache,
+    get_cached,
+    get_cached_response_async,
+    get_many_cached_async,
+    invalidate_tag,
+    invalidate_tags_async,
+    mark_agent_changed,
+    reputation_cache_key,
+    reputation_response_key,
+    set_cached,
+    set_cached_response_async,
+    set_many_cached_async
+)
+from app.xenos.reputation import (
+    get_reputation_service,
+    calculate_agent_reputation,
+    calculate_agent_reputation_async
+)
+from app.xenos.trace import clear_local_traces, record_trace, record_trace_async
+
+
+class TestMemoryCache:
+    """有界内存缓存测试"""
+
+    def test_lru_eviction_by_entries(self):
+        """测试超过条目上限时淘汰最久未访问的条目"""
+        cache = MemoryCache(max_entries=3)
+        for key in ("a", "b", "c"):
+            cache.set(key, key, ttl=60)
+
+        # 访问 a 后 b 成为最久未访问
+        assert cache.get("a") == "a"
+        cache.set("d", "d", ttl=60)
+
+        assert cache.get("b") is None
+        assert [cache.get(key) for key in ("a", "c", "d")] == ["a", "c", "d"]
+        assert cache.stats()["evictions"] == 1
+        assert len(cache) == 3
+
+        print(f"✅ 条目上限 LRU 淘汰测试通过")
+
+    def test_eviction_by_bytes(self):
+        """测试超过字节上限时淘汰，超大条目不缓存"""
+        value = "x" * 1000
+        entry_size = MemoryCache._entry_size("k0", value)
+        cache = MemoryCache(max_bytes=entry_size * 3)
+
+        for i in range(5):
+            cache.set(f"k{i}", value, ttl=60)
+
+        stats = cache.stats()
+        assert stats["entries"] == 3
+        assert stats["bytes"] <= entry_size * 3
+        assert stats["evictions"] == 2
+        assert cache.get("k0") is None and cache.get("k4") == value
+
+        cache.set("huge", "x" * (entry_size * 4), ttl=60)
+        assert cache.get("huge") is None
+
+        # 覆盖写入不重复计算字节数
+        cache.set("k4", value, ttl=60)
+        assert cache.stats()["bytes"] == stats["bytes"]
+
+        print(f"✅ 字节上限淘汰测试通过")
+
+    def test_expired_entries_swept_on_write(self):
+        """测试写入时清理已过期的其他键"""
+        cache = MemoryCache()
+        for i in range(10):
+            cache.set(f"once_{i}", "v", ttl=60)
+
+        # 让这些条目过期，不再读取它们
+        with cache._lock:
+            for key, (value, _, size) in list(cache._cache.items()):
+                cache._cache[key] = (value, time.time() - 1, size)
+            cache._expiry = [(entry[1], key) for key, entry in cache._cache.items()]
+
+        cache.set("fresh", "v", ttl=60)
+
+        assert len(cache) == 1
+        assert cache.stats()["expirations"] == 10
+
+        print(f"✅ 过期条目均摊清理测试通过")
+
+    def test_rewrites_do_not_grow_expiry_heap(self):
+        """测试反复覆盖同一批键时过期堆不会无限增长"""
+        cache = MemoryCache()
+        for i in range(5000):
+            cache.set(f"k{i % 10}", "v", ttl=60)
+
+        assert len(cache) == 10
+        assert len(cache._expiry) <= 2 * len(cache) + 65
+
+        print(f"✅ 过期堆重建测试通过")
+
+    def test_incr(self):
+        """测试计数器：不存在时从初始值起始，已存在时递增"""
+        cache = MemoryCache()
+
+        assert cache.incr("v", initial=100, ttl=60) == 101
+        assert cache.incr("v", initial=500, ttl=60) == 102
+        assert cache.get("v") == b"102"
+
+        cache.delete("v")
+        assert cache.incr("v", initial=500) == 501
+
+        print(f"✅ 内存计数器测试通过")
+
+    def test_tags(self):
+        """测试按标签删除条目，标签索引随删除、覆盖和淘汰同步清理"""
+        cache = MemoryCache(max_entries=3)
+
+        cache.set("a1", b"1", 60, tags=["agent:a"])
+        cache.set("a2", b"2", 60, tags=["agent:a", "ctx:n"])
+        cache.set("b1", b"3", 60, tags=["agent:b"])
+
+        assert sorted(cache.invalidate_tags(["agent:a"])) == ["a1", "a2"]
+        assert cache.get("a1") is None and cache.get("a2") is None
+        assert cache.get("b1") == b"3"
+        # a2 的另一个标签随之清理
+        assert cache.invalidate_tags(["ctx:n", "agent:missing"]) == []
+
+        # 不带标签覆盖后不再属于原标签
+        cache.set("b1", b"4", 60)
+        assert cache.invalidate_tags(["agent:b"]) == []
+        assert cache.get("b1") == b"4"
+
+        # 淘汰的条目从标签索引中移除
+        for i in range(5):
+            cache.set(f"c{i}", b"x", 60, tags=["agent:c"])
+        assert len(cache.invalidate_tags(["agent:c"])) == 3
+        assert cache.stats()["tags"] == 0
+
+        print(f"✅ 内存缓存标签测试通过")
+
+
+class TestRedisCache:
+    """Redis 后端测试（使用 fakeredis 进程内实现）"""
+
+    def _cache(self):
+        fakeredis = pytest.importorskip("fakeredis")
+        server = fakeredis.FakeServer()
+        return RedisCache(
+            "redis://fake",
+            client=fakeredis.FakeRedis(server=server),
+            async_client=fakeredis.FakeAsyncRedis(server=server)
+        )
+
+    def test_sync_operations(self):
+        """测试同步读写、MGET 和 pipeline 批量写入"""
+        cache = self._cache()
+
+        cache.set("a", b"1", ttl=60)
+        cache.set_many([("b", b"2", 60), ("c", b"3", None)])
+
+        assert cache.get("a") == b"1"
+        assert cache.get_many(["a", "b", "c", "missing"]) == [b"1", b"2", b"3", None]
+        assert cache._client.ttl("b") == 60
+        assert cache._client.ttl("c") == -1
+
+        cache.delete_many(["a", "b"])
+        assert cache.get_many(["a", "b", "c"]) == [None, None, b"3"]
+
+        print(f"✅ Redis 同步接口测试通过")
+
+    @pytest.mark.asyncio
+    async def test_async_operations(self):
+        """测试异步读写与同步客户端共享数据"""
+        cache = self._cache()
+
+        await cache.aset("a", b"1", ttl=60)
+        await cache.aset_many([("b", b"2", 30), ("c", b"3", None)])
+
+        assert await cache.aget("a") == b"1"
+        assert await cache.aget_many(["a", "b", "c", "missing"]) == [b"1", b"2", b"3", None]
+        assert cache.get("b") == b"2"
+        assert cache._client.ttl("b") == 30
+
+        await cache.adelete_many(["a", "c"])
+        assert await cache.aget_many(["a", "b", "c"]) == [None, b"2", None]
+        assert await cache.aget_many([]) == []
+
+        print(f"✅ Redis 异步接口测试通过")
+
+    @pytest.mark.asyncio
+    async def test_incr(self):
+        """测试计数器：SET NX 设置初始值和 TTL 后 INCR"""
+        cache = self._cache()
+
+        assert cache.incr("v", initial=100, ttl=60) == 101
+        assert await cache.aincr("v", initial=500, ttl=60) == 102
+        assert cache.get("v") == b"102"
+        assert 0 < cache._client.ttl("v") <= 60
+
+        print(f"✅ Redis 计数器测试通过")
+
+    @pytest.mark.asyncio
+    async def test_tags(self):
+        """测试标签集合与条目在同一 pipeline 写入，按标签失效删除集合和其中的键"""
+        cache = self._cache()
+
+        cache.set("a1", b"1", 60, tags=["tag:agent:a"])
+        cache.set_many([("a2", b"2", 30), ("b1", b"3", 30)], tags={"a2": ["tag:agent:a"], "b1": ["tag:agent:b"]})
+        await cache.aset("a3", b"4", 60, tags=["tag:agent:a"])
+
+        assert cache._client.smembers("tag:agent:a") == {b"a1", b"a2", b"a3"}
+        assert cache._client.ttl("tag:agent:a") > 60
+
+        assert sorted(cache.invalidate_tags(["tag:agent:a"])) == ["a1", "a2", "a3"]
+        assert cache.get_many(["a1", "a2", "a3", "b1"]) == [None, None, None, b"3"]
+        assert not cache._client.exists("tag:agent:a")
+
+        await cache.aset_many([("b2", b"5", 30)], tags={"b2": ["tag:agent:b"]})
+        assert sorted(await cache.ainvalidate_tags(["tag:agent:b", "tag:missing"])) == ["b1", "b2"]
+        assert await cache.aget_many(["b1", "b2"]) == [None, None]
+        assert await cache.ainvalidate_tags([]) == []
+
+        print(f"✅ Redis 标签测试通过")
+
+    @pytest.mark.asyncio
+    async def test_async_helpers_use_async_client(self, monkeypatch):
+        """测试异步缓存函数走异步客户端，不调用同步客户端"""
+        cache = self._cache()
+        monkeypatch.setattr(cache_module, "_cache", cache)
+
+        def blocked(*args, **kwargs):
+            raise AssertionError("sync client used on the event loop")
+
+        for name in ("get", "mget", "set", "setex", "delete", "pipeline"):
+            monkeypatch.setattr(cache._client, name, blocked)
+
+        await set_many_cached_async(
+            [("rep:did:key:a:all", {"score": 1})], ttl=60, stale_ttl=30,
+            tags={"rep:did:key:a:all": [agent_tag("did:key:a")]}
+        )
+        assert await get_many_cached_async(["rep:did:key:a:all", "rep:did:key:b:all"]) == [{"score": 1}, None]
+
+        compute = lambda: asyncio.sleep(0, {"score": 2})
+        result = await fetch_cached_async("rep:did:key:b:all", compute, ttl=60, tags=[agent_tag("did:key:b")])
+        assert result == {"score": 2}
+        assert await fetch_cached_async("rep:did:key:b:all", lambda: asyncio.sleep(0, {"score": 3}), ttl=60) == {"score": 2}
+
+        assert await invalidate_tags_async([agent_tag("did:key:a"), agent_tag("did:key:b")]) == 2
+        assert await get_many_cached_async(["rep:did:key:a:all", "rep:did:key:b:all"]) == [None, None]
+
+        print(f"✅ 异步缓存函数测试通过")
+
+
+class TestTieredCache:
+    """两级缓存测试（L1 进程内 + fakeredis L2）"""
+
+    def _server(self):
+        fakeredis = pytest.importorskip("fakeredis")
+        return fakeredis.FakeServer()
+
+    def _tiered(self, server, **kwargs):
+        import fakeredis
+        l2 = RedisCache(
+            "redis://fake",
+            client=fakeredis.FakeRedis(server=server),
+            async_client=fakeredis.FakeAsyncRedis(server=server)
+        )
+        return TieredCache(l2, **kwargs)
+
+    def _wait_for(self, condition, timeout=3.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if condition():
+                return True
+            time.sleep(0.02)
+        return False
+
+    def test_l1_hit_skips_l2(self, monkeypatch):
+        """测试热点键命中 L1 后不再访问 Redis"""
+        cache = self._tiered(self._server(), subscribe=False)
+        monkeypatch.setattr(cache_module, "_cache", cache)
+
+        set_cached("rep:did:key:a:all", {"score": 1}, ttl=60)
+        assert get_cached("rep:did:key:a:all") == {"score": 1}
+
+        def blocked(*args, **kwargs):
+            raise AssertionError("L2 read on L1 hit")
+
+        monkeypatch.setattr(cache.l2, "get", blocked)
+        monkeypatch.setattr(cache.l2, "get_many", blocked)
+
+        assert get_cached("rep:did:key:a:all") == {"score": 1}
+        assert cache.get_entries([cache_key("rep:did:key:a:all")])[0][0] == {"score": 1}
+        assert cache.stats()["l1Hits"] == 2
+
+        print(f"✅ L1 命中测试通过")
+
+    def test_local_write_invalidates_l1(self):
+        """测试本进程写入和删除立即更新 L1"""
+        cache = self._tiered(self._server(), subscribe=False)
+
+        cache.set("k", json.dumps(1))
+        assert cache.get_entry("k")[0] == 1
+
+        cache.set("k", json.dumps(2))
+        assert cache.get_entry("k")[0] == 2
+
+        cache.delete("k")
+        assert cache.get_entry("k") is None
+
+        print(f"✅ 本地写入失效测试通过")
+
+    def test_l1_ttl_and_lru(self):
+        """测试 L1 条目过期后回源，超出容量时淘汰最久未用的条目"""
+        cache = self._tiered(self._server(), max_entries=2, ttl=0.05, subscribe=False)
+        cache.set_many([("a", "1", None), ("b", "2", None), ("c", "3", None)])
+
+        cache.get_entries(["a", "b", "c"])
+        assert cache.stats()["l1Entries"] == 2
+
+        # 绕过 TieredCache 直接改 L2，模拟失效消息丢失
+        cache.l2.set("b", "20")
+        assert cache.get_entry("b")[0] == 2
+        time.sleep(0.06)
+        assert cache.get_entry("b")[0] == 20
+
+        print(f"✅ L1 过期与容量测试通过")
+
+    def test_cross_instance_invalidation(self):
+        """测试一个实例写入后，另一个实例通过 pub/sub 丢弃 L1"""
+        server = self._server()
+        writer = self._tiered(server)
+        reader = self._tiered(server)
+
+        try:
+            writer.set("k", json.dumps("old"))
+            assert reader.get_entry("k")[0] == "old"
+
+            writer.set("k", json.dumps("new"))
+            assert self._wait_for(lambda: reader.get_entry("k")[0] == "new")
+
+            writer.delete_many(["k"])
+            assert self._wait_for(lambda: reader.get_entry("k") is None)
+            assert reader.stats()["l1Invalidations"] >= 1
+        finally:
+            asyncio.run(writer.aclose())
+            asyncio.run(reader.aclose())
+
+        print(f"✅ 跨实例失效测试通过")
+
+    @pytest.mark.asyncio
+    async def test_async_paths(self):
+        """测试异步读写经过 L1 并广播失效"""
+        server = self._server()
+        writer = self._tiered(server)
+        reader = self._tiered(server)
+
+        try:
+            await writer.aset_many([("a", "1", 60), ("b", "2", 60)])
+            assert [entry[0] for entry in await reader.aget_entries(["a", "b"])] == [1, 2]
+            assert (await reader.aget_entry("a"))[0] == 1
+            assert reader.stats()["l1Hits"] == 1
+
+            await writer.adelete_many(["a"])
+            for _ in range(150):
+                if await reader.aget_entry("a") is None:
+                    break
+                await asyncio.sleep(0.02)
+            assert await reader.aget_entry("a") is None
+            assert (await reader.aget_entry("b"))[0] == 2
+        finally:
+            await writer.aclose()
+            await reader.aclose()
+
+        print(f"✅ 两级缓存异步接口测试通过")
+
+
+    def test_tag_invalidation_propagates(self):
+        """测试按标签失效时删除本实例 L1 并通知其他实例"""
+        server = self._server()
+        writer = self._tiered(server)
+        reader = self._tiered(server)
+
+        try:
+            writer.set("k1", json.dumps(1).encode(), 60, tags=["tag:agent:a"])
+            writer.set("k2", json.dumps(2).encode(), 60, tags=["tag:agent:a"])
+            assert [entry[0] for entry in reader.get_entries(["k1", "k2"])] == [1, 2]
+            assert [entry[0] for entry in writer.get_entries(["k1", "k2"])] == [1, 2]
+
+            assert sorted(writer.invalidate_tags(["tag:agent:a"])) == ["k1", "k2"]
+            assert writer.get_entries(["k1", "k2"]) == [None, None]
+            assert self._wait_for(lambda: reader.get_entries(["k1", "k2"]) == [None, None])
+        finally:
+            asyncio.run(writer.aclose())
+            asyncio.run(reader.aclose())
+
+        print(f"✅ 两级缓存标签失效测试通过")
+
+
+class TestResponseCache:
+    """响应体缓存测试"""
+
+    def setup_method(self):
+        get_cache().clear()
+
+    @pytest.mark.asyncio
+    async def test_round_trip(self):
+        """测试响应体按原字节读出，ETag 随内容变化"""
+        body = b'{"code":0,"data":{"text":"a\\nb"}}\n'
+        stored = await set_cached_response_async("resp:test", body, "application/json", ttl=60)
+        cached = await get_cached_response_async("resp:test")
+
+        assert cached.body == body
+        assert cached.media_type == "application/json"
+        assert cached.etag == stored.etag and cached.etag.startswith('"')
+
+        other = await set_cached_response_async("resp:test", b"{}", "application/json", ttl=60)
+        assert other.etag != stored.etag
+        assert await get_cached_response_async("resp:missing") is None
+
+        print(f"✅ 响应体缓存往返测试通过")
+
+    @pytest.mark.asyncio
+    async def test_invalidated_by_trace_write(self):
+        """测试 trace 写入后删除该 Agent 所有上下文的响应体"""
+        clear_local_traces()
+        keys = [
+            reputation_response_key("did:key:a"),
+            reputation_response_key("did:key:a", view="summary"),
+            reputation_response_key("did:key:a", "negotiation"),
+            reputation_response_key("did:key:a", "payment")
+        ]
+        for key in keys:
+            await set_cached_response_async(key, b"{}", "application/json", ttl=60, tags=[agent_tag("did:key:a")])
+
+        await record_trace_async("did:key:a", "towow", "negotiation", "accept_demand", "success")
+
+        for key in keys:
+            assert await get_cached_response_async(key) is None
+
+        print(f"✅ 响应体失效测试通过")
+
+
+class TestAgentVersion:
+    """Agent 数据版本号测试"""
+
+    def setup_method(self):
+        get_cache().clear()
+
+    @pytest.mark.asyncio
+    async def test_stable_until_bumped(self):
+        """测试版本号在写入前保持不变，写入后递增"""
+        version = await get_agent_version_async("did:key:v")
+        assert await get_agent_version_async("did:key:v") == version
+
+        bump_agent_version("did:key:v")
+        await bump_agent_versions_async(["did:key:v", "did:key:v", "did:key:w"])
+        assert await get_agent_version_async("did:key:v") == version + 2
+
+        print(f"✅ 版本号递增测试通过")
+
+    @pytest.mark.asyncio
+    async def test_restart_after_loss(self):
+        """测试计数器丢失后重新起始的版本号大于此前的版本号"""
+        version = await get_agent_version_async("did:key:v")
+        for _ in range(5):
+            bump_agent_version("did:key:v")
+
+        get_cache().clear()
+        await asyncio.sleep(0.001)
+        assert await get_agent_version_async("did:key:v") > version + 5
+
+        print(f"✅ 版本号重建测试通过")
+
+
+class TestTagInvalidation:
+    """按 Agent 标签失效测试"""
+
+    def setup_method(self):
+        get_cache().clear()
+        clear_local_traces()
+
+    @pytest.mark.asyncio
+    async def test_agent_tag_drops_all_contexts(self, monkeypatch):
+        """测试 agent 标签删除该 Agent 所有上下文的信誉及响应体，不影响其他 Agent"""
+        service = get_reputation_service()
+        calls = []
+
+        async def fake_calculate(xenos_id, context=None, time_window_days=90):
+            calls.append((xenos_id, context))
+            return {"score": len(calls)}
+
+        monkeypatch.setattr(service, "calculate_reputation_async", fake_calculate)
+
+        for context in (None, "negotiation", "payment", "task_execution"):
+            await calculate_agent_reputation_async("did:key:tagged", context)
+        await calculate_agent_reputation_async("did:key:other")
+        await set_cached_response_async(
+            reputation_response_key("did:key:tagged"), b"{}", "application/json", 60, tags=[agent_tag("did:key:tagged")]
+        )
+        set_cached("custom:did:key:tagged", {"x": 1}, 60, tags=[agent_tag("did:key:tagged")])
+
+        assert invalidate_tag(agent_tag("did:key:tagged")) == 6
+        assert await invalidate_tags_async([agent_tag("did:key:tagged")]) == 0
+        assert await get_cached_response_async(reputation_response_key("did:key:tagged")) is None
+        assert get_cached("custom:did:key:tagged") is None
+
+        calls.clear()
+        await calculate_agent_reputation_async("did:key:tagged", "payment")
+        await calculate_agent_reputation_async("did:key:other")
+        assert calls == [("did:key:tagged", "payment")]
+
+        print(f"✅ Agent 标签失效测试通过")
+
+    def test_cached_decorator_tags(self):
+        """测试 cached 装饰器按 tags_builder 为条目打标签"""
+        calls = []
+
+        @cached(ttl=60, key_builder=lambda xid: f"traces:{xid}", tags_builder=lambda xid: [agent_tag(xid)])
+        async def get_traces(xenos_id):
+            calls.append(xenos_id)
+            return {"traces": len(calls)}
+
+        assert asyncio.run(get_traces("did:key:t")) == {"traces": 1}
+        assert asyncio.run(get_traces("did:key:t")) == {"traces": 1}
+
+        assert invalidate_tag(agent_tag("did:key:t")) == 1
+        assert asyncio.run(get_traces("did:key:t")) == {"traces": 2}
+
+        print(f"✅ 装饰器标签测试通过")
+
+    def test_clear_local_traces_drops_agent_cache(self):
+        """测试清除 Agent 的本地记录时一并删除其缓存"""
+        set_cached("custom:did:key:cleared", {"x": 1}, 60, tags=[agent_tag("did:key:cleared")])
+
+        clear_local_traces("did:key:cleared")
+
+        assert get_cached("custom:did:key:cleared") is None
+
+        print(f"✅ 清除记录删除缓存测试通过")
+
+
+class TestWriteRace:
+    """计算与 trace 写入竞争测试"""
+
+    def setup_method(self):
+        get_cache().clear()
+        clear_local_traces()
+
+    def test_write_during_compute_not_stored(self, monkeypatch):
+        """测试计算期间写入 trace 时，计算结果不写回缓存，下次读取重新计算"""
+        xenos_id = "did:key:race"
+        service = get_reputation_service()
+        calls = []
+
+        def racing_calculate(xenos_id, context=None, time_window_days=90):
+            calls.append(1)
+            if len(calls) == 1:
+                # 计算已按旧数据完成，写回之前有新的 trace 写入
+                record_trace(xenos_id, "towow", "negotiation", "accept_demand", "success")
+            return {"score": len(calls)}
+
+        monkeypatch.setattr(service, "calculate_reputation", racing_calculate)
+
+        assert calculate_agent_reputation(xenos_id) == {"score": 1}
+        assert get_cached(reputation_cache_key(xenos_id)) is None
+        assert calculate_agent_reputation(xenos_id) == {"score": 2}
+        assert get_cached(reputation_cache_key(xenos_id)) == {"score": 2}
+
+        print(f"✅ 计算期间写入不写回测试通过")
+
+    @pytest.mark.asyncio
+    async def test_write_during_async_compute_not_stored(self, monkeypatch):
+        """测试异步计算期间写入 trace 时不写回缓存"""
+        xenos_id = "did:key:race_async"
+        service = get_reputation_service()
+
+        async def racing_calculate(xenos_id, context=None, time_window_days=90):
+            await record_trace_async(xenos_id, "towow", "negotiation", "accept_demand", "success")
+            return {"score": 1}
+
+        monkeypatch.setattr(service, "calculate_reputation_async", racing_calculate)
+
+        assert await calculate_agent_reputation_async(xenos_id, "negotiation") == {"score": 1}
+        assert get_cached(reputation_cache_key(xenos_id, "negotiation")) is None
+
+        print(f"✅ 异步计算期间写入不写回测试通过")
+
+    def test_store_before_bump_dropped(self, monkeypatch):
+        """测试版本检查通过、在递增版本号之前写回的旧值由递增后的再次失效删除"""
+        xenos_id = "did:key:race_order"
+        bump = cache_module.bump_agent_version
+
+        def bump_after_store(xenos_id):
+            set_cached(reputation_cache_key(xenos_id), {"score": "stale"}, 60, tags=[agent_tag(xenos_id)])
+            return bump(xenos_id)
+
+        monkeypatch.setattr(cache_module, "bump_agent_version", bump_after_store)
+        mark_agent_changed(xenos_id)
+
+        assert get_cached(reputation_cache_key(xenos_id)) is None
+
+        print(f"✅ 递增前写回删除测试通过")
+
+    def test_bump_between_check_and_store(self, monkeypatch):
+        """测试写回前检查通过、写入时版本号已变化的条目被删除"""
+        xenos_id = "did:key:race_check"
+        cache = get_cache()
+        set_entry = cache.set
+
+        def set_then_bump(key, value, ttl=None, tags=()):
+            set_entry(key, value, ttl, tags)
+            if key == cache_key(reputation_cache_key(xenos_id)):
+                bump_agent_version(xenos_id)
+
+        monkeypatch.setattr(cache, "set", set_then_bump)
+        cache_module.refresh_cached(
+            reputation_cache_key(xenos_id), lambda: {"score": 1}, 60, agent=xenos_id
+        )
+
+        assert get_cached(reputation_cache_key(xenos_id)) is None
+
+        print(f"✅ 检查后版本变化删除测试通过")
+
+
+class TestSingleFlight:
+    """请求合并测试"""
+
+    def test_concurrent_threads_share_result(self):
+        """测试多线程并发调用同一 key 只执行一次"""
+        flight = SingleFlight()
+        calls = []
+        results = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.05)
+            return {"value": 42}
+
+        threads = [
+            threading.Thread(target=lambda: results.append(flight.do("key", compute)))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(calls) == 1
+        assert results == [{"value": 42}] * 8
+
+        # 调用结束后不保留结果
+        flight.do("key", compute)
+        assert len(calls) == 2
+
+        print(f"✅ 多线程请求合并测试通过")
+
+    def test_error_shared_with_waiters(self):
+        """测试执行者的异常传给所有等待者"""
+        flight = SingleFlight()
+        errors = []
+
+        def compute():
+            time.sleep(0.05)
+            raise ValueError("upstream down")
+
+        def run():
+            try:
+                flight.do("key", compute)
+            except ValueError as e:
+                errors.append(str(e))
+
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert errors == ["upstream down"] * 4
+
+        print(f"✅ 异常共享测试通过")
+
+    @pytest.mark.asyncio
+    async def test_concurrent_coroutines_share_result(self):
+        """测试协程并发调用同一 key 只执行一次，不同 key 互不影响"""
+        flight = SingleFlight()
+        calls = []
+
+        async def compute(value):
+            calls.append(value)
+            await asyncio.sleep(0.01)
+            return value
+
+        results = await asyncio.gather(
+            *(flight.do_async("a", lambda: compute("a")) for _ in range(10)),
+            flight.do_async("b", lambda: compute("b"))
+        )
+
+        assert sorted(calls) == ["a", "b"]
+        assert results == ["a"] * 10 + ["b"]
+
+        print(f"✅ 协程请求合并测试通过")
+
+    @pytest.mark.asyncio
+    async def test_leader_cancelled_waiter_retries(self):
+        """测试执行者被取消时等待者重新执行"""
+        flight = SingleFlight()
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "done"
+
+        leader = asyncio.create_task(flight.do_async("key", compute))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(flight.do_async("key", compute))
+        await asyncio.sleep(0)
+
+        leader.cancel()
+        assert await waiter == "done"
+        assert len(calls) == 2
+
+        print(f"✅ 执行者取消测试通过")
+
+    @pytest.mark.asyncio
+    async def test_cached_decorator_coalesces(self):
+        """测试 cached 装饰器合并并发未命中"""
+        calls = []
+
+        @cached(ttl=60, key_builder=lambda xid: f"test_flight:{xid}")
+        async def load(xenos_id):
+            calls.append(xenos_id)
+            await asyncio.sleep(0.01)
+            return {"xenosId": xenos_id}
+
+        delete_cached("test_flight:did:key:hot")
+        try:
+            results = await asyncio.gather(*(load("did:key:hot") for _ in range(10)))
+        finally:
+            delete_cached("test_flight:did:key:hot")
+
+        assert calls == ["did:key:hot"]
+        assert all(result == {"xenosId": "did:key:hot"} for result in results)
+
+        print(f"✅ 缓存装饰器请求合并测试通过")
+
+
+class TestStaleWhileRevalidate:
+    """过期返回旧值与 XFetch 提前刷新测试"""
+
+    KEY = "test_swr:key"
+
+    def setup_method(self):
+        delete_cached(self.KEY)
+
+    def teardown_method(self):
+        delete_cached(self.KEY)
+
+    def _put_entry(self, value, expires_in, delta=0.0):
+        get_cache().set(cache_key(self.KEY), json.dumps({
+            "__xenos_entry__": 1,
+            "value": value,
+            "expiresAt": time.time() + expires_in,
+            "delta": delta
+        }), 60)
+
+    def test_fresh_hit_and_miss(self):
+        """测试未过期直接命中，未命中时计算并写入"""
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return {"value": len(calls)}
+
+        assert fetch_cached(self.KEY, compute, ttl=60, stale_ttl=30) == {"value": 1}
+        assert fetch_cached(self.KEY, compute, ttl=60, stale_ttl=30) == {"value": 1}
+        assert len(calls) == 1
+        assert get_cached(self.KEY) == {"value": 1}
+
+        print(f"✅ 命中/未命中测试通过")
+
+    def test_stale_served_and_refreshed(self):
+        """测试过期后立即返回旧值并在后台刷新"""
+        self._put_entry({"value": "old"}, expires_in=-1)
+        refreshed = threading.Event()
+
+        def compute():
+            refreshed.set()
+            return {"value": "new"}
+
+        assert fetch_cached(self.KEY, compute, ttl=60, stale_ttl=30) == {"value": "old"}
+        assert refreshed.wait(1)
+
+        deadline = time.time() + 1
+        while get_cached(self.KEY) != {"value": "new"} and time.time() < deadline:
+            time.sleep(0.01)
+        assert get_cached(self.KEY) == {"value": "new"}
+
+        print(f"✅ 过期返回旧值测试通过")
+
+    def test_expired_without_stale_window(self):
+        """测试不允许旧值时过期即同步重算"""
+        self._put_entry({"value": "old"}, expires_in=-1)
+
+        assert fetch_cached(self.KEY, lambda: {"value": "new"}, ttl=60) == {"value": "new"}
+
+        print(f"✅ 过期同步重算测试通过")
+
+    @pytest.mark.asyncio
+    async def test_stale_served_async(self):
+        """测试异步版本过期返回旧值并后台刷新"""
+        self._put_entry({"value": "old"}, expires_in=-1)
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            return {"value": "new"}
+
+        results = await asyncio.gather(
+            *(fetch_cached_async(self.KEY, compute, ttl=60, stale_ttl=30) for _ in range(5))
+        )
+        assert results == [{"value": "old"}] * 5
+
+        await asyncio.gather(*cache_module._refresh_tasks)
+        assert calls == [1]
+        assert get_cached(self.KEY) == {"value": "new"}
+
+        print(f"✅ 异步过期返回旧值测试通过")
+
+    def test_xfetch_early_refresh(self, monkeypatch):
+        """测试临近过期时按计算耗时提前刷新"""
+        now = time.time()
+        should_refresh = cache_module._should_refresh
+
+        # 计算耗时越长、随机数越接近 1，越早刷新
+        monkeypatch.setattr(cache_module.random, "random", lambda: 0.99)
+        assert should_refresh(now + 5, 2.0, 1.0, now) is True
+        assert should_refresh(now + 5, 0.0, 1.0, now) is False
+        assert should_refresh(now + 5, 2.0, 0.0, now) is False
+
+        monkeypatch.setattr(cache_module.random, "random", lambda: 0.0)
+        assert should_refresh(now + 5, 2.0, 1.0, now) is False
+        assert should_refresh(now - 1, 0.0, 1.0, now) is True
+
+        # 旧格式条目（无过期信息）不刷新
+        assert should_refresh(None, 0.0, 1.0, now) is False
+
+        print(f"✅ XFetch 提前刷新测试通过")
+
+    def test_get_cached_skips_expired(self):
+        """测试 get_cached 将过期旧值视为未命中，兼容无过期信息的旧格式"""
+        self._put_entry({"value": "old"}, expires_in=-1)
+        assert get_cached(self.KEY) is None
+
+        get_cache().set(cache_key(self.KEY), json.dumps({"value": "legacy"}), 60)
+        assert get_cached(self.KEY) == {"value": "legacy"}
+
+        set_cached(self.KEY, {"value": "plain"})
+        assert get_cached(self.KEY) == {"value": "plain"}
+
+        print(f"✅ 过期判定与旧格式兼容测试通过")
+
+
+class TestReputationCoalescing:
+    """信誉计算请求合并测试"""
+
+    def setup_method(self):
+        """每个测试前清除本地数据"""
+        clear_local_traces()
+        delete_cached("rep:did:key:test_flight:all")
+
+    def teardown_method(self):
+        delete_cached("rep:did:key:test_flight:all")
+
+    @pytest.mark.asyncio
+    async def test_async_misses_compute_once(self, monkeypatch):
+        """测试同一 Agent 的并发异步未命中只计算一次"""
+        service = get_reputation_service()
+        original = service.calculate_reputation_async
+        calls = []
+
+        async def slow(*args):
+            calls.append(args[0])
+            await asyncio.sleep(0.01)
+            return await original(*args)
+
+        monkeypatch.setattr(service, "calculate_reputation_async", slow)
+
+        results = await asyncio.gather(
+            *(calculate_agent_reputation_async("did:key:test_flight") for _ in range(10))
+        )
+
+        assert calls == ["did:key:test_flight"]
+        assert all(result == results[0] for result in results)
+
+        print(f"✅ 异步信誉请求合并测试通过")
+
+    def test_sync_misses_compute_once(self, monkeypatch):
+        """测试同一 Agent 的并发同步未命中只计算一次"""
+        service = get_reputation_service()
+        original = service.calculate_reputation
+        calls = []
+
+        def slow(*args):
+            calls.append(args[0])
+            time.sleep(0.05)
+            return original(*args)
+
+        monkeypatch.setattr(service, "calculate_reputation", slow)
+
+        threads = [
+            threading.Thread(target=calculate_agent_reputation, args=("did:key:test_flight",))
+            for _ in range(6)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert calls == ["did:key:test_flight"]
+
+        print(f"✅ 同步信誉请求合并测试通过")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
@@ -0,0 +1,83 @@
+"""Xenos 上游 HTTP 客户端测试"""
+import pytest
+import httpx
+from app.xenos import client as http_client
+from app.xenos.client import (
+    init_http_clients,
+    close_http_clients,
+    get_async_client,
+    get_sync_client,
+    async_upstream_client,
+    upstream_client
+)
+from app.xenos.resilience import get_upstream_guard
+
+
+@pytest.mark.asyncio
+class TestHttpClientPool:
+    """共享连接池测试"""
+
+    def setup_method(self):
+        """每个测试前重置熔断器"""
+        get_upstream_guard().reset()
+
+    async def test_init_and_close(self):
+        """测试创建和关闭共享连接池"""
+        client = init_http_clients(max_connections=10, max_keepalive_connections=5, http2=False)
+
+        assert isinstance(client, httpx.AsyncClient)
+        assert get_async_client() is client
+        assert get_sync_client() is not None
+        assert http_client._get_client_kwargs()["limits"].max_connections == 10
+
+        await close_http_clients()
+
+        assert get_async_client() is None
+        assert get_sync_client() is None
+
+        print(f"✅ 连接池创建/关闭测试通过")
+
+    async def test_shared_client_reused(self):
+        """测试初始化后复用同一个客户端"""
+        init_http_clients(http2=False)
+
+        async with async_upstream_client() as first:
+            async with async_upstream_client() as second:
+                assert first is second is get_async_client()
+
+        with upstream_client() as sync_client:
+            assert sync_client is get_sync_client()
+
+        await close_http_clients()
+
+        print(f"✅ 连接复用测试通过")
+
+    async def test_fallback_without_lifespan(self):
+        """测试未初始化时退化为临时客户端"""
+        assert get_async_client() is None
+
+        async with async_upstream_client() as client:
+            assert isinstance(client, httpx.AsyncClient)
+
+        assert client.is_closed
+
+        print(f"✅ 临时客户端退化测试通过")
+
+    async def test_server_error_counts_as_failure(self, monkeypatch):
+        """测试上游 5xx 响应计入熔断，同步/异步客户端一致"""
+        transport = httpx.MockTransport(lambda request: httpx.Response(503))
+        monkeypatch.setattr(http_client, "_client_kwargs", {"transport": transport})
+        breaker = get_upstream_guard().breaker
+
+        async with async_upstream_client() as client:
+            assert (await client.get("http://xenos.test/")).status_code == 503
+        with upstream_client() as client:
+            assert client.get("http://xenos.test/").status_code == 503
+
+        assert breaker.stats()["failures"] == 2
+
+        print(f"✅ 5xx 计入熔断测试通过")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
@@ -0,0 +1,139 @@
+"""Xenos 缓存值编解码测试"""
+import json
+
+import pytest
+from app.xenos import codec as codec_module
+from app.xenos.codec import (
+    CacheCodec,
+    FLAG_ZLIB,
+    FORMAT_JSON,
+    FORMAT_MSGPACK
+)
+from app.xenos.cache import MemoryCache, _decode_entry, _encode_entry
+
+
+REPUTATION = {
+    "xenosId": "did:key:z6MkTest",
+    "overallScore": 0.82,
+    "contexts": [
+        {"context": f"ctx_{i}", "score": 0.5, "decayApplied": {"recent_30_days": {"count": i}}}
+        for i in range(50)
+    ]
+}
+
+
+class TestCacheCodec:
+    """编解码器测试"""
+
+    def test_json_round_trip(self):
+        """测试 JSON 格式带头往返"""
+        codec = CacheCodec("json", compress_min_bytes=0)
+        raw = codec.dumps({"score": 1.5, "tags": ["a", "b"], "nested": {"ok": True}})
+
+        assert raw[0] == FORMAT_JSON
+        assert codec.loads(raw) == {"score": 1.5, "tags": ["a", "b"], "nested": {"ok": True}}
+
+        print(f"✅ JSON 往返测试通过")
+
+    def test_msgpack_round_trip(self):
+        """测试 MessagePack 格式往返，JSON 编解码器也能读取"""
+        pytest.importorskip("msgpack")
+        codec = CacheCodec("msgpack", compress_min_bytes=0)
+        raw = codec.dumps(REPUTATION)
+
+        assert raw[0] == FORMAT_MSGPACK
+        assert codec.loads(raw) == REPUTATION
+        assert CacheCodec("json").loads(raw) == REPUTATION
+
+        print(f"✅ MessagePack 往返测试通过")
+
+    def test_compression_threshold(self):
+        """测试超过阈值时压缩，小值保持原样"""
+        codec = CacheCodec("json", compress_min_bytes=256)
+
+        small = codec.dumps({"score": 1})
+        assert small[0] == FORMAT_JSON
+
+        large = codec.dumps(REPUTATION)
+        assert large[0] == FORMAT_JSON | FLAG_ZLIB
+        assert len(large) < len(json.dumps(REPUTATION)) / 2
+        assert codec.loads(large) == REPUTATION
+
+        print(f"✅ 压缩阈值测试通过")
+
+    def test_legacy_json_text(self):
+        """测试读取不带头的旧版 JSON 文本（字符串和字节）"""
+        codec = CacheCodec("json")
+
+        assert codec.loads(json.dumps({"score": 1})) == {"score": 1}
+        assert codec.loads(b' [1, 2]') == [1, 2]
+        assert codec.loads(b"null") is None
+
+        print(f"✅ 旧版 JSON 兼容测试通过")
+
+    def test_unknown_or_corrupt_value(self):
+        """测试未知头和损坏数据抛出 ValueError"""
+        codec = CacheCodec("json")
+
+        with pytest.raises(ValueError):
+            codec.loads(b"\x07payload")
+        with pytest.raises(ValueError):
+            codec.loads(bytes((FORMAT_JSON | FLAG_ZLIB,)) + b"not zlib")
+        with pytest.raises(ValueError):
+            codec.loads(bytes((FORMAT_JSON,)) + b"{broken")
+        with pytest.raises(ValueError):
+            CacheCodec("yaml")
+
+        print(f"✅ 异常数据测试通过")
+
+    def test_unserializable_value(self):
+        """测试无法序列化的值抛出 TypeError"""
+        with pytest.raises(TypeError):
+            CacheCodec("json").dumps({"value": object()})
+
+        print(f"✅ 不可序列化测试通过")
+
+
+class TestCacheEntryCodec:
+    """缓存条目使用编解码器测试"""
+
+    def setup_method(self):
+        self._previous = codec_module._codec
+
+    def teardown_method(self):
+        codec_module._codec = self._previous
+
+    def test_entry_round_trip(self):
+        """测试条目编码后存入后端再读出"""
+        codec_module.configure_codec("json", compress_min_bytes=256)
+        cache = MemoryCache()
+
+        cache.set("k", _encode_entry(REPUTATION, 60, 0.02))
+        raw = cache.get("k")
+        value, expires_at, delta = _decode_entry(raw)
+
+        assert isinstance(raw, bytes) and raw[0] & FLAG_ZLIB
+        assert value == REPUTATION
+        assert expires_at is not None and delta == 0.02
+
+        print(f"✅ 条目编解码测试通过")
+
+    def test_switch_serializer_without_flush(self):
+        """测试切换序列化格式后旧条目仍可读取"""
+        pytest.importorskip("msgpack")
+        codec_module.configure_codec("json")
+        old = _encode_entry({"score": 1}, 60, 0.0)
+
+        codec_module.configure_codec("msgpack")
+        new = _encode_entry({"score": 2}, 60, 0.0)
+
+        assert _decode_entry(old)[0] == {"score": 1}
+        assert _decode_entry(new)[0] == {"score": 2}
+        assert _decode_entry(json.dumps({"score": 3}))[0] == {"score": 3}
+        assert _decode_entry(b"\x07garbage") is None
+
+        print(f"✅ 切换格式兼容测试通过")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
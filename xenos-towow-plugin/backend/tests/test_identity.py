@@ -2,6 +2,7 @@
 import pytest
 from app.xenos.identity import (
     generate_xenos_id,
+    generate_xenos_id_async,
     verify_xenos_signature,
     sign_message,
     extract_public_key_from_did
@@ -100,5 +101,31 @@ class TestIdentityService:
         print(f"✅ DID 文档结构测试通过")
 
 
+@pytest.mark.asyncio
+class TestIdentityServiceAsync:
+    """身份服务异步接口测试"""
+
+    async def test_generate_xenos_id_async(self):
+        """测试异步生成 Xenos ID"""
+        result = await generate_xenos_id_async("Async Agent")
+
+        assert result["xenosId"].startswith("did:key:")
+        assert len(result["privateKey"]) == 64
+        assert result["didDocument"]["id"] == result["xenosId"]
+
+        print(f"✅ 异步 Xenos ID 生成测试通过")
+
+    async def test_get_existing_agent_async(self):
+        """测试异步获取已存在的 Agent"""
+        xenos_id = "did:key:test123"
+
+        result = await generate_xenos_id_async("", xenos_id)
+
+        assert result["xenosId"] == xenos_id
+        assert result["privateKey"] == ""
+
+        print(f"✅ 异步查询 Agent 测试通过")
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v", "-s"])
@@ -0,0 +1,182 @@
+"""Xenos Trace 写入队列测试"""
+import asyncio
+import pytest
+from app.xenos.ingest import (
+    TraceIngestQueue,
+    start_ingest_queue,
+    stop_ingest_queue
+)
+from app.xenos.trace import (
+    record_trace,
+    record_trace_async,
+    flush_trace_batch,
+    get_agent_traces,
+    clear_local_traces
+)
+
+
+class FlushRecorder:
+    """记录每次批量提交的内容"""
+
+    def __init__(self):
+        self.batches = []
+
+    async def __call__(self, batch):
+        self.batches.append(list(batch))
+
+
+@pytest.mark.asyncio
+class TestTraceIngestQueue:
+    """写入队列测试"""
+
+    async def test_size_triggered_flush(self):
+        """测试达到批量大小时触发刷新"""
+        recorder = FlushRecorder()
+        queue = TraceIngestQueue(recorder, batch_size=3, flush_interval=60)
+        await queue.start()
+
+        for i in range(3):
+            assert queue.submit(i) is True
+
+        await asyncio.sleep(0.05)
+
+        assert recorder.batches == [[0, 1, 2]]
+
+        await queue.stop()
+
+        print(f"✅ 批量大小触发刷新测试通过")
+
+    async def test_time_triggered_flush(self):
+        """测试达到时间间隔时触发刷新"""
+        recorder = FlushRecorder()
+        queue = TraceIngestQueue(recorder, batch_size=100, flush_interval=0.05)
+        await queue.start()
+
+        queue.submit("a")
+        await asyncio.sleep(0.2)
+
+        assert recorder.batches == [["a"]]
+
+        await queue.stop()
+
+        print(f"✅ 时间间隔触发刷新测试通过")
+
+    async def test_stop_drains_pending(self):
+        """测试停止时刷新剩余记录"""
+        recorder = FlushRecorder()
+        queue = TraceIngestQueue(recorder, batch_size=2, flush_interval=60)
+        await queue.start()
+
+        for i in range(5):
+            queue.submit(i)
+        await queue.stop()
+
+        assert [item for batch in recorder.batches for item in batch] == [0, 1, 2, 3, 4]
+        assert all(len(batch) <= 2 for batch in recorder.batches)
+        assert queue.stats()["pending"] == 0
+
+        print(f"✅ 优雅关闭测试通过")
+
+    async def test_bounded_pending(self):
+        """测试积压上限"""
+        recorder = FlushRecorder()
+        queue = TraceIngestQueue(recorder, batch_size=100, flush_interval=60, max_pending=2)
+        await queue.start()
+
+        assert queue.submit(1) is True
+        assert queue.submit(2) is True
+        assert queue.submit(3) is False
+        assert queue.stats()["rejected"] == 1
+
+        await queue.stop()
+
+        print(f"✅ 积压上限测试通过")
+
+    async def test_record_trace_async_enqueues(self):
+        """测试启用队列后 record_trace_async 只入队"""
+        clear_local_traces()
+        recorder = FlushRecorder()
+        await start_ingest_queue(recorder, batch_size=100, flush_interval=60)
+
+        result = await record_trace_async("did:key:test_queue", "towow", "negotiation", "accept_demand", "success")
+
+        assert result["success"] is True
+        assert result["queued"] is True
+
+        await stop_ingest_queue()
+
+        trace_id, payload = recorder.batches[0][0]
+        assert trace_id == result["traceId"]
+        assert payload["xenosId"] == "did:key:test_queue"
+
+        print(f"✅ 异步记录入队测试通过")
+
+    async def test_sync_record_trace_enqueues_from_thread(self):
+        """测试同步 record_trace 在线程池中调用时同样入队，达到批量大小即唤醒刷新"""
+        clear_local_traces()
+        recorder = FlushRecorder()
+        await start_ingest_queue(recorder, batch_size=2, flush_interval=60)
+
+        results = [
+            await asyncio.to_thread(record_trace, "did:key:test_queue", "towow", "negotiation", f"a{i}", "success")
+            for i in range(2)
+        ]
+        for _ in range(50):
+            if recorder.batches:
+                break
+            await asyncio.sleep(0.01)
+
+        assert all(result["queued"] is True for result in results)
+        assert [trace_id for trace_id, _ in recorder.batches[0]] == [r["traceId"] for r in results]
+        assert get_agent_traces("did:key:test_queue")["total"] == 0
+
+        await stop_ingest_queue()
+
+        print(f"✅ 同步记录入队测试通过")
+
+    async def test_overflow_falls_back_to_local(self):
+        """测试队列已满时直接记录到本地"""
+        clear_local_traces()
+        recorder = FlushRecorder()
+        await start_ingest_queue(recorder, batch_size=100, flush_interval=60, max_pending=1)
+
+        await record_trace_async("did:key:test_queue", "towow", "negotiation", "a1", "success")
+        overflow = await record_trace_async("did:key:test_queue", "towow", "negotiation", "a2", "success")
+
+        assert "queued" not in overflow
+        assert get_agent_traces("did:key:test_queue")["total"] == 1
+
+        await stop_ingest_queue()
+        clear_local_traces()
+
+        print(f"✅ 队列溢出落本地测试通过")
+
+
+    async def test_flush_failure_records_locally(self):
+        """测试批量提交失败时整批落本地"""
+        clear_local_traces()
+        batch = [
+            (f"trace_{i}", {
+                "xenosId": "did:key:test_flush",
+                "network": "towow",
+                "context": "negotiation",
+                "action": f"action_{i}",
+                "result": "success",
+                "metadata": {}
+            })
+            for i in range(3)
+        ]
+
+        await flush_trace_batch(batch)
+
+        local = get_agent_traces("did:key:test_flush", limit=10)
+        assert local["total"] == 3
+        assert {t["id"] for t in local["traces"]} == {"trace_0", "trace_1", "trace_2"}
+
+        clear_local_traces()
+
+        print(f"✅ 批量提交失败落本地测试通过")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
@@ -1,4 +1,6 @@
 """集成测试：Xenos + ToWow 模拟"""
+import asyncio
+
 import pytest
 from fastapi.testclient import TestClient
 from app.main import app
@@ -123,6 +125,26 @@ class TestAPIIntegration:
 
         print(f"✅ 获取行为记录测试通过: {len(data['data']['traces'])} 条")
 
+    def test_sync_status(self, client):
+        """测试本地记录同步状态"""
+        record_trace(
+            xenos_id="did:key:test_sync",
+            network="towow",
+            context="negotiation",
+            action="accept_demand",
+            result="success"
+        )
+
+        response = client.get("/api/xenos/sync/status")
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["code"] == 0
+        assert data["data"]["pending"] >= 1
+        assert data["data"]["oldestAgeSeconds"] is not None
+
+        print(f"✅ 同步状态测试通过: 积压 {data['data']['pending']} 条")
+
     def test_toww_webhook(self, client):
         """测试 ToWow Webhook"""
         webhook_payload = {
@@ -291,6 +313,59 @@ class TestAPIIntegration:
 
         print(f"✅ 意图注入测试通过")
 
+    def test_towwow_intent_enrich_batch(self, client, monkeypatch):
+        """测试批量意图注入：每个 Agent 只拉取一次 traces，结果按请求顺序返回"""
+        from app.routers import towwow
+        from app.xenos.cache import delete_cached
+
+        xenos_ids = ["did:key:intent_batch_a", "did:key:intent_batch_b"]
+        for xenos_id in xenos_ids:
+            for i in range(3):
+                client.post("/api/xenos/trace", json={
+                    "xenosId": xenos_id,
+                    "network": "towow",
+                    "context": "negotiation",
+                    "action": f"action_{i}",
+                    "result": "success"
+                })
+            for context in ("negotiation", "task_execution"):
+                delete_cached(f"rep:{xenos_id}:{context}")
+
+        fetched = []
+        original = towwow.fetch_upstream_traces_async
+
+        async def spy(xenos_id, limit):
+            fetched.append(xenos_id)
+            return await original(xenos_id, limit)
+
+        monkeypatch.setattr(towwow, "fetch_upstream_traces_async", spy)
+
+        items = [
+            {"agentXenosId": xenos_ids[0], "intent": {"task": "a"}, "context": "negotiation"},
+            {"agentXenosId": xenos_ids[1], "intent": {"task": "b"}, "context": "negotiation"},
+            {"agentXenosId": xenos_ids[0], "intent": {"task": "c"}, "context": "task_execution"}
+        ]
+        response = client.post("/api/towwow/intent/enrich/batch", json={"items": items})
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["code"] == 0
+        assert data["data"]["count"] == 3
+        assert sorted(fetched) == sorted(xenos_ids)
+
+        for item, result in zip(items, data["data"]["results"]):
+            assert result["enrichmentApplied"] is True
+            assert result["originalIntent"] == item["intent"]
+            xenos = result["enrichedIntent"]["xenos"]
+            assert xenos["xenosId"] == item["agentXenosId"]
+            assert "reputation" in xenos
+
+        recent = data["data"]["results"][0]["enrichedIntent"]["xenos"]["recentActivity"]
+        assert len(recent) == 3
+        assert all(trace["context"] == "negotiation" for trace in recent)
+
+        print(f"✅ 批量意图注入测试通过")
+
     def test_towwow_record_trace(self, client):
         """测试 ToWow 痕迹记录"""
         response = client.post("/api/towwow/trace/record", json={
@@ -389,6 +464,144 @@ class TestAPIIntegration:
 
         print(f"✅ 获取信誉摘要测试通过")
 
+    def test_towwow_reputation_response_cache(self, client, monkeypatch):
+        """测试信誉响应体缓存：命中时直接返回缓存字节，写入 trace 后失效"""
+        from app.routers import towwow
+
+        xenos_id = "did:key:towwow_response_cache"
+        trace = {
+            "agentXenosId": xenos_id,
+            "eventType": "task_completed",
+            "success": True,
+            "context": "task_execution",
+            "action": "complete_task"
+        }
+        client.post("/api/towwow/trace/record", json=trace)
+
+        first = client.get(f"/api/towwow/reputation/{xenos_id}")
+        summary = client.get(f"/api/towwow/reputation/{xenos_id}/summary")
+        assert first.json()["code"] == 0
+        assert first.headers["content-type"] == "application/json"
+        # ETag 取自 Agent 的数据版本号，同一 Agent 的各视图一致
+        assert first.headers["etag"] and summary.headers["etag"] == first.headers["etag"]
+
+        async def not_called(*args, **kwargs):
+            raise AssertionError("reputation recomputed on response cache hit")
+
+        with monkeypatch.context() as patch:
+            patch.setattr(towwow, "calculate_agent_reputation_async", not_called)
+            second = client.get(f"/api/towwow/reputation/{xenos_id}")
+            assert client.get(f"/api/towwow/reputation/{xenos_id}/summary").content == summary.content
+
+        assert second.content == first.content
+        assert second.headers["etag"] == first.headers["etag"]
+
+        # 写入 trace 后响应体缓存随信誉一起失效
+        client.post("/api/towwow/trace/record", json=trace)
+        third = client.get(f"/api/towwow/reputation/{xenos_id}")
+        assert third.json()["data"]["details"]["totalCount"] == first.json()["data"]["details"]["totalCount"] + 1
+        assert third.headers["etag"] != first.headers["etag"]
+
+        print(f"✅ 信誉响应体缓存测试通过")
+
+    def test_conditional_get(self, client, monkeypatch):
+        """测试 ETag 条件请求：版本未变时返回 304 且不重新计算，写入 trace 后 ETag 变化"""
+        from app.routers import towwow, xenos
+
+        xenos_id = "did:key:conditional_get"
+        urls = [
+            f"/api/towwow/reputation/{xenos_id}",
+            f"/api/towwow/reputation/{xenos_id}/summary",
+            f"/api/towwow/trace/{xenos_id}",
+            f"/api/xenos/reputation/{xenos_id}",
+            f"/api/xenos/traces/{xenos_id}"
+        ]
+        client.post("/api/xenos/trace", json={
+            "xenosId": xenos_id,
+            "context": "negotiation",
+            "action": "complete_negotiation",
+            "result": "success"
+        })
+
+        etags = {}
+        for url in urls:
+            response = client.get(url)
+            assert response.status_code == 200 and response.json()["code"] == 0
+            assert response.headers["etag"].startswith('W/"')
+            etags[url] = response.headers["etag"]
+
+        async def not_called(*args, **kwargs):
+            raise AssertionError("recomputed on 304")
+
+        with monkeypatch.context() as patch:
+            for module, name in (
+                (towwow, "calculate_agent_reputation_async"),
+                (towwow, "query_traces_async"),
+                (xenos, "get_agent_reputation_async"),
+                (xenos, "get_agent_traces_async")
+            ):
+                patch.setattr(module, name, not_called)
+
+            for url in urls:
+                response = client.get(url, headers={"If-None-Match": etags[url]})
+                assert response.status_code == 304
+                assert response.content == b""
+                assert response.headers["etag"] == etags[url]
+
+            # 弱比较、多个 ETag 和 *
+            strong = etags[urls[0]].removeprefix("W/")
+            assert client.get(urls[0], headers={"If-None-Match": f'"other", {strong}'}).status_code == 304
+            assert client.get(urls[0], headers={"If-None-Match": "*"}).status_code == 304
+
+        # 写入 trace 后版本号递增，旧 ETag 失效
+        client.post("/api/towwow/trace/record", json={
+            "agentXenosId": xenos_id,
+            "eventType": "task_completed",
+            "success": True,
+            "context": "task_execution",
+            "action": "complete_task"
+        })
+        for url in urls:
+            response = client.get(url, headers={"If-None-Match": etags[url]})
+            assert response.status_code == 200
+            assert response.headers["etag"] != etags[url]
+
+        print(f"✅ 条件请求测试通过")
+
+    def test_towwow_reputation_batch(self, client):
+        """测试批量获取 ToWow 信誉"""
+        xenos_ids = ["did:key:towwow_batch_a", "did:key:towwow_batch_b"]
+
+        for xenos_id in xenos_ids:
+            client.post("/api/towwow/trace/record", json={
+                "agentXenosId": xenos_id,
+                "eventType": "task_completed",
+                "success": True,
+                "context": "task_execution",
+                "action": "complete_task"
+            })
+
+        response = client.post("/api/towwow/reputation/batch", json={
+            "xenosIds": xenos_ids,
+            "context": "task_execution"
+        })
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["code"] == 0
+        assert data["data"]["count"] == 2
+        assert [item["xenosId"] for item in data["data"]["results"]] == xenos_ids
+        for item in data["data"]["results"]:
+            assert item["network"] == "towow"
+            assert item["context"] == "task_execution"
+            assert "score" in item
+
+        # 空列表被拒绝
+        response = client.post("/api/towwow/reputation/batch", json={"xenosIds": []})
+        assert response.status_code == 422
+
+        print(f"✅ 批量获取 ToWow 信誉测试通过")
+
     def test_towwow_mock_sync_traces(self, client):
         """测试模拟同步 traces"""
         response = client.get("/api/towwow/mock/sync-traces")
@@ -417,6 +630,67 @@ class TestAsyncIntegration:
 
         print("✅ 端到端测试框架就绪")
 
+    async def test_enrich_joins_inflight_reputation(self, monkeypatch):
+        """测试批量意图注入的信誉未命中与进行中的单个信誉查询合并，只计算一次"""
+        from app.routers import towwow
+        from app.xenos.reputation import calculate_agent_reputation_async, get_reputation_service
+
+        xenos_id = "did:key:enrich_flight"
+        service = get_reputation_service()
+        release = asyncio.Event()
+        scored = []
+
+        async def slow_calculate(xenos_id, context=None, time_window_days=90):
+            await release.wait()
+            return {"overallScore": 700}
+
+        def score_upstream(xenos_id, upstream, context=None):
+            scored.append(context)
+            return {"overallScore": 1}
+
+        monkeypatch.setattr(service, "calculate_reputation_async", slow_calculate)
+        monkeypatch.setattr(service, "score_upstream", score_upstream)
+
+        single = asyncio.create_task(calculate_agent_reputation_async(xenos_id))
+        await asyncio.sleep(0)
+        enrich = asyncio.create_task(
+            towwow._enrich_agent_intents(xenos_id, [({"task": "a"}, None, None)], asyncio.Semaphore(1))
+        )
+        await asyncio.sleep(0.01)
+        release.set()
+
+        assert await single == {"overallScore": 700}
+        enriched = await enrich
+        assert enriched[0]["enrichedIntent"]["xenos"]["reputation"] == {"overallScore": 700}
+        assert scored == []
+
+        print("✅ 意图注入请求合并测试通过")
+
+    async def test_enrich_skips_write_back_after_trace_write(self, monkeypatch):
+        """测试批量意图注入拉取上游期间有 trace 写入时，按旧数据算出的信誉不写回缓存"""
+        from app.routers import towwow
+        from app.xenos.cache import get_cached, reputation_cache_key
+        from app.xenos.trace import record_trace_async
+
+        xenos_id = "did:key:enrich_race"
+        original = towwow.fetch_upstream_traces_async
+
+        async def fetch_with_write(xenos_id, limit):
+            upstream = await original(xenos_id, limit)
+            await record_trace_async(xenos_id, "towow", "negotiation", "accept_demand", "success")
+            return upstream
+
+        monkeypatch.setattr(towwow, "fetch_upstream_traces_async", fetch_with_write)
+
+        enriched = await towwow._enrich_agent_intents(
+            xenos_id, [({"task": "a"}, "negotiation", None)], asyncio.Semaphore(1)
+        )
+
+        assert enriched[0]["enrichmentApplied"] is True
+        assert get_cached(reputation_cache_key(xenos_id, "negotiation")) is None
+
+        print("✅ 意图注入写入竞争测试通过")
+
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v", "-s"])
@@ -5,8 +5,11 @@ from app.xenos.reputation import (
     get_reputation_service,
     ReputationService,
     calculate_agent_reputation,
+    calculate_agent_reputation_async,
+    calculate_agents_reputation_async,
     DECAY_WEIGHTS,
-    FRAUD_PERMANENT
+    FRAUD_PERMANENT,
+    VECTORIZE_MIN_TRACES
 )
 from app.xenos.trace import record_trace, clear_local_traces
 
@@ -442,5 +445,204 @@ class TestReputationService:
         print(f"   履约率: {reputation['details']['fulfillmentRate']}")
 
 
+class TestReputationKernel:
+    """单遍统计内核测试"""
+
+    def _traces(self):
+        now = datetime.now()
+        return [
+            {"context": "negotiation", "action": "a", "result": "success", "metadata": {},
+             "timestamp": (now - timedelta(days=5)).isoformat()},
+            {"context": "negotiation", "action": "a", "result": "failed", "metadata": {},
+             "timestamp": (now - timedelta(days=40)).isoformat()},
+            {"context": "task_execution", "action": "a", "result": "success", "metadata": {},
+             "timestamp": (now - timedelta(days=100)).isoformat()},
+            {"context": "task_execution", "action": "a", "result": "success", "metadata": {},
+             "timestamp": (now - timedelta(days=200)).isoformat()},
+            # 无法解析 / 带时区（与本地时间相减失败）的时间按最小权重计，不计入衰减摘要
+            {"context": "negotiation", "action": "a", "result": "success", "metadata": {},
+             "timestamp": "garbage"},
+            {"context": "negotiation", "action": "a", "result": "success", "metadata": {},
+             "timestamp": (now - timedelta(days=1)).isoformat() + "Z"},
+        ]
+
+    def test_single_pass_statistics(self):
+        """测试整体、衰减摘要与加权分数"""
+        service = get_reputation_service()
+
+        reputation = service.score_traces("did:key:kernel", self._traces())
+        decay = reputation["details"]["decayApplied"]
+
+        assert decay["totalTraces"] == 6
+        assert decay["byTimePeriod"] == {
+            "recent_30_days": 1,
+            "days_31_to_90": 1,
+            "days_91_to_180": 1,
+            "over_180_days": 1
+        }
+        assert decay["weightedTotal"] == sum([1.0, 0.7, 0.4, 0.2])
+
+        weighted_success = sum([1.0, 0.4, 0.2, 0.2, 0.2])
+        weighted_count = sum([1.0, 0.7, 0.4, 0.2, 0.2, 0.2])
+        expected = weighted_success / (weighted_success + 0.7) * 1000 + min(weighted_count * 2, 100)
+        assert reputation["overallScore"] == expected
+        assert reputation["details"]["fulfillmentRate"] == 5 / 6
+
+        print(f"✅ 单遍统计测试通过: {reputation['overallScore']}")
+
+    def test_context_branch_unweighted(self):
+        """测试指定上下文时按未加权记录计算"""
+        service = get_reputation_service()
+
+        reputation = service.score_traces("did:key:kernel", self._traces(), "negotiation")
+
+        assert reputation["details"]["totalCount"] == 4
+        assert reputation["details"]["fulfillmentRate"] == 0.75
+        assert reputation["score"] == min(0.75 * 1000 * service.context_service.get_context("negotiation")["weight"], 1000)
+        assert reputation["details"]["decayApplied"]["totalTraces"] == 4
+        assert reputation["details"]["decayApplied"]["weightedTotal"] == sum([1.0, 0.7])
+
+        print(f"✅ 上下文未加权测试通过: {reputation['score']}")
+
+
+class TestVectorizedKernel:
+    """NumPy 向量化统计测试"""
+
+    def _stats(self, accumulated):
+        overall, contexts = accumulated
+        return (
+            {name: getattr(overall, name) for name in overall.__slots__},
+            {context: {name: getattr(stats, name) for name in stats.__slots__} for context, stats in contexts.items()}
+        )
+
+    def _traces(self, count, now):
+        traces = []
+        for i in range(count):
+            days = (i * 7) % 260
+            timestamp = (now - timedelta(days=days, seconds=i)).isoformat()
+            if i % 17 == 0:
+                timestamp = "garbage"
+            elif i % 19 == 0:
+                timestamp += "+08:00"
+            elif i % 23 == 0:
+                timestamp = timestamp.replace("T", " ")
+            traces.append({
+                "context": ["negotiation", "task_execution", None][i % 3],
+                "action": "cheat" if i % 97 == 0 else "a",
+                "result": ["success", "success", "failed", "cancelled"][i % 4],
+                "metadata": {"isFraud": 1} if i % 89 == 0 else {},
+                "timestamp": timestamp
+            })
+        return traces
+
+    def test_matches_single_pass(self):
+        """测试向量化统计与逐条统计结果完全一致"""
+        pytest.importorskip("numpy")
+        service = get_reputation_service()
+        now = datetime.now()
+        traces = self._traces(2000, now)
+
+        assert self._stats(service._accumulate_vectorized(traces, now)) == self._stats(service._accumulate(traces, now))
+        assert self._stats(service._accumulate_vectorized([], now)) == self._stats(service._accumulate([], now))
+
+        print(f"✅ 向量化统计一致性测试通过")
+
+    def test_dispatch_by_size(self, monkeypatch):
+        """测试达到阈值时自动使用向量化统计"""
+        pytest.importorskip("numpy")
+        service = ReputationService()
+        calls = []
+        vectorized = service._accumulate_vectorized
+        monkeypatch.setattr(service, "_accumulate_vectorized", lambda traces: calls.append(len(traces)) or vectorized(traces))
+
+        traces = self._traces(VECTORIZE_MIN_TRACES, datetime.now())
+        service.score_traces("did:key:vector", traces[:-1])
+        assert calls == []
+
+        reputation = service.score_traces("did:key:vector", traces)
+        assert calls == [VECTORIZE_MIN_TRACES]
+        assert reputation["details"]["decayApplied"]["totalTraces"] == VECTORIZE_MIN_TRACES
+
+        print(f"✅ 向量化分派测试通过")
+
+
+@pytest.mark.asyncio
+class TestReputationServiceAsync:
+    """信誉服务异步接口测试"""
+
+    def setup_method(self):
+        """每个测试前清除本地数据"""
+        clear_local_traces()
+
+    async def test_async_matches_sync(self):
+        """测试异步计算与同步计算结果一致"""
+        xenos_id = "did:key:test_rep_async"
+
+        for i in range(6):
+            record_trace(xenos_id, "towow", "negotiation", f"action_{i}", "success" if i < 5 else "failed")
+
+        async_rep = await calculate_agent_reputation_async(xenos_id, use_cache=False)
+        sync_rep = calculate_agent_reputation(xenos_id, use_cache=False)
+
+        async_rep.pop("timestamp")
+        sync_rep.pop("timestamp")
+        assert async_rep == sync_rep
+
+        print(f"✅ 异步信誉计算一致性测试通过: {async_rep['overallScore']}")
+
+    async def test_batch_matches_single(self):
+        """测试批量计算与逐个计算结果一致，重复 ID 只计算一次"""
+        xenos_ids = [f"did:key:test_rep_batch_{i}" for i in range(3)]
+
+        for i, xenos_id in enumerate(xenos_ids):
+            for j in range(i + 2):
+                record_trace(xenos_id, "towow", "negotiation", f"action_{j}", "success" if j else "failed")
+
+        batch = await calculate_agents_reputation_async(xenos_ids + xenos_ids[:1], use_cache=False)
+
+        assert list(batch) == xenos_ids
+        for xenos_id in xenos_ids:
+            single = await calculate_agent_reputation_async(xenos_id, use_cache=False)
+            batch[xenos_id].pop("timestamp")
+            single.pop("timestamp")
+            assert batch[xenos_id] == single
+
+        print(f"✅ 批量信誉计算测试通过: {len(batch)} 个 Agent")
+
+    async def test_batch_uses_cache(self, monkeypatch):
+        """测试批量计算优先读取缓存，只计算未命中的 Agent"""
+        from app.xenos.cache import set_cached, delete_cached
+
+        cached_id = "did:key:test_rep_batch_cached"
+        missing_id = "did:key:test_rep_batch_missing"
+        set_cached(f"rep:{cached_id}:all", {"overallScore": 777})
+        delete_cached(f"rep:{missing_id}:all")
+
+        computed = []
+        service = get_reputation_service()
+        original = service.calculate_reputation_async
+
+        async def spy(xenos_id, *args):
+            computed.append(xenos_id)
+            return await original(xenos_id, *args)
+
+        monkeypatch.setattr(service, "calculate_reputation_async", spy)
+
+        try:
+            batch = await calculate_agents_reputation_async([cached_id, missing_id])
+
+            assert batch[cached_id] == {"overallScore": 777}
+            assert computed == [missing_id]
+
+            # 计算结果已写回缓存
+            await calculate_agents_reputation_async([missing_id])
+            assert computed == [missing_id]
+        finally:
+            delete_cached(f"rep:{cached_id}:all")
+            delete_cached(f"rep:{missing_id}:all")
+
+        print(f"✅ 批量信誉缓存测试通过")
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v", "-s"])
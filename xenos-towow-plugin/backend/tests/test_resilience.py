@@ -0,0 +1,201 @@
+"""Xenos 上游熔断与舱壁测试"""
+import asyncio
+import logging
+import time
+import pytest
+import httpx
+from app.xenos.resilience import (
+    CircuitBreaker,
+    Bulkhead,
+    UpstreamGuard,
+    UpstreamUnavailable,
+    get_upstream_guard
+)
+from app.xenos.trace import record_trace, get_agent_traces, clear_local_traces
+
+
+class TestCircuitBreaker:
+    """熔断器测试"""
+
+    def test_opens_after_threshold(self):
+        """测试连续失败达到阈值后熔断"""
+        breaker = CircuitBreaker(failure_threshold=3, recovery_timeout=60)
+
+        for _ in range(2):
+            assert breaker.allow_request() is True
+            breaker.record_failure()
+        assert breaker.state == CircuitBreaker.CLOSED
+
+        breaker.record_failure()
+
+        assert breaker.state == CircuitBreaker.OPEN
+        assert breaker.allow_request() is False
+
+        print(f"✅ 熔断阈值测试通过")
+
+    def test_half_open_probe_success_closes(self):
+        """测试半开探测成功后恢复"""
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0.05)
+        breaker.record_failure()
+        assert breaker.allow_request() is False
+
+        time.sleep(0.06)
+
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        assert breaker.allow_request() is True
+        # 半开状态只放行一个探测请求
+        assert breaker.allow_request() is False
+
+        breaker.record_success()
+
+        assert breaker.state == CircuitBreaker.CLOSED
+        assert breaker.allow_request() is True
+
+        print(f"✅ 半开探测恢复测试通过")
+
+    def test_half_open_probe_failure_reopens(self):
+        """测试半开探测失败后重新熔断"""
+        breaker = CircuitBreaker(failure_threshold=5, recovery_timeout=0.05)
+        for _ in range(5):
+            breaker.record_failure()
+
+        time.sleep(0.06)
+        assert breaker.allow_request() is True
+
+        breaker.record_failure()
+
+        assert breaker.state == CircuitBreaker.OPEN
+
+        print(f"✅ 半开探测失败测试通过")
+
+
+class TestBulkhead:
+    """舱壁测试"""
+
+    def test_rejects_over_capacity(self):
+        """测试在途请求超出上限时拒绝"""
+        bulkhead = Bulkhead(max_concurrent=2)
+
+        assert bulkhead.try_acquire() is True
+        assert bulkhead.try_acquire() is True
+        assert bulkhead.try_acquire() is False
+
+        bulkhead.release()
+
+        assert bulkhead.try_acquire() is True
+        assert bulkhead.stats()["rejected"] == 1
+
+        print(f"✅ 舱壁上限测试通过")
+
+    def test_guard_counts_transport_errors(self):
+        """测试网络层错误计入熔断，业务异常不计入"""
+        guard = UpstreamGuard(CircuitBreaker(failure_threshold=1), Bulkhead(1))
+
+        guard.acquire()
+        guard.release(ValueError("bad json"))
+        assert guard.breaker.state == CircuitBreaker.CLOSED
+
+        guard.acquire()
+        guard.release(httpx.ConnectError("refused"))
+        assert guard.breaker.state == CircuitBreaker.OPEN
+        assert guard.bulkhead.stats()["inFlight"] == 0
+
+        with pytest.raises(UpstreamUnavailable):
+            guard.acquire()
+        assert guard.bulkhead.stats()["inFlight"] == 0
+
+        print(f"✅ 熔断计数规则测试通过")
+
+    def test_guard_counts_server_errors_and_timeouts(self):
+        """测试 5xx 响应和超时计入熔断，4xx 计入成功"""
+        for error, status_code in (
+            (None, 503),
+            (ValueError("bad json"), 500),
+            (httpx.ReadTimeout("timeout"), None),
+            (TimeoutError(), None)
+        ):
+            guard = UpstreamGuard(CircuitBreaker(failure_threshold=1), Bulkhead(1))
+            guard.acquire()
+            guard.release(error, status_code)
+            assert guard.breaker.state == CircuitBreaker.OPEN
+
+        guard = UpstreamGuard(CircuitBreaker(failure_threshold=1), Bulkhead(1))
+        guard.acquire()
+        guard.release(status_code=404)
+        assert guard.breaker.state == CircuitBreaker.CLOSED
+
+        print(f"✅ 5xx/超时计入熔断测试通过")
+
+    def test_guard_ignores_cancellation(self):
+        """测试取消不计入成功或失败，并归还半开探测名额"""
+        guard = UpstreamGuard(CircuitBreaker(failure_threshold=2, recovery_timeout=0.05), Bulkhead(1))
+
+        guard.acquire()
+        guard.release(httpx.ConnectError("refused"))
+        guard.acquire()
+        guard.release(asyncio.CancelledError())
+        assert guard.breaker.stats()["failures"] == 1
+        assert guard.bulkhead.stats()["inFlight"] == 0
+
+        guard.breaker.record_failure()
+        time.sleep(0.06)
+
+        # 半开探测被取消后，下一次调用仍可探测
+        guard.acquire()
+        guard.release(asyncio.CancelledError())
+        assert guard.breaker.state == CircuitBreaker.HALF_OPEN
+        guard.acquire()
+        guard.release()
+        assert guard.breaker.state == CircuitBreaker.CLOSED
+
+        print(f"✅ 取消不计入熔断测试通过")
+
+
+class TestUpstreamFallback:
+    """上游不可用时的本地兜底"""
+
+    def setup_method(self):
+        clear_local_traces()
+        get_upstream_guard().reset()
+
+    def teardown_method(self):
+        get_upstream_guard().reset()
+
+    def test_open_circuit_skips_upstream(self):
+        """测试熔断后直接走本地存储"""
+        xenos_id = "did:key:test_breaker"
+        breaker = get_upstream_guard().breaker
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+
+        result = record_trace(xenos_id, "towow", "negotiation", "accept_demand", "success")
+        traces = get_agent_traces(xenos_id)
+
+        assert result["success"] is True
+        assert "notice" in result
+        assert traces["source"] == "local"
+        assert len(traces["traces"]) == 1
+        assert breaker.stats()["rejected"] >= 2
+
+        print(f"✅ 熔断本地兜底测试通过")
+
+    def test_rejections_not_logged_as_warnings(self, caplog):
+        """测试熔断打开只记录一次状态切换，之后的拒绝不逐次告警"""
+        xenos_id = "did:key:test_breaker_log"
+        breaker = get_upstream_guard().breaker
+
+        with caplog.at_level(logging.DEBUG):
+            for _ in range(breaker.failure_threshold):
+                breaker.record_failure()
+            for _ in range(5):
+                record_trace(xenos_id, "towow", "negotiation", "accept_demand", "success")
+
+        warnings = [r.getMessage() for r in caplog.records if r.levelno >= logging.WARNING]
+        assert warnings == [f"[Breaker] Circuit opened after {breaker.failure_threshold} failures"]
+        assert breaker.stats()["rejected"] == 5
+
+        print(f"✅ 熔断拒绝日志测试通过")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
@@ -0,0 +1,445 @@
+"""Xenos 本地 Trace 存储测试"""
+import sqlite3
+import time
+from datetime import datetime
+import pytest
+from app.xenos import store as store_module
+from app.xenos.store import (
+    MemoryTraceStore,
+    SQLiteTraceStore,
+    TraceRecord,
+    TraceRingBuffer,
+    configure_trace_store,
+    get_trace_store
+)
+
+
+def _payload(xenos_id, context="negotiation", action="accept_demand", result="success", network="towow"):
+    return {
+        "xenosId": xenos_id,
+        "network": network,
+        "context": context,
+        "action": action,
+        "result": result,
+        "metadata": {}
+    }
+
+
+class TestMemoryTraceStore:
+    """本地存储测试"""
+
+    def test_query_uses_all_filters(self):
+        """测试多条件组合查询"""
+        store = MemoryTraceStore()
+        store.append("t1", _payload("did:key:a", context="negotiation", result="success"))
+        store.append("t2", _payload("did:key:a", context="negotiation", result="failed"))
+        store.append("t3", _payload("did:key:b", context="negotiation", result="success"))
+        store.append("t4", _payload("did:key:a", context="task_execution", result="success"))
+
+        traces = store.query(xenos_id="did:key:a", context="negotiation", result="success")
+        assert [t["id"] for t in traces] == ["t1"]
+
+        traces = store.query(context="negotiation")
+        assert [t["id"] for t in traces] == ["t3", "t2", "t1"]
+
+        assert store.query(action="unknown_action") == []
+
+        print(f"✅ 组合查询测试通过")
+
+    def test_query_stops_at_limit(self):
+        """测试查询按时间倒序并在 limit 处停止"""
+        store = MemoryTraceStore()
+        for i in range(10):
+            store.append(f"t{i}", _payload(f"did:key:{i % 3}"))
+
+        traces = store.query(network="towow", limit=3)
+
+        assert [t["id"] for t in traces] == ["t9", "t8", "t7"]
+
+        print(f"✅ limit 截断测试通过")
+
+    def test_query_time_range(self):
+        """测试时间范围查询"""
+        store = MemoryTraceStore()
+        store.append("old", _payload("did:key:a"))
+        time.sleep(0.01)
+        middle = time.time()
+        store.append("new", _payload("did:key:a"))
+
+        assert [t["id"] for t in store.query(start_ts=middle)] == ["new"]
+        assert [t["id"] for t in store.query(end_ts=middle)] == ["old"]
+
+        print(f"✅ 时间范围查询测试通过")
+
+    def test_agent_traces_newest_first(self):
+        """测试 Agent 最近 N 条按时间倒序返回"""
+        store = MemoryTraceStore()
+        for i in range(5):
+            store.append(f"t{i}", _payload("did:key:a"))
+        store.append("other", _payload("did:key:b"))
+
+        traces, total = store.agent_traces("did:key:a", 3)
+
+        assert [t["id"] for t in traces] == ["t4", "t3", "t2"]
+        assert total == 5
+        assert store.agent_traces("did:key:a", 0) == ([], 5)
+        assert store.agent_traces("did:key:unknown", 10) == ([], 0)
+
+        print(f"✅ 最近 N 条测试通过")
+
+    def test_agent_time_range(self):
+        """测试指定 Agent 的时间范围查询（二分定位）"""
+        store = MemoryTraceStore()
+        store.append("old", _payload("did:key:a"))
+        time.sleep(0.01)
+        middle = time.time()
+        store.append("new", _payload("did:key:a", result="failed"))
+        store.append("newer", _payload("did:key:a"))
+
+        assert [t["id"] for t in store.query(xenos_id="did:key:a", start_ts=middle)] == ["newer", "new"]
+        assert [t["id"] for t in store.query(xenos_id="did:key:a", end_ts=middle)] == ["old"]
+        assert [t["id"] for t in store.query(xenos_id="did:key:a", start_ts=middle, result="success")] == ["newer"]
+
+        print(f"✅ Agent 时间范围查询测试通过")
+
+    def test_eviction_updates_indexes(self):
+        """测试超出容量淘汰时同步更新索引"""
+        store = MemoryTraceStore(max_per_agent=2)
+        store.append("t1", _payload("did:key:a", action="first"))
+        store.append("t2", _payload("did:key:a", action="second"))
+        store.append("t3", _payload("did:key:a", action="third"))
+
+        assert store.count("did:key:a") == 2
+        assert store.query(action="first") == []
+        assert [t["id"] for t in store.query(xenos_id="did:key:a")] == ["t3", "t2"]
+
+        print(f"✅ 淘汰更新索引测试通过")
+
+    def test_clock_rollback_keeps_global_order(self, monkeypatch):
+        """测试时钟回拨后全局时间范围查询不丢记录"""
+        clock = iter([1000.0, 2000.0, 1500.0])
+
+        class FakeDatetime(datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return datetime.fromtimestamp(next(clock))
+
+        monkeypatch.setattr(store_module, "datetime", FakeDatetime)
+        store = MemoryTraceStore()
+        for trace_id in ("t1", "t2", "t3"):
+            store.append(trace_id, _payload("did:key:a"))
+
+        assert [t["id"] for t in store.query(start_ts=1800.0)] == ["t3", "t2"]
+        assert [t["id"] for t in store.query(start_ts=1800.0, result="success")] == ["t3", "t2"]
+
+        print(f"✅ 时钟回拨全局查询测试通过")
+
+    def test_unsynced_backlog(self):
+        """测试未同步记录按写入顺序读取并标记"""
+        store = MemoryTraceStore(max_per_agent=3)
+        for i in range(4):
+            store.append(f"t{i}", _payload("did:key:a"))
+
+        # t0 被淘汰，积压随之减少
+        batch = store.unsynced(2)
+        assert [record["id"] for _, record in batch] == ["t1", "t2"]
+        assert store.sync_backlog()[0] == 3
+
+        assert store.mark_synced([seq for seq, _ in batch]) == 2
+        assert store.mark_synced([seq for seq, _ in batch]) == 0
+        assert [record["id"] for _, record in store.unsynced(10)] == ["t3"]
+        assert [t["synced"] for t in store.agent_traces("did:key:a", 3)[0]] == [False, True, True]
+
+        store.clear()
+        assert store.sync_backlog() == (0, None)
+
+        print(f"✅ 未同步积压测试通过")
+
+    def test_clear_agent(self):
+        """测试按 Agent 清除"""
+        store = MemoryTraceStore()
+        store.append("t1", _payload("did:key:a"))
+        store.append("t2", _payload("did:key:b"))
+
+        assert store.clear("did:key:a") == 1
+        assert [t["id"] for t in store.query(context="negotiation")] == ["t2"]
+        assert store.clear() == 1
+        assert store.count() == 0
+
+        print(f"✅ 清除测试通过")
+
+
+
+class TestSQLiteTraceStore:
+    """SQLite 持久化存储测试"""
+
+    def test_survives_restart(self, tmp_path):
+        """测试重新打开文件后记录仍在"""
+        path = str(tmp_path / "traces.db")
+        store = SQLiteTraceStore(path)
+        saved = store.append("t1", _payload("did:key:a"))
+        store.close()
+
+        reopened = SQLiteTraceStore(path)
+        traces, total = reopened.agent_traces("did:key:a", 10)
+        reopened.close()
+
+        assert total == 1
+        assert traces == [saved]
+
+        print(f"✅ 重启保留测试通过")
+
+    def test_query_and_limit(self, tmp_path):
+        """测试条件查询、批量写入与按时间倒序"""
+        store = SQLiteTraceStore(str(tmp_path / "traces.db"))
+        store.append_many([
+            ("t1", _payload("did:key:a", context="negotiation", result="success")),
+            ("t2", _payload("did:key:a", context="negotiation", result="failed")),
+        ])
+        store.append("t3", _payload("did:key:b", context="negotiation", result="success"))
+        store.append("t4", _payload("did:key:a", context="task_execution", result="success"))
+
+        assert [t["id"] for t in store.query(xenos_id="did:key:a", context="negotiation", result="success")] == ["t1"]
+        assert [t["id"] for t in store.query(context="negotiation", limit=2)] == ["t3", "t2"]
+        assert store.query(action="unknown_action") == []
+        assert store.count() == 4
+
+        assert store.clear("did:key:a") == 3
+        assert store.count() == 1
+        store.close()
+
+        print(f"✅ SQLite 查询测试通过")
+
+    def test_trims_per_agent(self, tmp_path):
+        """测试每个 Agent 只保留最近 max_per_agent 条"""
+        store = SQLiteTraceStore(str(tmp_path / "traces.db"), max_per_agent=2)
+        for i in range(4):
+            store.append(f"t{i}", _payload("did:key:a"))
+
+        traces, total = store.agent_traces("did:key:a", 10)
+        store.close()
+
+        assert total == 2
+        assert [t["id"] for t in traces] == ["t3", "t2"]
+
+        print(f"✅ SQLite 容量裁剪测试通过")
+
+    def test_trims_at_threshold(self, tmp_path):
+        """测试超过裁剪余量后才一次裁剪回 max_per_agent，保留最新记录"""
+        store = SQLiteTraceStore(str(tmp_path / "traces.db"), max_per_agent=20)
+        assert store.trim_slack == 2
+
+        store.append_many([(f"t{i}", _payload("did:key:a")) for i in range(22)])
+        assert store.count("did:key:a") == 22
+
+        store.append("t22", _payload("did:key:a"))
+        traces, total = store.agent_traces("did:key:a", 1)
+        store.close()
+
+        assert total == 20
+        assert traces[0]["id"] == "t22"
+
+        print(f"✅ SQLite 阈值裁剪测试通过")
+
+    def test_append_commits_immediately(self, tmp_path):
+        """测试单条写入返回前已提交，其他连接（worker）立即可见"""
+        path = str(tmp_path / "traces.db")
+        store = SQLiteTraceStore(path)
+        reader = sqlite3.connect(path)
+
+        store.append("t0", _payload("did:key:a"))
+        assert reader.execute("SELECT COUNT(*) FROM traces").fetchone()[0] == 1
+        assert not store._conn.in_transaction
+
+        reader.close()
+        store.close()
+
+        print(f"✅ SQLite 单条写入提交测试通过")
+
+    def test_queries_use_indexes(self, tmp_path):
+        """测试常用查询走索引"""
+        store = SQLiteTraceStore(str(tmp_path / "traces.db"))
+
+        def plan(sql, params):
+            rows = store._conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+            return " ".join(row[-1] for row in rows)
+
+        assert "idx_traces_agent_ts" in plan(
+            "SELECT * FROM traces WHERE xenos_id = ? ORDER BY ts DESC, seq DESC LIMIT 10", ("a",)
+        )
+        assert "idx_traces_context_ts" in plan(
+            "SELECT * FROM traces WHERE context = ? ORDER BY ts DESC, seq DESC LIMIT 10", ("c",)
+        )
+        assert "idx_traces_action" in plan("SELECT * FROM traces WHERE action = ?", ("x",))
+        assert store._conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        store.close()
+
+        print(f"✅ SQLite 索引测试通过")
+
+    def test_unsynced_backlog(self, tmp_path):
+        """测试未同步记录按写入顺序读取并标记"""
+        store = SQLiteTraceStore(str(tmp_path / "traces.db"))
+        store.append_many([(f"t{i}", _payload("did:key:a")) for i in range(3)])
+
+        batch = store.unsynced(2)
+        assert [record["id"] for _, record in batch] == ["t0", "t1"]
+
+        assert store.mark_synced([seq for seq, _ in batch]) == 2
+        pending, oldest = store.sync_backlog()
+        assert pending == 1
+        assert oldest is not None
+        assert [record["id"] for _, record in store.unsynced(10)] == ["t2"]
+        store.close()
+
+        print(f"✅ SQLite 未同步积压测试通过")
+
+    def test_claim_unsynced(self, tmp_path):
+        """测试认领不重叠，认领者可重新认领，租期过后其他 worker 可接手"""
+        path = str(tmp_path / "traces.db")
+        store = SQLiteTraceStore(path)
+        other = SQLiteTraceStore(path)
+        store.append_many([(f"t{i}", _payload("did:key:a")) for i in range(4)])
+
+        first = store.claim_unsynced(2, "worker-a", lease=60)
+        assert [record["id"] for _, record in first] == ["t0", "t1"]
+        assert [record["id"] for _, record in other.claim_unsynced(10, "worker-b", lease=60)] == ["t2", "t3"]
+        assert other.claim_unsynced(10, "worker-c", lease=60) == []
+
+        # 认领者推送失败后重试
+        assert store.claim_unsynced(2, "worker-a", lease=60) == first
+
+        # worker-a 卡住超过租期，其他 worker 接手；已同步的记录不再被认领
+        other.mark_synced([seq for seq, _ in other.claim_unsynced(10, "worker-b", lease=60)])
+        time.sleep(0.01)
+        assert [record["id"] for _, record in other.claim_unsynced(10, "worker-c", lease=0.001)] == ["t0", "t1"]
+
+        store.close()
+        other.close()
+
+        print(f"✅ SQLite 认领测试通过")
+
+    def test_migrates_old_schema(self, tmp_path):
+        """测试旧版本建的表在打开时补充认领列"""
+        path = str(tmp_path / "traces.db")
+        conn = sqlite3.connect(path)
+        conn.execute(
+            "CREATE TABLE traces (seq INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT NOT NULL, xenos_id TEXT NOT NULL, "
+            "network TEXT, context TEXT, action TEXT, result TEXT, metadata TEXT NOT NULL, ts REAL NOT NULL, "
+            "synced INTEGER NOT NULL DEFAULT 0)"
+        )
+        conn.execute(
+            "INSERT INTO traces (id, xenos_id, network, context, action, result, metadata, ts) "
+            "VALUES ('t0', 'did:key:a', 'towow', 'negotiation', 'accept_demand', 'success', '{}', 1.0)"
+        )
+        conn.commit()
+        conn.close()
+
+        store = SQLiteTraceStore(path)
+        assert [record["id"] for _, record in store.claim_unsynced(10, "worker-a", lease=60)] == ["t0"]
+        store.close()
+
+        print(f"✅ SQLite 旧表迁移测试通过")
+
+    def test_configure_backend(self, tmp_path):
+        """测试按配置切换存储后端"""
+        store = configure_trace_store("sqlite", path=str(tmp_path / "data" / "traces.db"))
+        assert isinstance(store, SQLiteTraceStore)
+        assert get_trace_store() is store
+
+        store = configure_trace_store()
+        assert isinstance(store, MemoryTraceStore)
+        assert get_trace_store() is store
+
+        print(f"✅ 存储后端切换测试通过")
+
+
+class TestTraceRecord:
+    """紧凑记录测试"""
+
+    def test_round_trip_shape(self):
+        """测试物化后的字典结构与原记录一致"""
+        stamp = datetime.now().isoformat()
+        payload = _payload("did:key:a")
+        payload["metadata"] = {"demandId": "d1", "amount": 3, "timestamp": stamp}
+
+        record = TraceRecord("t1", "did:key:a", payload, 1700000000.123456)
+        data = record.to_dict()
+
+        assert not hasattr(record, "__dict__")
+        assert "timestamp" not in record.metadata
+        assert record.meta_ts is not None
+        assert data == {
+            "id": "t1",
+            "xenosId": "did:key:a",
+            "network": "towow",
+            "context": "negotiation",
+            "action": "accept_demand",
+            "result": "success",
+            "metadata": {"demandId": "d1", "amount": 3, "timestamp": stamp},
+            "timestamp": datetime.fromtimestamp(1700000000.123456).isoformat(),
+            "synced": False
+        }
+        assert list(data["metadata"]) == ["demandId", "amount", "timestamp"]
+
+        print(f"✅ 紧凑记录往返测试通过")
+
+    def test_shared_codes(self):
+        """测试相同取值共用编码，非标准 metadata 原样保留"""
+        payload = _payload("did:key:a")
+        payload["metadata"] = {"timestamp": "yesterday", "note": "x"}
+
+        first = TraceRecord("t1", "did:key:a", payload, 0.0)
+        second = TraceRecord("t2", "did:key:b", _payload("did:key:b"), 0.0)
+
+        assert first.codes == second.codes
+        assert first.meta_ts is None
+        assert first.to_dict()["metadata"] == {"timestamp": "yesterday", "note": "x"}
+
+        print(f"✅ 编码共享测试通过")
+
+
+class TestTraceRingBuffer:
+    """环形缓冲区测试"""
+
+    def test_overwrites_oldest_when_full(self):
+        """测试写满后覆盖最旧记录并返回被淘汰的 seq"""
+        ring = TraceRingBuffer(capacity=3)
+
+        assert [ring.append(float(i), i) for i in range(3)] == [None, None, None]
+        assert ring.append(3.0, 3) == 0
+        assert ring.append(4.0, 4) == 1
+
+        assert len(ring) == 3
+        assert list(ring) == [2, 3, 4]
+        assert ring.newest(2) == [4, 3]
+        assert ring.newest(10) == [4, 3, 2]
+
+        print(f"✅ 环形覆盖测试通过")
+
+    def test_range_after_wraparound(self):
+        """测试绕回后二分查找时间范围"""
+        ring = TraceRingBuffer(capacity=4)
+        for i in range(10):
+            ring.append(float(i), i)
+
+        lo, hi = ring.range(7.0, 8.5)
+        assert [ring.seq_at(i) for i in range(lo, hi)] == [7, 8]
+        assert ring.range(None, None) == (0, 4)
+        assert ring.range(100.0, None) == (4, 4)
+
+        print(f"✅ 绕回范围查询测试通过")
+
+    def test_clock_rollback_keeps_order(self):
+        """测试时钟回拨时仍保持有序"""
+        ring = TraceRingBuffer(capacity=4)
+        ring.append(10.0, 1)
+        ring.append(5.0, 2)
+
+        assert ring.newest(2) == [2, 1]
+        assert ring.ts_at(1) == 10.0
+
+        print(f"✅ 时钟回拨测试通过")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
@@ -0,0 +1,143 @@
+"""Xenos 本地 Trace 同步任务测试"""
+import asyncio
+import pytest
+from app.xenos.store import SQLiteTraceStore, configure_trace_store, get_trace_store
+from app.xenos.sync import (
+    TraceSyncWorker,
+    get_sync_status,
+    start_sync_worker,
+    stop_sync_worker
+)
+
+
+def _payload(xenos_id, action="accept_demand"):
+    return {
+        "xenosId": xenos_id,
+        "network": "towow",
+        "context": "negotiation",
+        "action": action,
+        "result": "success",
+        "metadata": {}
+    }
+
+
+class PushRecorder:
+    """记录每次补推的内容，可模拟失败"""
+
+    def __init__(self, fail_times=0):
+        self.batches = []
+        self.fail_times = fail_times
+
+    async def __call__(self, records):
+        if self.fail_times > 0:
+            self.fail_times -= 1
+            return False
+        self.batches.append([record["id"] for record in records])
+        return True
+
+
+@pytest.mark.asyncio
+class TestTraceSyncWorker:
+    """同步任务测试"""
+
+    def setup_method(self):
+        """每个测试使用新的本地存储"""
+        configure_trace_store()
+
+    async def test_sync_in_order(self):
+        """测试按写入顺序分批补推并标记已同步"""
+        store = get_trace_store()
+        for i in range(5):
+            store.append(f"t{i}", _payload("did:key:a"))
+
+        recorder = PushRecorder()
+        worker = TraceSyncWorker(recorder, batch_size=2)
+
+        assert await worker.sync_once() == 2
+        assert await worker.sync_once() == 2
+        assert await worker.sync_once() == 1
+        assert await worker.sync_once() == 0
+
+        assert recorder.batches == [["t0", "t1"], ["t2", "t3"], ["t4"]]
+        assert store.sync_backlog() == (0, None)
+        assert worker.stats()["synced"] == 5
+
+        print(f"✅ 顺序补推测试通过")
+
+    async def test_failure_keeps_backlog(self):
+        """测试推送失败时记录保持未同步"""
+        store = get_trace_store()
+        store.append("t0", _payload("did:key:a"))
+
+        worker = TraceSyncWorker(PushRecorder(fail_times=1))
+
+        assert await worker.sync_once() is None
+        assert store.sync_backlog()[0] == 1
+
+        stats = worker.stats()
+        assert stats["pending"] == 1
+        assert stats["oldestAgeSeconds"] >= 0
+
+        print(f"✅ 失败保留积压测试通过")
+
+    async def test_backoff_grows_with_jitter(self):
+        """测试退避时间指数增长、带抖动且有上限"""
+        worker = TraceSyncWorker(PushRecorder(), interval=1.0, max_backoff=8.0)
+
+        for failures, ceiling in [(1, 1.0), (2, 2.0), (3, 4.0), (4, 8.0), (10, 8.0)]:
+            delay = worker.backoff_delay(failures)
+            assert ceiling / 2 <= delay <= ceiling
+
+        print(f"✅ 指数退避测试通过")
+
+    async def test_background_retry(self):
+        """测试后台任务失败后退避重试直到成功"""
+        store = get_trace_store()
+        store.append("t0", _payload("did:key:a"))
+
+        recorder = PushRecorder(fail_times=2)
+        worker = await start_sync_worker(recorder, interval=0.01, max_backoff=0.02)
+
+        for _ in range(100):
+            if recorder.batches:
+                break
+            await asyncio.sleep(0.01)
+
+        assert recorder.batches == [["t0"]]
+        assert worker.stats()["failures"] == 2
+        assert get_sync_status()["running"] is True
+
+        await stop_sync_worker()
+
+        assert get_sync_status() == {"pending": 0, "oldestAgeSeconds": None, "running": False}
+
+        print(f"✅ 后台退避重试测试通过")
+
+    async def test_two_workers_push_each_trace_once(self, tmp_path):
+        """测试两个 worker 进程共享 SQLite 存储并发补推时，每条记录只推送一次"""
+        path = str(tmp_path / "traces.db")
+        stores = [SQLiteTraceStore(path), SQLiteTraceStore(path)]
+        stores[0].append_many([(f"t{i}", _payload("did:key:a")) for i in range(10)])
+
+        pushed = []
+
+        async def push(records):
+            # 推送期间让出事件循环，另一个 worker 同时认领
+            await asyncio.sleep(0.01)
+            pushed.extend(record["id"] for record in records)
+            return True
+
+        workers = [TraceSyncWorker(push, batch_size=3, store=store) for store in stores]
+        while stores[0].sync_backlog()[0]:
+            await asyncio.gather(*(worker.sync_once() for worker in workers))
+
+        assert sorted(pushed, key=lambda trace_id: int(trace_id[1:])) == [f"t{i}" for i in range(10)]
+        assert all(worker.stats()["synced"] > 0 for worker in workers)
+        for store in stores:
+            store.close()
+
+        print(f"✅ 多 worker 不重复补推测试通过")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v", "-s"])
@@ -1,12 +1,24 @@
 """Xenos 行为记录测试"""
+import asyncio
+
+import httpx
 import pytest
+from app.xenos import client as http_client
+from app.xenos.resilience import get_upstream_guard
 from app.xenos.trace import (
     record_trace,
+    record_trace_async,
     get_agent_traces,
+    get_agent_traces_async,
     query_traces,
+    query_traces_async,
     get_trace_statistics,
-    clear_local_traces
+    clear_local_traces,
+    flush_trace_batch,
+    _build_trace
 )
+from app.xenos.cache import agent_tag, get_agent_version_async, get_cached, set_cached
+from app.xenos.store import get_trace_store
 
 
 class TestTraceService:
@@ -168,5 +180,151 @@ class TestTraceService:
         print(f"✅ 清除记录测试通过")
 
 
+@pytest.mark.asyncio
+class TestTraceServiceAsync:
+    """行为记录服务异步接口测试"""
+
+    def setup_method(self):
+        """每个测试前清除本地数据"""
+        clear_local_traces()
+
+    async def test_record_and_get_async(self):
+        """测试异步记录和获取行为"""
+        xenos_id = "did:key:test_async"
+
+        result = await record_trace_async(xenos_id, "towow", "negotiation", "accept_demand", "success")
+        assert result["success"] is True
+        assert "traceId" in result
+
+        traces = await get_agent_traces_async(xenos_id, limit=5)
+        assert len(traces["traces"]) == 1
+        assert traces["traces"][0]["action"] == "accept_demand"
+
+        print(f"✅ 异步记录/获取测试通过")
+
+    async def test_query_async_matches_sync(self):
+        """测试异步查询与同步查询结果一致"""
+        xenos_id = "did:key:test_async"
+
+        await record_trace_async(xenos_id, "towow", "negotiation", "action1", "success")
+        await record_trace_async(xenos_id, "towow", "task_execution", "action2", "failed")
+
+        async_result = await query_traces_async(xenos_id=xenos_id, context="negotiation")
+        sync_result = query_traces(xenos_id=xenos_id, context="negotiation")
+
+        assert async_result["traces"] == sync_result["traces"]
+        assert async_result["total"] == 1
+
+        print(f"✅ 异步查询一致性测试通过")
+
+    async def test_upstream_sync_async_consistent(self, monkeypatch):
+        """测试上游可用时同步/异步接口按同一请求和解析得到相同结果"""
+        xenos_id = "did:key:test_upstream"
+        upstream = [{"traceId": "up_1", "xenosId": xenos_id, "context": "negotiation", "result": "success"}]
+
+        def handler(request):
+            if request.url.path.endswith("/trace/record"):
+                return httpx.Response(200, json={"data": {"traceId": "up_record"}})
+            return httpx.Response(200, json={"data": {"traces": upstream, "total": 1}})
+
+        transport = httpx.MockTransport(handler)
+        monkeypatch.setattr(http_client, "_client_kwargs", {"transport": transport})
+        get_upstream_guard().reset()
+
+        sync_record = record_trace(xenos_id, "towow", "negotiation", "accept_demand", "success")
+        async_record = await record_trace_async(xenos_id, "towow", "negotiation", "accept_demand", "success")
+        assert sync_record == async_record == {"success": True, "traceId": "up_record", "recorded": True}
+
+        sync_query = query_traces(xenos_id=xenos_id, context="negotiation")
+        async_query = await query_traces_async(xenos_id=xenos_id, context="negotiation")
+        assert sync_query["traces"] == async_query["traces"]
+        assert sync_query["traces"][0]["traceId"] == "up_1"
+
+        print(f"✅ 上游同步/异步一致性测试通过")
+
+
+class TestReputationInvalidation:
+    """trace 写入后信誉缓存失效测试"""
+
+    def setup_method(self):
+        """每个测试前清除本地数据"""
+        clear_local_traces()
+
+    def _seed(self, xenos_id):
+        for context in ("all", "negotiation", "task_execution"):
+            set_cached(f"rep:{xenos_id}:{context}", {"overallScore": 1}, tags=[agent_tag(xenos_id)])
+
+    def test_record_invalidates_agent_keys(self):
+        """测试写入失效该 Agent 所有上下文的信誉，不影响其他 Agent"""
+        xenos_id = "did:key:test_invalidate"
+        self._seed(xenos_id)
+        self._seed("did:key:test_other")
+
+        record_trace(xenos_id, "towow", "negotiation", "accept_demand", "success")
+
+        # 其他上下文的结果中也带有综合信誉和欺诈状态，一并失效
+        for context in ("all", "negotiation", "task_execution"):
+            assert get_cached(f"rep:{xenos_id}:{context}") is None
+        assert get_cached("rep:did:key:test_other:all") is not None
+
+        print(f"✅ 写入失效信誉缓存测试通过")
+
+    def test_invalidate_after_write(self, monkeypatch):
+        """测试写入期间按旧数据写回的缓存在写入完成后被失效"""
+        xenos_id = "did:key:test_invalidate_order"
+        store = get_trace_store()
+        append = store.append
+
+        def append_with_read(trace_id, payload):
+            # 模拟写入期间的并发读取把旧信誉写回缓存
+            self._seed(xenos_id)
+            append(trace_id, payload)
+
+        monkeypatch.setattr(store, "append", append_with_read)
+        record_trace(xenos_id, "towow", "negotiation", "accept_demand", "success")
+
+        assert get_cached(f"rep:{xenos_id}:all") is None
+        assert get_cached(f"rep:{xenos_id}:negotiation") is None
+
+        print(f"✅ 写入完成后失效测试通过")
+
+    def test_version_bumped_after_write(self, monkeypatch):
+        """测试写入完成后才递增版本号：写入期间发出的 ETag 在写入后不再匹配"""
+        xenos_id = "did:key:test_version_order"
+        store = get_trace_store()
+        append = store.append
+        seen = []
+
+        def append_with_read(trace_id, payload):
+            # 模拟写入期间的并发读取按旧数据生成 ETag
+            seen.append(asyncio.run(get_agent_version_async(xenos_id)))
+            append(trace_id, payload)
+
+        monkeypatch.setattr(store, "append", append_with_read)
+        record_trace(xenos_id, "towow", "negotiation", "accept_demand", "success")
+
+        assert asyncio.run(get_agent_version_async(xenos_id)) > seen[0]
+
+        print(f"✅ 写入完成后递增版本号测试通过")
+
+    @pytest.mark.asyncio
+    async def test_async_record_and_flush_invalidate(self):
+        """测试异步写入与批量提交后均失效信誉缓存"""
+        xenos_id = "did:key:test_invalidate_async"
+        self._seed(xenos_id)
+
+        await record_trace_async(xenos_id, "towow", "task_execution", "complete_task", "success")
+        for context in ("all", "negotiation", "task_execution"):
+            assert get_cached(f"rep:{xenos_id}:{context}") is None
+
+        # 入队到提交之间重新写入的旧缓存在批量提交后失效
+        self._seed(xenos_id)
+        await flush_trace_batch([_build_trace(xenos_id, "towow", "negotiation", "accept_demand", "success")])
+        for context in ("all", "negotiation", "task_execution"):
+            assert get_cached(f"rep:{xenos_id}:{context}") is None
+
+        print(f"✅ 异步写入/批量提交失效信誉缓存测试通过")
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v", "-s"])